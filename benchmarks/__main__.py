@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from .toolchain import FakeToolchain
+from .suite     import BENCHMARKS
+from .          import history
+
+import argparse
+import sys
+import tempfile
+
+from pathlib import Path
+
+
+def run():
+    """
+    Run the installer's benchmark suite against a fake toolchain, and compare
+    the results with the most recent run from a different commit.
+    """
+    parser = argparse.ArgumentParser(
+        prog="benchmarks",
+        description="Hermetic benchmarks of the installer's hot paths."
+    )
+    parser.add_argument(
+        "--quick", action="store_true",
+        help="Fewer repetitions (noisier results)"
+    )
+    parser.add_argument(
+        "--filter", type=str, action="append",
+        help=f"Only run these benchmarks (from: {', '.join(BENCHMARKS)})"
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=0.25,
+        help="Relative slowdown that counts as a regression (default=0.25)"
+    )
+    parser.add_argument(
+        "--history", type=Path, default=history.HISTORY,
+        help=f"Results history file (default={history.HISTORY})"
+    )
+    parser.add_argument(
+        "--no-save", action="store_true",
+        help="Do not append the results to the history"
+    )
+
+    args = parser.parse_args()
+
+    results = dict()
+    with tempfile.TemporaryDirectory(prefix="mpi4py-installer-bench-") as root:
+        toolchain = FakeToolchain(Path(root))
+        for name, bench in BENCHMARKS.items():
+            if args.filter and name not in args.filter:
+                continue
+            print(f"Running {name} ...", file=sys.stderr)
+            results.update(bench(toolchain, args.quick))
+
+    past = history.load(args.history)
+    commit = history.git_commit()
+    table, regressions = history.compare(
+        results, history.baseline(past, commit), args.threshold
+    )
+    print(table)
+
+    if not args.no_save:
+        history.save(results, args.history)
+
+    if regressions:
+        print(f"{len(regressions)} regressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    run()
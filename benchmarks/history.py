@@ -0,0 +1,112 @@
+import json
+import platform
+import subprocess
+import sys
+import time
+
+from pathlib import Path
+
+
+# Results of previous runs are appended to this file (one json per line)
+HISTORY = Path(__file__).parent.parent / ".benchmarks" / "history.jsonl"
+
+
+def git_commit() -> str:
+    """
+    git_commit() -> str
+
+
+    Short hash of the checked out commit (suffixed by "+" if the tree has
+    uncommitted changes), or "unknown" outside of a git repository.
+    """
+
+    root = Path(__file__).parent.parent
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=root, capture_output=True, check=True
+        ).stdout.decode().strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=root, capture_output=True, check=True
+        ).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+    return commit + ("+" if dirty else "")
+
+
+def load(path: Path = HISTORY) -> list[dict]:
+    if not path.is_file():
+        return list()
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save(results: dict[str, float], path: Path = HISTORY) -> dict:
+    record = {
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "python": sys.version.split()[0],
+        "results": results
+    }
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+    return record
+
+
+def baseline(history: list[dict], commit: str) -> dict|None:
+    """
+    baseline(history: list[dict], commit: str) -> dict|None
+
+
+    Most recent record from a different commit on this host -- results from
+    other machines are not comparable.
+    """
+
+    for record in reversed(history):
+        if record["commit"] != commit and record["host"] == platform.node():
+            return record
+    return None
+
+
+def compare(
+            results: dict[str, float], base: dict|None, threshold: float
+        ) -> tuple[str, list[str]]:
+    """
+    compare(
+            results: dict[str, float], base: dict|None, threshold: float
+        ) -> tuple[str, list[str]]
+
+
+    Format `results` as a table next to the `base` record. Returns the table
+    and the names of the benchmarks that are more than `threshold` (relative)
+    slower than in `base`.
+    """
+
+    base_results = dict() if base is None else base["results"]
+    base_commit = "-" if base is None else base["commit"]
+
+    width = max(len(name) for name in results)
+    lines = [f"{'benchmark':{width}} {'time':>12} {base_commit:>12} {'ratio':>7}"]
+    regressions = list()
+    for name, value in results.items():
+        old = base_results.get(name)
+        if old is None:
+            lines.append(f"{name:{width}} {value*1e3:>10.3f}ms {'-':>12} {'-':>7}")
+            continue
+
+        ratio = value / old if old > 0 else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  << REGRESSION"
+            regressions.append(name)
+        lines.append(
+            f"{name:{width}} {value*1e3:>10.3f}ms {old*1e3:>10.3f}ms "
+            f"{ratio:>7.2f}{flag}"
+        )
+
+    return "\n".join(lines), regressions
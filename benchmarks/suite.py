@@ -0,0 +1,169 @@
+from .toolchain import FakeToolchain, site_json
+
+from mpi4py_installer.runners    import ShellRunner
+from mpi4py_installer.singleton  import Singleton
+from mpi4py_installer.mpi_config import MPIConfig
+from mpi4py_installer.sites      import ConfigStore, match_mpi_library
+
+import json
+import subprocess
+import sys
+import time
+
+from typing import Callable
+
+
+# Registered benchmarks: name -> function(toolchain, quick) -> dict of results
+# (result name -> seconds per operation)
+BENCHMARKS: dict[str, Callable[[FakeToolchain, bool], dict[str, float]]] = dict()
+
+
+def benchmark(fn):
+    BENCHMARKS[fn.__name__] = fn
+    return fn
+
+
+def measure(fn: Callable[[], object], number: int, repeat: int = 3) -> float:
+    """
+    measure(fn: Callable[[], object], number: int, repeat: int = 3) -> float
+
+
+    Time `number` calls of `fn`, `repeat` times. Returns the best average time
+    per call (like `timeit`, the minimum is the least noisy estimate).
+    """
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def measure_subprocess(
+            args: list[str], env: dict[str, str], repeat: int = 3
+        ) -> float:
+    """
+    measure_subprocess(
+            args: list[str], env: dict[str, str], repeat: int = 3
+        ) -> float
+
+
+    Best wall time of running `args` with `env`. If the command prints a
+    number as the last line of its stdout, then that is used as the time
+    instead (so that the command can time its own hot path).
+    """
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = subprocess.run(args, env=env, capture_output=True, check=True)
+        elapsed = time.perf_counter() - start
+
+        lines = out.stdout.decode().strip().splitlines()
+        try:
+            elapsed = float(lines[-1])
+        except (IndexError, ValueError):
+            pass
+        best = min(best, elapsed)
+    return best
+
+
+@benchmark
+def shell_runner(toolchain: FakeToolchain, quick: bool) -> dict[str, float]:
+    # Single env strings are capped at 128 KiB => pad using 16 KiB chunks
+    results = dict()
+    for kib in [0, 16, 64, 256]:
+        env = dict(toolchain.env)
+        for i in range(kib // 16):
+            env[f"BENCH_PAD{i}"] = "x" * 16 * 1024
+
+        with ShellRunner(env=env) as runner:
+            results[f"ShellRunner.run[env+{kib}KiB]"] = measure(
+                lambda: runner.run("true"), 5 if quick else 20
+            )
+    return results
+
+
+@benchmark
+def auto_site(toolchain: FakeToolchain, quick: bool) -> dict[str, float]:
+    code = ";".join([
+        "import time",
+        "from mpi4py_installer.sites import auto_site",
+        "start = time.perf_counter()",
+        "auto_site()",
+        "print(time.perf_counter() - start)"
+    ])
+
+    results = dict()
+    for n_sites in [1, 10, 50]:
+        env = dict(toolchain.env)
+        env["MPI4PY_INSTALLER_SITE_CONFIG"] = str(toolchain.add_sites(n_sites))
+        # worst case: the detected site is the last one to be checked
+        env["BENCH_SITE"] = f"site{n_sites - 1}"
+        results[f"auto_site[sites={n_sites}]"] = measure_subprocess(
+            [sys.executable, "-c", code], env, repeat=1 if quick else 3
+        )
+    return results
+
+
+@benchmark
+def config_store(toolchain: FakeToolchain, quick: bool) -> dict[str, float]:
+    results = dict()
+    for n_systems, n_variants in [(1, 2), (10, 10), (50, 20)]:
+        stem = toolchain.root / f"store-{n_systems}x{n_variants}"
+        with open(stem.with_suffix(".json"), "w") as f:
+            json.dump(site_json(toolchain.root, n_systems, n_variants), f)
+
+        def load():
+            # ConfigStore is a singleton => drop the cached instance
+            Singleton._instances.clear()
+            ConfigStore(str(stem.with_suffix(".py")))
+
+        name = f"ConfigStore[systems={n_systems},variants={n_variants}]"
+        results[name] = measure(load, 2 if quick else 10)
+    return results
+
+
+@benchmark
+def validated_dataclass(
+            toolchain: FakeToolchain, quick: bool
+        ) -> dict[str, float]:
+    variant = site_json(toolchain.root, 1, 1)["systems"]["sys0"]["var0"]
+    return {
+        "MPIConfig()": measure(
+            lambda: MPIConfig(**variant), 200 if quick else 2000
+        )
+    }
+
+
+@benchmark
+def sanity_match(toolchain: FakeToolchain, quick: bool) -> dict[str, float]:
+    target = str(toolchain.root / "lib" / "libmpi.so")
+    libs = ["m", "dl", "pthread", "mpi"]
+
+    results = dict()
+    for n_dirs in [1, 10, 100]:
+        # worst case: the matching directory is the last one to be checked
+        lib_dirs = [
+            str(toolchain.root / f"nolib{i}") for i in range(n_dirs - 1)
+        ] + [str(toolchain.root / "lib")]
+        results[f"match_mpi_library[dirs={n_dirs}]"] = measure(
+            lambda: match_mpi_library(target, lib_dirs, libs),
+            5 if quick else 50
+        )
+    return results
+
+
+@benchmark
+def cli_run(toolchain: FakeToolchain, quick: bool) -> dict[str, float]:
+    args = [
+        sys.executable, "-m", "mpi4py_installer",
+        "--site=site0", "--system=sys0", "--variant=var0", "--user"
+    ]
+    return {
+        "cli.run[stub pip]": measure_subprocess(
+            args, toolchain.env, repeat=1 if quick else 3
+        )
+    }
@@ -0,0 +1,200 @@
+import json
+import os
+import stat
+
+from pathlib import Path
+
+
+# Stub MPI compiler wrapper: `-show` prints a link line pointing at the fake
+# libmpi, anything else "compiles" by succeeding.
+MPICC = """#!/usr/bin/env bash
+if [[ "$1" == "-show" ]]; then
+    echo "cc -I{root}/include -L{root}/lib -lmpi"
+    exit 0
+fi
+exit 0
+"""
+
+CC = """#!/usr/bin/env bash
+exit 0
+"""
+
+# Fake `module` command, exported to bash as a function. `module load X`
+# appends X to LOADEDMODULES (just like the real thing).
+MODULE = (
+    "() {  case \"$1\" in "
+    "load) shift; for m in \"$@\"; do "
+    "export LOADEDMODULES=\"${LOADEDMODULES:+$LOADEDMODULES:}$m\"; done;; "
+    "*) ;; esac\n}"
+)
+
+# Stub `pip` package: put this first on PYTHONPATH, and `python -m pip` becomes
+# a no-op that reports an installed mpi4py (and stages an empty mpi4py).
+PIP_MAIN = """import sys
+from pathlib import Path
+
+args = sys.argv[1:]
+if args and args[0] == "freeze":
+    print("mpi4py==0.0.0")
+elif args and args[0] == "wheel":
+    wheel_dir = Path(args[args.index("-w") + 1])
+    wheel_dir.mkdir(parents=True, exist_ok=True)
+    (wheel_dir / "mpi4py-0.0.0-py3-none-any.whl").write_bytes(b"")
+elif args and args[0] == "install" and "--target" in args:
+    target = Path(args[args.index("--target") + 1])
+    info = target / "mpi4py-0.0.0.dist-info"
+    for d in [target / "mpi4py", info]:
+        d.mkdir(parents=True, exist_ok=True)
+    (target / "mpi4py" / "__init__.py").write_text("")
+    (info / "METADATA").write_text("Name: mpi4py\\nVersion: 0.0.0\\n")
+    (info / "RECORD").write_text(
+        "mpi4py/__init__.py,,\\nmpi4py-0.0.0.dist-info/METADATA,,\\n"
+        "mpi4py-0.0.0.dist-info/RECORD,,\\n"
+    )
+sys.exit(0)
+"""
+
+# Synthetic user site: same as `mpi4py_installer.sites.local`, except that
+# `sanity` trusts the stub toolchain. `check_site` is controlled by BENCH_SITE.
+SITE_MODULE = """from mpi4py_installer.sites import ConfigStore, MPIConfig, \\
+    default_available_systems, default_determine_system, \\
+    default_available_variants, default_config
+
+from os import environ
+
+CONFIG = ConfigStore(__file__)
+
+
+def check_site() -> bool:
+    return environ.get("BENCH_SITE") == "{name}"
+
+
+def available_systems() -> list[str]:
+    return default_available_systems(CONFIG)
+
+
+def determine_system() -> str:
+    return default_determine_system(CONFIG)
+
+
+def available_variants(system: str) -> list[str]:
+    return default_available_variants(CONFIG, system)
+
+
+def auto_variant(system: str) -> str:
+    return default_available_variants(CONFIG, system)[0]
+
+
+def config(system: str, variant: str) -> MPIConfig:
+    return default_config(CONFIG, system, variant)
+
+
+def init(system: str, variant: str) -> str|None:
+    config = default_config(CONFIG, system, variant)
+    if config.init is not None:
+        return "\\n".join(config.init)
+    return None
+
+
+def sanity(system: str, variant: str, config: MPIConfig) -> bool:
+    return True
+"""
+
+
+def _write_exe(path: Path, content: str):
+    path.write_text(content)
+    path.chmod(path.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def site_json(root: Path, n_systems: int, n_variants: int) -> dict:
+    """
+    site_json(root: Path, n_systems: int, n_variants: int) -> dict
+
+
+    Synthetic site configuration with `n_systems` systems (named sys<i>) with
+    `n_variants` variants (named var<j>) each.
+    """
+
+    variant = {
+        "sys_prefix": ["/opt/"],
+        "mpicc_show": "-show",
+        "init": ["module load PrgEnv-fake", "export FAKE_TOOLCHAIN=1"],
+        "MPICC": str(root / "bin" / "mpicc"),
+        "CC": str(root / "bin" / "cc")
+    }
+    return {
+        "environment": {"host": "BENCH_HOST", "blacklist": ["BENCH_NOSITE"]},
+        "systems": {
+            f"sys{i}": {f"var{j}": dict(variant) for j in range(n_variants)}
+            for i in range(n_systems)
+        }
+    }
+
+
+class FakeToolchain:
+    """
+    Offline stand-in for an HPC system, rooted at `root`:
+        bin/        stub `mpicc` and `cc`
+        lib/        fake `libmpi.so`
+        pip/        stub `pip` package (see PIP_MAIN)
+        sites-*/    synthetic user sites (see `add_sites`)
+        cache/      wheel cache
+        userbase/   user base (`--user` installs go here)
+    `env` is an environment using the stubs and the fake `module` function,
+    with a user site directory containing a single site (`site0`).
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        for d in ["bin", "lib", "include", "pip"]:
+            (self.root / d).mkdir(parents=True, exist_ok=True)
+
+        _write_exe(self.root / "bin" / "mpicc", MPICC.format(root=self.root))
+        _write_exe(self.root / "bin" / "cc", CC)
+        (self.root / "lib" / "libmpi.so").write_bytes(b"")
+        (self.root / "pip" / "__init__.py").write_text("")
+        (self.root / "pip" / "__main__.py").write_text(PIP_MAIN)
+
+        package_root = Path(__file__).parent.parent.resolve()
+        self.env = {
+            "PATH": os.pathsep.join([
+                str(self.root / "bin"), os.environ.get("PATH", "")
+            ]),
+            "HOME": os.environ.get("HOME", str(self.root)),
+            "PYTHONPATH": os.pathsep.join([
+                str(self.root), str(package_root)
+            ]),
+            "MPI4PY_INSTALLER_SITE_CONFIG": str(self.add_sites(1)),
+            "MPI4PY_NOLOCAL": "1",
+            "MPI4PY_INSTALLER_CACHE": str(self.root / "cache"),
+            "PYTHONUSERBASE": str(self.root / "userbase"),
+            "BENCH_SITE": "site0",
+            "BASH_FUNC_module%%": MODULE,
+        }
+
+
+    def add_sites(
+                self, n_sites: int, n_systems: int = 1, n_variants: int = 2
+            ) -> Path:
+        """
+        add_sites(
+                self, n_sites: int, n_systems: int = 1, n_variants: int = 2
+            ) -> Path
+
+
+        Create a user site directory with the sites `site0` ...
+        `site<n_sites-1>` and return its path. The site that is detected by
+        `auto_site` is selected via the BENCH_SITE variable.
+        """
+
+        sites = self.root / f"sites-{n_sites}x{n_systems}x{n_variants}"
+        sites.mkdir(exist_ok=True)
+        for i in range(n_sites):
+            name = f"site{i}"
+            (sites / f"{name}.py").write_text(
+                SITE_MODULE.replace("{name}", name)
+            )
+            with open(sites / f"{name}.json", "w") as f:
+                json.dump(site_json(self.root, n_systems, n_variants), f)
+
+        return sites
@@ -1,15 +1,21 @@
 from .abc                   import makecls
-from .runners               import ShellRunner
-from .singleton             import Singleton
-from .mpi_config            import MPIConfig
+from .runners               import ShellRunner, ModuleDriver
+from .tracing               import span
+from .singleton             import Singleton, dict_hash
+from .mpi_config            import MPIConfig, BuildProfile, PackageRecipe
 from .validated_dataclasses import ValidatedDataClass
 
+import os
 import sys
 import logging
 import importlib
+import importlib.util
+import subprocess
+import tempfile
+import threading
 
 from pathlib             import Path
-from importlib.machinery import SourceFileLoader
+from functools           import lru_cache
 from types               import ModuleType
 
 
@@ -34,18 +40,36 @@ def load_site(site: str) -> ModuleType:
     return site_module
 
 
+_USER_SITE_LOCK = threading.Lock()
+
+
 def load_user_site(user_site: str , user_site_root: Path) -> ModuleType:
     """
     load_user_site(user_site:str , user_site_root: Path) -> ModuleType
 
 
     Loads a user-defined site module stored at `user_site_root`. The loaded
-    moduel is returned as a python module (to be used later on).
+    moduel is returned as a python module (to be used later on). Each site
+    file is loaded once, as a module with a unique name.
     """
     logger.debug(f"Loading user site: {user_site} at {user_site_root}")
-    return SourceFileLoader(
-        "user_site", str(user_site_root / Path(user_site + ".py"))
-    ).load_module()
+    path = (user_site_root / Path(user_site + ".py")).resolve()
+    name = f"mpi4py_installer_user_site_{dict_hash({'path': str(path)})}"
+
+    with _USER_SITE_LOCK:
+        if name in sys.modules:
+            return sys.modules[name]
+
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            del sys.modules[name]
+            raise
+
+    return module
 
 
 def pip_find_mpi4py():
@@ -71,7 +95,7 @@ def pip_find_mpi4py():
     return False
 
 
-def pip_cmd(config):
+def pip_cmd(config, python=sys.executable):
     logger.debug("Configuring pip command")
 
     pip_cmd = ""
@@ -89,7 +113,7 @@ def pip_cmd(config):
         pip_cmd += f"LDFLAGS=\"{config.LDFLAGS}\""
         pip_cmd += " "
 
-    pip_cmd += f"{sys.executable} -m pip"
+    pip_cmd += f"{python} -m pip"
     pip_cmd += " "
 
     logger.debug(f"Done configuring pip command")
@@ -97,9 +121,42 @@ def pip_cmd(config):
     return pip_cmd.strip()  # clean up any unnecessary spaces 
 
 
-def pip_uninstall_mpi4py():
+@lru_cache
+def python_abi(python=sys.executable):
+    """
+    python_abi(python=sys.executable)
+
+
+    Returns the `SOABI` tag (e.g. `cpython-311-x86_64-linux-gnu`) of the
+    `python` interpreter. Builds for interpreters with the same tag produce
+    interchangeable mpi4py wheels.
+    """
+    logger.debug(f"Querying ABI tag of {python=}")
+
+    out = subprocess.run(
+        [python, "-c", "import sysconfig; print(sysconfig.get_config_var('SOABI'))"],
+        capture_output=True, check=True
+    )
+    return out.stdout.decode().strip()
+
+
+def pip_uninstall_mpi4py(use_pip=False):
     logger.debug(f"Uninstalling mpi4py")
 
+    # Delete the files listed in mpi4py's RECORD directly -- this avoids
+    # starting pip (in a new shell). Fall back to pip if this is not possible.
+    if not use_pip:
+        try:
+            with span("uninstall_record"):
+                report = uninstall_distribution("mpi4py")
+        except PermissionError as e:
+            logger.warning(f"{e} => falling back to pip")
+            report = None
+
+        if report is not None:
+            logger.info(f"Uninstalled {report}")
+            return
+
     with ShellRunner() as bash_runner:
         out = bash_runner.run(
             f"{sys.executable} -m pip uninstall -y mpi4py",
@@ -113,9 +170,147 @@ def pip_uninstall_mpi4py():
     logger.debug("Done uninstalling mpi4py")
 
 
-def pip_install_mpi4py(pip_cmd, use_user, init):
+# Environments set up by `init`, keyed by the `init` commands and the current
+# environment -- only used by long-running processes (c.f. `cache_init_envs`)
+_INIT_ENV_CACHE: dict[str, dict[str, str]]|None = None
+_INIT_ENV_LOCK = threading.Lock()
+
+
+def cache_init_envs(enable=True):
+    """
+    cache_init_envs(enable=True)
+
+
+    Enable (or disable) caching the environments of `init_env` -- eg. in the
+    daemon, which runs the same `init` for many requests. Clears the cache.
+    """
+
+    global _INIT_ENV_CACHE
+    with _INIT_ENV_LOCK:
+        _INIT_ENV_CACHE = dict() if enable else None
+
+
+def init_env(init):
+    """
+    init_env(init)
+
+
+    Returns the environment after running the `init` commands -- this can be
+    shared by several builds (instead of running `init` for each).
+    """
+
+    key = dict_hash({"init": init, "env": dict(os.environ)})
+    with _INIT_ENV_LOCK:
+        if _INIT_ENV_CACHE is not None and key in _INIT_ENV_CACHE:
+            logger.info(f"Using the cached environment of {init=}")
+            return dict(_INIT_ENV_CACHE[key])
+
+    with ShellRunner() as bash_runner:
+        if (init is None) or (init == ""):
+            logger.info(f"Skipping {init=} command (None or empty)")
+        else:
+            logger.info(f"Running init command: {init}")
+            with span("init"):
+                out = ModuleDriver(bash_runner).run(init)
+
+            logger.debug(f"stderr={out.stderr.decode()}")
+            out.check_returncode()
+            logger.debug(f"stdout={out.stdout.decode()}")
+
+    with _INIT_ENV_LOCK:
+        if _INIT_ENV_CACHE is not None:
+            _INIT_ENV_CACHE[key] = dict(bash_runner.env)
+
+    return bash_runner.env
+
+
+def pip_wheel_mpi4py(
+            pip_cmd, init, config, wheelhouse=None, publish=False, cache=None,
+            lock_timeout=3600, env=None, python=sys.executable, builder=None,
+            abi_portable=False
+        ):
+    """
+    pip_wheel_mpi4py(
+            pip_cmd, init, config, wheelhouse=None, publish=False, cache=None,
+            lock_timeout=3600, env=None, python=sys.executable, builder=None,
+            abi_portable=False
+        )
+
+
+    Returns the path to an mpi4py wheel for `config` (and the environment set
+    up by `init`) and the `python` interpreter. Uses a prebuilt wheel with the
+    same build fingerprint if the `wheelhouse` has one. Otherwise builds a
+    wheel, publishes it to the `cache` (or the `wheelhouse` when publishing).
+    Concurrent processes with the same fingerprint build only once: the others
+    wait for the build (for at most `lock_timeout` seconds) and use its wheel.
+    If `env` is given, it is used instead of running `init`. Wheels are built
+    by `builder(wheel_dir, env) -> Path` (default: `pip_build_mpi4py`).
+    `abi_portable` builds are shared by all configs of the same MPI ABI family
+    (c.f. `build_fingerprint`).
+    """
+    logger.debug(f"Looking for an mpi4py wheel for {python=}")
+
+    if env is None:
+        env = init_env(init)
+
+    with span("fingerprint"):
+        fingerprint = build_fingerprint(
+            config, env=env, python=python, abi_portable=abi_portable
+        )
+    logger.info(f"Build {fingerprint=}")
+
+    wheel = None
+    if (wheelhouse is not None) and not publish:
+        with span("wheelhouse_lookup"):
+            wheel = wheelhouse.lookup(fingerprint)
+    if wheel is not None:
+        return wheel
+
+    target = wheelhouse if publish else cache
+    if target is None:
+        raise RuntimeError("Building a wheel requires a cache or wheelhouse")
+
+    if builder is None:
+        def builder(wheel_dir, env):
+            return pip_build_mpi4py(pip_cmd, wheel_dir, init, env=env)[0]
+
+    def build():
+        with tempfile.TemporaryDirectory() as wheel_dir:
+            built = builder(wheel_dir, env)
+            with span("publish"):
+                return target.publish(
+                    fingerprint, built,
+                    meta={"config": str(config), "python": python}
+                )
+
+    wheel, waited = single_flight(
+        target.lock_path(fingerprint), build,
+        lambda: target.lookup(fingerprint),
+        rebuild=publish, timeout=lock_timeout
+    )
+    if waited > 0:
+        logger.info(f"Waited {waited:.1f}s for a concurrent build")
+
+    return wheel
+
+
+def pip_install_mpi4py(
+            pip_cmd, use_user, init, config=None, wheelhouse=None, publish=False,
+            cache=None, lock_timeout=3600
+        ):
     logger.debug(f"Installing mpi4py")
 
+    # Install from a wheel (prebuilt, cached, or built now) if possible
+    if (wheelhouse is not None) or (cache is not None):
+        wheel = pip_wheel_mpi4py(
+            pip_cmd, init, config, wheelhouse=wheelhouse, publish=publish,
+            cache=cache, lock_timeout=lock_timeout
+        )
+        with span("install_wheel"):
+            pip_install_wheel(wheel, use_user)
+        logger.debug("Done installing mpi4py")
+        return
+
     cmd = f"{pip_cmd} " + "install --no-cache-dir --no-binary=:all: mpi4py"
     if use_user:
         cmd += " --user"
@@ -125,17 +320,85 @@ def pip_install_mpi4py(pip_cmd, use_user, init):
             logger.info(f"Skipping {init=} command (None or empty)")
         else:
             logger.info(f"Running init command: {init}")
-            out = bash_runner.run(init, capture_output=True)
+            with span("init"):
+                out = ModuleDriver(bash_runner).run(init)
 
             logger.debug(f"stderr={out.stderr.decode()}")
             out.check_returncode()
             logger.debug(f"stdout={out.stdout.decode()}")
 
         logger.info(f"Running install command: {cmd}")
-        out = bash_runner.run(cmd, capture_output=True)
+        with span("compile"):
+            out = bash_runner.run(cmd, capture_output=True)
 
         logger.debug(f"stderr={out.stderr.decode()}")
         out.check_returncode()
         logger.debug(f"stdout={out.stdout.decode()}")
 
+    logger.info(f"Install resource usage: {bash_runner.usage}")
     logger.debug("Done installing mpi4py")
+
+
+def pip_build_mpi4py(pip_cmd, wheel_dir, init, env=None, source="mpi4py"):
+    logger.debug(f"Building mpi4py wheel from {source=} in {wheel_dir}")
+
+    cmd = f"{pip_cmd} " + "wheel --no-cache-dir --no-binary=:all: --no-deps"
+    cmd += f" -w {wheel_dir} {source}"
+
+    # An `env` that was already set up by `init` can be reused
+    with ShellRunner(env=None if env is None else dict(env)) as bash_runner:
+        if env is not None:
+            logger.info(f"Skipping {init=} command (using initialized env)")
+        elif (init is None) or (init == ""):
+            logger.info(f"Skipping {init=} command (None or empty)")
+        else:
+            logger.info(f"Running init command: {init}")
+            with span("init"):
+                out = ModuleDriver(bash_runner).run(init)
+
+            logger.debug(f"stderr={out.stderr.decode()}")
+            out.check_returncode()
+            logger.debug(f"stdout={out.stdout.decode()}")
+
+        logger.info(f"Running build command: {cmd}")
+        with span("compile"):
+            out = bash_runner.run(cmd, capture_output=True)
+
+        logger.debug(f"stderr={out.stderr.decode()}")
+        out.check_returncode()
+        logger.debug(f"stdout={out.stdout.decode()}")
+
+    wheels = sorted(Path(wheel_dir).glob("mpi4py-*.whl"))
+    if not wheels:
+        raise RuntimeError(f"pip did not produce an mpi4py wheel in {wheel_dir}")
+
+    logger.info(f"Build resource usage: {bash_runner.usage}")
+    logger.debug(f"Done building {wheels[-1]}")
+    return wheels[-1], bash_runner.usage
+
+
+def pip_install_wheel(wheel, use_user, python=sys.executable):
+    logger.debug(f"Installing {wheel} into {python=}")
+
+    cmd = f"{python} -m pip install --no-index --no-deps --force-reinstall"
+    cmd += f" {wheel}"
+    if use_user:
+        cmd += " --user"
+
+    with ShellRunner() as bash_runner:
+        out = bash_runner.run(cmd, capture_output=True)
+
+        logger.debug(f"stderr={out.stderr.decode()}")
+        out.check_returncode()
+        logger.debug(f"stdout={out.stdout.decode()}")
+
+    logger.debug("Done installing mpi4py wheel")
+
+
+# These modules depend on the functions defined above (via
+# `mpi4py_installer.sites`) => import them last
+from .fingerprint import build_fingerprint
+from .wheelhouse  import Wheelhouse, cache_path
+from .locking     import single_flight
+from .uninstall   import uninstall_distribution
+from .api         import install, InstallResult
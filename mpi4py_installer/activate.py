@@ -0,0 +1,127 @@
+from .            import logger
+from .mpi_config import MPIConfig
+
+import os
+import shlex
+import tempfile
+
+from pathlib import Path
+
+
+ACTIVATE_SCRIPT = Path("etc") / "mpi4py-activate.sh"
+
+# Set by bash itself (rather than by `init`) => not part of the delta
+SHELL_VARIABLES = ("_", "SHLVL", "PWD", "OLDPWD")
+
+
+def env_delta(
+            env: dict[str, str], base: dict[str, str]|None = None
+        ) -> dict[str, str|None]:
+    """
+    env_delta(
+            env: dict[str, str], base: dict[str, str]|None = None
+        ) -> dict[str, str|None]
+
+
+    Changes from `base` (default: the current environment) to `env` (eg. the
+    environment after running `init`). Variables that were removed map to
+    None.
+    """
+
+    if base is None:
+        base = dict(os.environ)
+
+    delta: dict[str, str|None] = {
+        name: value for name, value in env.items()
+        if base.get(name) != value and name not in SHELL_VARIABLES
+    }
+    for name in base:
+        if name not in env and name not in SHELL_VARIABLES:
+            delta[name] = None
+
+    return delta
+
+
+def activation_script(
+            delta: dict[str, str|None], runtime_env: dict[str, str]|None = None,
+            comment: str = ""
+        ) -> str:
+    """
+    activation_script(
+            delta: dict[str, str|None], runtime_env: dict[str, str]|None = None,
+            comment: str = ""
+        ) -> str
+
+
+    Bash script that applies the environment `delta`, followed by the
+    `runtime_env` settings. Values are fully resolved, so sourcing it doesn't
+    run any module commands.
+    """
+
+    lines = ["# Generated by mpi4py-installer -- do not edit"]
+    lines += [f"# {line}" for line in comment.splitlines()]
+
+    for name, value in sorted(delta.items()):
+        if value is None:
+            lines.append(f"unset {name}")
+        else:
+            lines.append(f"export {name}={shlex.quote(value)}")
+
+    if runtime_env:
+        lines.append("# Runtime settings")
+        for name, value in runtime_env.items():
+            lines.append(f"export {name}={shlex.quote(value)}")
+
+    return "\n".join(lines) + "\n"
+
+
+def write_activation_script(
+            path: Path, env: dict[str, str], config: MPIConfig,
+            comment: str = ""
+        ) -> Path:
+    """
+    write_activation_script(
+            path: Path, env: dict[str, str], config: MPIConfig,
+            comment: str = ""
+        ) -> Path
+
+
+    Write the activation script for the `init` environment `env` and the
+    `config`'s runtime settings to `path`. The file is replaced atomically, so
+    running jobs never source a partial script. Returns `path`.
+    """
+
+    script = activation_script(env_delta(env), config.runtime_env, comment)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(script)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+    logger.info(f"Wrote activation script: {path} (use: source {path})")
+    return path
+
+
+def activation_path(
+            prefix: str, use_user: bool = False, usersite: str|None = None
+        ) -> Path:
+    """
+    activation_path(
+            prefix: str, use_user: bool = False, usersite: str|None = None
+        ) -> Path
+
+
+    Default location of the activation script: `$PREFIX/etc` of the python
+    environment -- or `$USER_BASE/etc` for `--user` installs (`usersite` is
+    `$USER_BASE/lib/pythonX.Y/site-packages`).
+    """
+
+    if use_user and usersite is not None:
+        return Path(usersite).parents[2] / ACTIVATE_SCRIPT
+    return Path(prefix) / ACTIVATE_SCRIPT
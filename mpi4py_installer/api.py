@@ -0,0 +1,486 @@
+from .                      import logger, pip_find_mpi4py, pip_cmd, \
+    pip_uninstall_mpi4py, pip_install_mpi4py, pip_wheel_mpi4py, init_env, \
+    build_fingerprint, Wheelhouse, cache_path, MPIConfig, BuildProfile
+from .                      import bytecode, microbench, telemetry
+from .activate              import write_activation_script, activation_path
+from .fingerprint           import libmpi, abi_family, select_libmpi
+from .locking               import location_lock
+from .packages              import build_order, build_packages, \
+    package_fingerprints, set_fingerprint
+from .pgo                   import pgo_build, compare_builds
+from .sites                 import resolve_site, site_wheelhouse, \
+    site_profile, site_packages
+from .swap                  import interpreter_paths, installed_entries, \
+    stage_wheel, swap_in, rollback, run_sanity
+from .tracing               import span
+from .validated_dataclasses import ValidatedDataClass
+
+import shutil
+import sys
+import time
+
+from contextlib  import contextmanager
+from dataclasses import dataclass, field
+from pathlib     import Path
+from types       import ModuleType
+
+
+@dataclass(frozen=True)
+class InstallResult(metaclass=ValidatedDataClass):
+    """
+    Outcome of `install`. The `phase` is the last phase that was started (and
+    failed, unless `ok`); `timings` has the seconds spent in each phase.
+    """
+    site: str
+    system: str
+    variant: str
+    config: MPIConfig
+    python: str
+    ok: bool
+    phase: str
+    fingerprint: str|None = None
+    libmpi: str|None = None
+    mpiabi: str|None = None
+    cache_hit: bool|None = None
+    wheel: str|None = None
+    packages: dict[str, str]|None = None
+    location: str|None = None
+    backup: str|None = None
+    sanity: bool|None = None
+    activation_script: str|None = None
+    microbench: dict[str, dict[str, float]]|None = None
+    pgo_microbench: dict[str, dict[str, float]]|None = None
+    import_accesses: dict[str, dict[str, int]]|None = None
+    timings: dict[str, float] = field(default_factory=dict)
+    error: str|None = None
+
+
+class _Phases:
+    """
+    Tracks the current phase of an install, and the time spent in each phase.
+    """
+
+    def __init__(self):
+        self.current = "resolve"
+        self.timings: dict[str, float] = dict()
+
+
+    @contextmanager
+    def __call__(self, name: str, **attrs):
+        self.current = name
+        start = time.perf_counter()
+        try:
+            with span(name, **attrs):
+                yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0.) + elapsed
+
+
+def resolve(
+            site: str|ModuleType|None = None, system: str|None = None,
+            variant: str|None = None, profile: str|None = None
+        ) -> tuple[ModuleType, str, str, MPIConfig]:
+    """
+    resolve(
+            site: str|ModuleType|None = None, system: str|None = None,
+            variant: str|None = None, profile: str|None = None
+        ) -> tuple[ModuleType, str, str, MPIConfig]
+
+
+    Resolve the site module, system, variant and config (with the build
+    `profile` applied) -- anything that is None is determined automatically,
+    just like the CLI does. `site` can be a name (c.f. `resolve_site`), or an
+    already loaded site module. Raises RuntimeError if something can't be
+    found.
+    """
+
+    if isinstance(site, ModuleType):
+        site_module = site
+    else:
+        with span("load_site", site=site):
+            site_module = resolve_site(site)
+
+    if system is None:
+        with span("determine_system"):
+            system = site_module.determine_system()
+        logger.info(f"Determined system as: {system}")
+
+    if variant is None:
+        with span("auto_variant"):
+            variant = site_module.auto_variant(system)
+        logger.info(f"Automatically setting {variant=}")
+
+    with span("config", system=system, variant=variant):
+        config = site_module.config(system, variant)
+
+        # Add the flags of the build profile
+        build_profile = site_profile(site_module, system, profile)
+        if build_profile is not None:
+            logger.info(f"Using build profile: {build_profile[0]}")
+            config = config.with_profile(*build_profile)
+    logger.debug(f"Loaded {config=}")
+
+    return site_module, system, variant, config
+
+
+def wheel_stores(
+            site: ModuleType, system: str, variant: str,
+            wheelhouse: str|None = None, use_wheelhouse: bool = True
+        ) -> tuple[Wheelhouse|None, Wheelhouse|None]:
+    """
+    wheel_stores(
+            site: ModuleType, system: str, variant: str,
+            wheelhouse: str|None = None, use_wheelhouse: bool = True
+        ) -> tuple[Wheelhouse|None, Wheelhouse|None]
+
+
+    The local wheel cache and the (shared) wheelhouse to use: `wheelhouse`
+    overwrites the site's wheelhouse. Neither is used (None) unless
+    `use_wheelhouse` is set.
+    """
+
+    if not use_wheelhouse:
+        return None, None
+
+    cache = Wheelhouse(cache_path())
+    if wheelhouse is None:
+        wheelhouse = site_wheelhouse(site, system, variant)
+    if wheelhouse is None:
+        return cache, None
+
+    logger.info(f"Using wheelhouse: {wheelhouse}")
+    return cache, Wheelhouse(wheelhouse)
+
+
+def install(
+            site: str|ModuleType|None = None, system: str|None = None,
+            variant: str|None = None, profile: str|None = None,
+            python: str = sys.executable, user: bool = False,
+            overwrite_system: bool = False, wheelhouse: str|None = None,
+            use_wheelhouse: bool = True, publish: bool = False,
+            lock_timeout: float = 3600, pgo: bool = False,
+            run_microbench: bool = False, activate_script: str|None = None,
+            precompile: str|None = None,
+            precompile_optimize: tuple[int, ...] = (0,),
+            abi_portable: bool = False, compile_slots: int = 1
+        ) -> InstallResult:
+    """
+    install(
+            site: str|ModuleType|None = None, system: str|None = None,
+            variant: str|None = None, profile: str|None = None,
+            python: str = sys.executable, user: bool = False,
+            overwrite_system: bool = False, wheelhouse: str|None = None,
+            use_wheelhouse: bool = True, publish: bool = False,
+            lock_timeout: float = 3600, pgo: bool = False,
+            run_microbench: bool = False, activate_script: str|None = None,
+            precompile: str|None = None,
+            precompile_optimize: tuple[int, ...] = (0,),
+            abi_portable: bool = False, compile_slots: int = 1
+        ) -> InstallResult
+
+
+    Install mpi4py for the `python` interpreter -- the arguments match the
+    CLI flags. `site` (a name or a site module), `system` and `variant` are
+    determined automatically if they're None (RuntimeError if that fails).
+    Failures of the install itself don't raise: they are reported in the
+    returned InstallResult.
+
+    With a wheel cache (`use_wheelhouse`), the wheel is built (or fetched),
+    staged and checked while the current install stays live, and only then
+    swapped in -- the replaced install is kept for `rollback`. Otherwise the
+    current install is uninstalled, and mpi4py is built from source (this
+    interpreter only).
+
+    `abi_portable` builds are shared by all variants whose MPI library is of
+    the same ABI family. The variant's own library is then selected at
+    runtime: the sanity checks and the activation script use the environment
+    of `select_libmpi`.
+
+    The MPI-aware packages that the variant selects (c.f. `site_packages`) are
+    built after mpi4py is staged -- on `compile_slots` threads, in dependency
+    order. They are staged, checked and swapped in together with mpi4py, and
+    `fingerprint` covers all of them.
+
+    `install` is safe to call from several threads at once: builds of the same
+    config are shared, and installs into the same location are serialized.
+    """
+
+    site_module, system, variant, config = resolve(
+        site, system, variant, profile
+    )
+    site_name = Path(site_module.__file__).stem
+
+    phases = _Phases()
+    result = {
+        "site": site_name, "system": system, "variant": variant,
+        "config": config, "python": python
+    }
+    try:
+        with phases("inspect"):
+            paths = interpreter_paths(python)
+            location = Path(paths["usersite" if user else "platlib"])
+            result["location"] = str(location)
+
+            if config.in_system_prefix(paths["prefix"]):
+                logger.warning(" ".join([
+                    "Your python version shares the system prefix.",
+                    "Did you forget to activate your python environment?"
+                ]))
+                if not overwrite_system:
+                    raise RuntimeError(
+                        "Will not overwrite install in system prefix (use "
+                        "overwrite_system)"
+                    )
+
+            cache, wheels = wheel_stores(
+                site_module, system, variant, wheelhouse, use_wheelhouse
+            )
+            if publish and wheels is None:
+                raise RuntimeError("publishing requires a wheelhouse")
+            if cache is None and (pgo or python != sys.executable):
+                raise RuntimeError(
+                    "PGO builds, and installs for other interpreters, need "
+                    "the wheel cache"
+                )
+            # the bytecode is compiled by this interpreter
+            if precompile is not None and python != sys.executable:
+                raise RuntimeError(
+                    "precompiling is only supported for this interpreter"
+                )
+
+            recipes = site_packages(site_module, system, config)
+            if recipes:
+                if cache is None:
+                    raise RuntimeError(
+                        "MPI-aware packages need the wheel cache"
+                    )
+                logger.info(f"Package build order: {build_order(recipes)}")
+
+        init = site_module.init(system, variant)
+        with phases("init"):
+            env = init_env(init)
+            result["libmpi"] = libmpi(config, env=env)
+
+            # ABI-portable: the runtime environment selects the MPI library
+            run_env = None
+            if abi_portable:
+                result["mpiabi"] = abi_family(config, env=env)
+                if result["mpiabi"] is None:
+                    logger.warning(
+                        f"{result['libmpi']} is not part of a known MPI ABI "
+                        "family => building for this library only"
+                    )
+                else:
+                    logger.info(f"ABI-portable build for {result['mpiabi']}")
+                    config = config.portable()
+                    result["config"] = config
+                    run_env = select_libmpi(config, env)
+            portable = run_env is not None
+
+            result["fingerprint"] = build_fingerprint(
+                config, env=env, python=python, abi_portable=portable
+            )
+
+        # Without a wheel cache: uninstall the current version, and
+        # build+install mpi4py from source
+        if cache is None:
+            with location_lock(location):
+                with phases("uninstall"):
+                    if pip_find_mpi4py():
+                        logger.info("mpi4py install detected! uninstalling")
+                        pip_uninstall_mpi4py()
+
+                with phases("install"):
+                    pip_install_mpi4py(pip_cmd(config), user, init)
+
+                if run_microbench:
+                    with phases("microbench"):
+                        result["microbench"] = {
+                            "new": microbench.run_microbench(
+                                python, env=run_env or env
+                            )
+                        }
+
+                with phases("sanity"):
+                    result["sanity"] = run_sanity(
+                        python, site_name, system, variant, env=run_env
+                    )
+            if not result["sanity"]:
+                raise RuntimeError("sanity check of the new mpi4py failed")
+
+        # Otherwise: build (or fetch) the wheel while the current version
+        # stays live, stage it, check the staged copy, and only then swap it in
+        else:
+            def cached(fingerprint):
+                return not publish and any(
+                    store is not None and store.lookup(fingerprint) is not None
+                    for store in (wheels, cache)
+                )
+
+            result["cache_hit"] = cached(result["fingerprint"])
+            if not result["cache_hit"]:
+                expected = telemetry.eta(
+                    site_name, system, variant, config.profile
+                )
+                if expected is not None:
+                    logger.info(
+                        f"Building mpi4py: ETA {expected[0]:.0f}s (median of "
+                        f"{expected[1]} previous builds)"
+                    )
+
+            with phases("build"):
+                wheel = pip_wheel_mpi4py(
+                    pip_cmd(config, python), init, config, wheelhouse=wheels,
+                    publish=publish and not pgo, cache=cache,
+                    lock_timeout=lock_timeout, env=env, python=python,
+                    abi_portable=portable
+                )
+
+            # PGO builds are cached (and published) under their own
+            # fingerprint, and new PGO builds are compared to the regular build
+            if pgo:
+                pgo_config = config.with_profile(
+                    f"{config.profile}+pgo", BuildProfile()
+                )
+                baseline = wheel
+                result["fingerprint"] = build_fingerprint(
+                    pgo_config, env=env, python=python, abi_portable=portable
+                )
+                result["cache_hit"] = result["cache_hit"] \
+                    and cached(result["fingerprint"])
+
+                def build_pgo(wheel_dir, env):
+                    wheel = pgo_build(config, wheel_dir, env, python=python)
+                    result["pgo_microbench"] = compare_builds(
+                        wheel, baseline, python=python, env=run_env or env
+                    )
+                    return wheel
+
+                with phases("pgo"):
+                    wheel = pip_wheel_mpi4py(
+                        pip_cmd(pgo_config, python), init, pgo_config,
+                        wheelhouse=wheels, publish=publish, cache=cache,
+                        lock_timeout=lock_timeout, env=env, python=python,
+                        abi_portable=portable, builder=build_pgo
+                    )
+            result["wheel"] = str(wheel)
+
+            # Packages are always built for the variant's own MPI library
+            if recipes:
+                fingerprints = package_fingerprints(
+                    recipes, build_fingerprint(config, env=env, python=python)
+                )
+                result["cache_hit"] = result["cache_hit"] \
+                    and all(cached(fp) for fp in fingerprints.values())
+                result["fingerprint"] = set_fingerprint(
+                    result["fingerprint"], fingerprints
+                )
+
+            with location_lock(location):
+                with phases("stage"):
+                    staging = stage_wheel(wheel, location, python=python)
+
+                # Until it is swapped in, a failing staged install is removed
+                # (and the current install stays live)
+                try:
+                    if recipes:
+                        with phases("packages"):
+                            package_wheels = build_packages(
+                                recipes, config, fingerprints, env, staging,
+                                cache, wheelhouse=wheels, publish=publish,
+                                lock_timeout=lock_timeout, python=python,
+                                workers=compile_slots
+                            )
+                        result["packages"] = {
+                            name: str(w) for name, w in package_wheels.items()
+                        }
+
+                    with phases("sanity_staged"):
+                        sanity = run_sanity(
+                            python, site_name, system, variant,
+                            path=(str(staging),), env=run_env
+                        )
+                    if not sanity:
+                        raise RuntimeError(
+                            "sanity check of the new mpi4py failed, kept "
+                            "current install"
+                        )
+
+                    if run_microbench:
+                        with phases("microbench"):
+                            bench = {"new": microbench.run_microbench(
+                                python, path=(str(staging),),
+                                env=run_env or env
+                            )}
+                            try:
+                                bench["current"] = microbench.run_microbench(
+                                    python, env=run_env or env
+                                )
+                            except RuntimeError:
+                                pass
+                        result["microbench"] = bench
+                except BaseException:
+                    shutil.rmtree(staging, ignore_errors=True)
+                    raise
+
+                with phases("swap"):
+                    result["backup"] = str(swap_in(
+                        staging, location, names=("mpi4py", *recipes)
+                    ))
+                logger.info(
+                    f"Previous install saved in {result['backup']} (use "
+                    "rollback)"
+                )
+
+                with phases("sanity"):
+                    result["sanity"] = run_sanity(
+                        python, site_name, system, variant, env=run_env
+                    )
+                if not result["sanity"]:
+                    logger.critical("Rolling back to the previous install")
+                    rollback(location, names=("mpi4py", *recipes))
+                    raise RuntimeError(
+                        "sanity check of the new mpi4py failed, rolled back"
+                    )
+
+        # Jobs source the resolved `init` environment, instead of running the
+        # module commands on every rank
+        with phases("activate"):
+            if activate_script is not None:
+                script = Path(activate_script)
+            else:
+                script = activation_path(
+                    paths["prefix"], user, paths["usersite"]
+                )
+            try:
+                write_activation_script(
+                    script, run_env or env, config,
+                    comment=f"{system=}, {variant=}"
+                )
+                result["activation_script"] = str(script)
+            except OSError as e:
+                logger.warning(f"Could not write the activation script: {e}")
+
+        if precompile is not None:
+            with phases("precompile", scope=precompile):
+                targets = [location]
+                if precompile == "mpi4py":
+                    targets = [location/e for e in installed_entries(location)]
+                before = bytecode.import_accesses(python)
+                if not bytecode.precompile(targets, precompile_optimize):
+                    logger.warning("Some files could not be precompiled")
+                result["import_accesses"] = {
+                    "before": before, "after": bytecode.import_accesses(python)
+                }
+    except Exception as e:
+        logger.critical(f"{phases.current} failed: {e}")
+        return InstallResult(
+            ok=False, phase=phases.current, timings=phases.timings,
+            error=str(e), **result
+        )
+
+    logger.info("Sanity check passed, install successful!")
+    return InstallResult(
+        ok=True, phase=phases.current, timings=phases.timings, **result
+    )
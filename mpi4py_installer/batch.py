@@ -0,0 +1,558 @@
+from .                      import logger, pip_cmd, python_abi, \
+    pip_build_mpi4py, init_env
+from .activate              import write_activation_script, activation_path
+from .fingerprint           import abi_family, select_libmpi
+from .locking               import location_lock
+from .mpi_config            import MPIConfig
+from .singleton             import dict_hash
+from .validated_dataclasses import ValidatedDataClass
+from .sites                 import resolve_site, site_profile
+from .tracing               import span
+from .runners               import ResourceUsage
+from .swap                  import PACKAGE_ROOT, run_sanity, \
+    interpreter_paths, stage_wheel, swap_in, rollback
+
+import csv
+import json
+import os
+import shutil
+import threading
+import time
+
+from pathlib            import Path
+from dataclasses        import dataclass, field, asdict
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+
+
+# Columns of a batch manifest -- only `prefix` is required, the remaining
+# columns fall back to the same automatic detection as the CLI.
+MANIFEST_FIELDS = ["prefix", "site", "system", "variant"]
+
+
+@dataclass(frozen=True)
+class BatchRow(metaclass=ValidatedDataClass):
+    """
+    @dataclass(frozen=True)
+    class BatchRow(metaclass=ValidatedDataClass):
+        prefix:  str
+        site:    str|None
+        system:  str|None
+        variant: str|None
+
+
+    One row of a batch manifest: the environment at `prefix` gets an mpi4py
+    built for `site`, `system` and `variant` (`None` => automatic).
+    """
+
+    prefix:  str
+    site:    str|None = None
+    system:  str|None = None
+    variant: str|None = None
+
+
+    @property
+    def python(self) -> str:
+        """
+        python -> str
+
+
+        Path to the python interpreter of the environment at `prefix`
+        """
+        return str(Path(self.prefix) / "bin" / "python")
+
+
+    @property
+    def key(self) -> str:
+        """
+        key -> str
+
+
+        Hash identifying this row -- identical rows have identical keys.
+        """
+        return dict_hash(asdict(self))
+
+
+@dataclass
+class BatchBuild:
+    """
+    @dataclass
+    class BatchBuild:
+        key:     str
+        python:  str
+        pip_cmd: str
+        init:    str|None
+        rows:    list[tuple[BatchRow, str, str, str]]
+
+
+    A single mpi4py build shared by all `rows` -- each row is stored together
+    with its resolved (site, system, variant). Rows share a build if their
+    interpreters have the same ABI and their MPIConfig and `init` are the same
+    -- or, for ABI-portable builds, if their MPI libraries are of the same ABI
+    family.
+    """
+
+    key:     str
+    python:  str
+    pip_cmd: str
+    init:    str|None
+    rows:    list[tuple[BatchRow, str, str, str]] = field(default_factory=list)
+
+
+def load_manifest(manifest: Path) -> list[BatchRow]:
+    """
+    load_manifest(manifest: Path) -> list[BatchRow]
+
+
+    Load a csv manifest with the header `prefix,site,system,variant`. Blank
+    lines and lines starting with `#` are ignored, as are empty cells (which
+    are treated as `None`). Duplicate rows are only returned once.
+    """
+
+    logger.debug(f"Loading batch manifest: {manifest}")
+
+    rows: dict[str, BatchRow] = dict()
+    with open(manifest, "r", newline="") as f:
+        lines = (
+            l for l in f if l.strip() and not l.lstrip().startswith("#")
+        )
+        for entry in csv.DictReader(lines):
+            unknown = set(entry.keys()) - set(MANIFEST_FIELDS)
+            if unknown:
+                raise RuntimeError(
+                    f"Unknown columns {unknown} in {manifest}"
+                )
+
+            entry = {
+                k: v.strip() if v and v.strip() else None
+                for k, v in entry.items()
+            }
+            if entry.get("prefix") is None:
+                raise RuntimeError(f"Row without a prefix in {manifest}")
+
+            row = BatchRow(**entry)
+            if row.key in rows:
+                logger.info(f"Skipping duplicate manifest row: {row}")
+                continue
+            rows[row.key] = row
+
+    logger.debug(f"Loaded {len(rows)} rows")
+    return list(rows.values())
+
+
+class Checkpoint:
+    """
+    Progress of a batch run, persisted as json after every change. Rows that
+    have completed successfully, as well as wheels that have been built, are
+    not redone when a batch run is resumed.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.rows: dict[str, dict] = dict()
+        self.wheels: dict[str, str] = dict()
+
+        if self.path.is_file():
+            logger.info(f"Resuming from checkpoint: {self.path}")
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            self.rows = data.get("rows", dict())
+            self.wheels = data.get("wheels", dict())
+
+
+    def done(self, row: BatchRow) -> bool:
+        return self.rows.get(row.key, dict()).get("status") == "done"
+
+
+    def wheel(self, build_key: str) -> Path|None:
+        wheel = self.wheels.get(build_key)
+        if wheel is None or not Path(wheel).is_file():
+            return None
+        return Path(wheel)
+
+
+    def update_row(self, row: BatchRow, **record):
+        with self._lock:
+            self.rows.setdefault(row.key, asdict(row)).update(record)
+            self._save()
+
+
+    def set_wheel(self, build_key: str, wheel: Path):
+        with self._lock:
+            self.wheels[build_key] = str(wheel)
+            self._save()
+
+
+    def _save(self):
+        # Write to a temporary file first, so that an interrupted run never
+        # leaves behind a truncated checkpoint
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"rows": self.rows, "wheels": self.wheels}, f, indent=2)
+        os.replace(tmp, self.path)
+
+
+def row_sanity(
+            row: BatchRow, site: str, system: str, variant: str,
+            path: tuple[str, ...] = (), env: dict[str, str]|None = None
+        ) -> bool:
+    """
+    row_sanity(
+            row: BatchRow, site: str, system: str, variant: str,
+            path: tuple[str, ...] = (), env: dict[str, str]|None = None
+        ) -> bool
+
+
+    Run the site's sanity check using the interpreter of `row` (in `env`),
+    with `path` (eg. the staged install) prepended to its PYTHONPATH.
+    """
+
+    return run_sanity(row.python, site, system, variant, path=path, env=env)
+
+
+class BatchScheduler:
+    """
+    Installs mpi4py for each row of a batch manifest. Identical builds are
+    deduplicated, and the work is split into two bounded worker pools: one
+    for compiling (`compile_slots`) and one for installing wheels into the
+    target environments (`install_slots`). Each row is installed like a
+    single install: the wheel is staged and checked while the current
+    install stays live, then swapped in -- and rolled back if the check of
+    the live install fails. Environments in the system prefix are skipped
+    unless `overwrite_system`. With `abi_portable`, rows whose MPI libraries
+    are of the same ABI family share an ABI-portable build, and each row's
+    activation script selects its own MPI library.
+    """
+
+    def __init__(
+                self, rows: list[BatchRow], checkpoint: Checkpoint,
+                work_dir: Path, compile_slots: int = 1, install_slots: int = 4,
+                abi_portable: bool = False, overwrite_system: bool = False
+            ):
+        self.rows = rows
+        self.checkpoint = checkpoint
+        self.work_dir = Path(work_dir)
+        self.compile_slots = compile_slots
+        self.install_slots = install_slots
+        self.abi_portable = abi_portable
+        self.overwrite_system = overwrite_system
+        # resolved configs of the rows
+        self.configs: dict[str, MPIConfig] = dict()
+        # runtime environments of the rows with ABI-portable builds
+        self.run_envs: dict[str, dict[str, str]] = dict()
+
+
+    def plan(self) -> list[BatchBuild]:
+        """
+        plan(self) -> list[BatchBuild]
+
+
+        Resolve the site, system, variant and build configuration of every row
+        that has not been completed yet, and group these rows by build.
+        """
+
+        builds: dict[str, BatchBuild] = dict()
+        envs: dict[str|None, dict[str, str]] = dict()
+        for row in self.rows:
+            if self.checkpoint.done(row):
+                logger.info(f"Skipping completed row: {row}")
+                continue
+
+            try:
+                site = resolve_site(row.site)
+                system = row.system or site.determine_system()
+                variant = row.variant or site.auto_variant(system)
+                config = site.config(system, variant)
+                if config.packages is not None:
+                    raise RuntimeError(
+                        "MPI-aware packages are only built by single installs"
+                    )
+                profile = site_profile(site, system, None)
+                if profile is not None:
+                    config = config.with_profile(*profile)
+                init = site.init(system, variant)
+                key = dict_hash({
+                    "abi": python_abi(row.python),
+                    "config": config.fingerprint,
+                    "init": init
+                })
+
+                family = None
+                if self.abi_portable:
+                    if init not in envs:
+                        envs[init] = init_env(init)
+                    family = abi_family(config, env=envs[init])
+                if family is not None:
+                    config = config.portable()
+                    key = dict_hash({
+                        "abi": python_abi(row.python),
+                        "config": config.portable_fingerprint,
+                        "mpiabi": family
+                    })
+                    self.run_envs[row.key] = select_libmpi(config, envs[init])
+            except Exception as e:
+                logger.critical(f"Could not resolve {row}: {e}")
+                self.checkpoint.update_row(
+                    row, status="failed", phase="resolve", error=str(e)
+                )
+                continue
+
+            self.configs[row.key] = config
+            if key not in builds:
+                builds[key] = BatchBuild(
+                    key=key, python=row.python,
+                    pip_cmd=pip_cmd(config, python=row.python), init=init
+                )
+            site_name = Path(site.__file__).stem
+            builds[key].rows.append((row, site_name, system, variant))
+
+        logger.info(
+            f"Planned {len(builds)} builds for "
+            f"{sum(len(b.rows) for b in builds.values())} rows"
+        )
+        return list(builds.values())
+
+
+    def run(self) -> dict[str, dict]:
+        """
+        run(self) -> dict[str, dict]
+
+
+        Build and install everything in `plan`. Returns the checkpoint records
+        of all rows.
+        """
+
+        builds = self.plan()
+
+        with ThreadPoolExecutor(self.compile_slots) as compile_pool, \
+                ThreadPoolExecutor(self.install_slots) as install_pool:
+
+            installs: list[Future] = list()
+            compiles: dict[Future, BatchBuild] = dict()
+            for build in builds:
+                wheel = self.checkpoint.wheel(build.key)
+                if wheel is not None:
+                    logger.info(f"Reusing wheel from checkpoint: {wheel}")
+                    installs += self._submit_installs(
+                        install_pool, build, wheel, 0.
+                    )
+                else:
+                    compiles[compile_pool.submit(self._compile, build)] = build
+
+            for future in as_completed(compiles):
+                build = compiles[future]
+                try:
+                    wheel, build_time, usage = future.result()
+                except Exception as e:
+                    logger.critical(f"Build {build.key} failed: {e}")
+                    for row, *_ in build.rows:
+                        self.checkpoint.update_row(
+                            row, status="failed", phase="build", error=str(e)
+                        )
+                    continue
+
+                for row, *_ in build.rows:
+                    self.checkpoint.update_row(
+                        row, build_cpu=usage.cpu, build_maxrss=usage.maxrss
+                    )
+                installs += self._submit_installs(
+                    install_pool, build, wheel, build_time
+                )
+
+            for future in as_completed(installs):
+                future.result()
+
+        return {row.key: self.checkpoint.rows[row.key] for row in self.rows}
+
+
+    def _compile(
+                self, build: BatchBuild
+            ) -> tuple[Path, float, ResourceUsage]:
+        logger.info(f"Building {build.key} using {build.python}")
+
+        start = time.perf_counter()
+        wheel_dir = self.work_dir / build.key
+        if wheel_dir.exists():
+            shutil.rmtree(wheel_dir)
+        wheel_dir.mkdir(parents=True)
+
+        with span("batch.compile", build=build.key, python=build.python):
+            wheel, usage = pip_build_mpi4py(
+                build.pip_cmd, wheel_dir, build.init
+            )
+        self.checkpoint.set_wheel(build.key, wheel)
+
+        return wheel, time.perf_counter() - start, usage
+
+
+    def _submit_installs(
+                self, pool: ThreadPoolExecutor, build: BatchBuild,
+                wheel: Path, build_time: float
+            ) -> list[Future]:
+        return [
+            pool.submit(
+                self._install, row, site, system, variant, wheel, build_time,
+                len(build.rows) > 1
+            )
+            for row, site, system, variant in build.rows
+        ]
+
+
+    def _install(
+                self, row: BatchRow, site: str, system: str, variant: str,
+                wheel: Path, build_time: float, shared: bool
+            ):
+        record = {
+            "site": site, "system": system, "variant": variant,
+            "build_time": build_time, "shared_build": shared
+        }
+
+        phase = "inspect"
+        try:
+            config = self.configs[row.key]
+            paths = interpreter_paths(row.python)
+            if config.in_system_prefix(paths["prefix"]) \
+                    and not self.overwrite_system:
+                raise RuntimeError(
+                    f"{row.python} is in the system prefix (use "
+                    "--overwrite_system)"
+                )
+            location = Path(paths["platlib"])
+            run_env = self.run_envs.get(row.key)
+
+            with location_lock(location):
+                phase = "install"
+                start = time.perf_counter()
+                with span("batch.stage", prefix=row.prefix):
+                    staging = stage_wheel(wheel, location, python=row.python)
+                record["install_time"] = time.perf_counter() - start
+
+                phase = "sanity"
+                start = time.perf_counter()
+                with span("batch.sanity", prefix=row.prefix):
+                    sanity = row_sanity(
+                        row, site, system, variant, path=(str(staging),),
+                        env=run_env
+                    )
+                record["sanity_time"] = time.perf_counter() - start
+                if not sanity:
+                    shutil.rmtree(staging)
+                    raise RuntimeError(
+                        "sanity check failed, kept current install"
+                    )
+
+                phase = "swap"
+                with span("batch.swap", prefix=row.prefix):
+                    swap_in(staging, location)
+
+                phase = "sanity"
+                if not row_sanity(row, site, system, variant, env=run_env):
+                    rollback(location)
+                    raise RuntimeError("sanity check failed, rolled back")
+
+            # ABI-portable build => jobs select the row's MPI library
+            if run_env is not None:
+                phase = "activate"
+                write_activation_script(
+                    activation_path(row.prefix), run_env, config,
+                    comment=f"{system=}, {variant=}"
+                )
+        except Exception as e:
+            logger.critical(f"{phase} failed for {row.prefix}: {e}")
+            self.checkpoint.update_row(
+                row, status="failed", phase=phase, error=str(e), **record
+            )
+            return
+
+        logger.info(f"Installed mpi4py into {row.prefix}")
+        self.checkpoint.update_row(
+            row, status="done", phase=None, error=None, **record
+        )
+
+
+def report(records: dict[str, dict]) -> str:
+    """
+    report(records: dict[str, dict]) -> str
+
+
+    Format the checkpoint records of a batch run as a table with one line per
+    row, followed by the failures.
+    """
+
+    def seconds(record, key):
+        value = record.get(key)
+        return "-" if value is None else f"{value:.1f}s"
+
+    lines = [
+        f"{'status':8} {'build':>9} {'cpu':>9} {'maxrss':>9} {'install':>9} "
+        f"{'sanity':>9}  prefix (site/system/variant)"
+    ]
+    failures = list()
+    for record in records.values():
+        build = seconds(record, "build_time")
+        if record.get("shared_build"):
+            build = "*" + build
+        maxrss = record.get("build_maxrss")
+        maxrss = "-" if maxrss is None else f"{maxrss/1024:.0f}MiB"
+        lines.append(" ".join([
+            f"{record.get('status', 'pending'):8}", f"{build:>9}",
+            f"{seconds(record, 'build_cpu'):>9}", f"{maxrss:>9}",
+            f"{seconds(record, 'install_time'):>9}",
+            f"{seconds(record, 'sanity_time'):>9} ",
+            f"{record['prefix']} ({record.get('site')}/{record.get('system')}"
+            f"/{record.get('variant')})"
+        ]))
+        if record.get("status") != "done":
+            failures.append(
+                f"  {record['prefix']}: {record.get('phase')} -- "
+                f"{record.get('error')}"
+            )
+
+    lines.append("(* = build shared with other rows)")
+    if failures:
+        lines.append(f"{len(failures)} failures:")
+        lines += failures
+
+    return "\n".join(lines)
+
+
+def run_batch(
+            manifest: Path, checkpoint: Path|None = None,
+            compile_slots: int = 1, install_slots: int = 4,
+            abi_portable: bool = False, overwrite_system: bool = False
+        ) -> int:
+    """
+    run_batch(
+            manifest: Path, checkpoint: Path|None = None,
+            compile_slots: int = 1, install_slots: int = 4,
+            abi_portable: bool = False, overwrite_system: bool = False
+        ) -> int
+
+
+    Install mpi4py into every environment listed in `manifest`, and print a
+    report. Progress is recorded in `checkpoint` (default:
+    `<manifest>.checkpoint.json`) -- rerunning an interrupted batch resumes
+    from there. Returns 0 only if all rows were installed successfully.
+    `abi_portable` shares builds between MPI libraries of the same ABI family.
+    Environments in the system prefix are only replaced with
+    `overwrite_system`.
+    """
+
+    manifest = Path(manifest)
+    if checkpoint is None:
+        checkpoint = manifest.with_name(manifest.name + ".checkpoint.json")
+    work_dir = Path(checkpoint).with_name(manifest.name + ".wheels")
+
+    scheduler = BatchScheduler(
+        load_manifest(manifest), Checkpoint(checkpoint), work_dir,
+        compile_slots=compile_slots, install_slots=install_slots,
+        abi_portable=abi_portable, overwrite_system=overwrite_system
+    )
+    records = scheduler.run()
+    print(report(records))
+
+    if all(r.get("status") == "done" for r in records.values()):
+        # Everything is installed => built wheels are no longer needed
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return 0
+    return 1
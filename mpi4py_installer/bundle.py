@@ -0,0 +1,192 @@
+from .         import logger
+from .bytecode import precompile
+from .locking  import single_flight
+from .swap     import installed_entries
+
+import argparse
+import io
+import json
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+
+from pathlib import Path
+
+
+# Written at the top of every bundle
+BUNDLE_META = "bundle.json"
+
+# Staging root for bundles (default: the first writable of BUNDLE_ROOTS)
+BUNDLE_ROOT_VAR = "MPI4PY_BUNDLE_ROOT"
+BUNDLE_ROOTS = ("/dev/shm", "/tmp")
+
+
+def bundle_name(fingerprint: str) -> str:
+    """
+    bundle_name(fingerprint: str) -> str
+
+
+    Name of the bundle of the mpi4py build with `fingerprint` -- this is also
+    the name of the directory that the bundle is staged into.
+    """
+
+    return f"mpi4py-bundle-{fingerprint}"
+
+
+def export_bundle(
+            location: Path, dest: Path, fingerprint: str,
+            meta: dict|None = None
+        ) -> Path:
+    """
+    export_bundle(
+            location: Path, dest: Path, fingerprint: str,
+            meta: dict|None = None
+        ) -> Path
+
+
+    Package the mpi4py installed in `location` (a site-packages directory)
+    into the (uncompressed) tar archive `dest`, together with precompiled
+    bytecode and a bundle.json with the build `fingerprint` and `meta`. All
+    files are in a single top-level directory, so the archive can be copied
+    to (or broadcast to) each node as-is. Returns `dest`.
+    """
+
+    entries = installed_entries(location, "mpi4py")
+    if not entries:
+        raise RuntimeError(f"mpi4py is not installed in {location}")
+
+    name = bundle_name(fingerprint)
+    with tempfile.TemporaryDirectory(prefix="mpi4py-bundle-") as work:
+        root = Path(work) / name
+        root.mkdir()
+        for entry in entries:
+            src = location / entry
+            if src.is_dir():
+                shutil.copytree(src, root / entry, symlinks=True)
+            else:
+                shutil.copy2(src, root / entry)
+
+        # Ranks import from the bundle straight away => compile ahead of time
+        # (unchecked-hash pycs stay valid wherever the bundle is staged)
+        if not precompile([root]):
+            raise RuntimeError("Could not compile the mpi4py bytecode")
+
+        info = {"fingerprint": fingerprint, "entries": entries, **(meta or {})}
+        data = json.dumps(info, indent=2).encode()
+
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.{os.getpid()}")
+        with tarfile.open(tmp, "w") as tar:
+            tarinfo = tarfile.TarInfo(f"{name}/{BUNDLE_META}")
+            tarinfo.size = len(data)
+            tar.addfile(tarinfo, io.BytesIO(data))
+            for entry in entries:
+                tar.add(root / entry, arcname=f"{name}/{entry}")
+        os.replace(tmp, dest)
+
+    logger.info(f"Exported mpi4py bundle: {dest}")
+    return dest
+
+
+def bundle_root(root: str|Path|None = None) -> Path:
+    """
+    bundle_root(root: str|Path|None = None) -> Path
+
+
+    Node-local directory that bundles are staged into: `root`, or
+    $MPI4PY_BUNDLE_ROOT, or else the first writable of /dev/shm and /tmp.
+    """
+
+    if root is None:
+        root = os.environ.get(BUNDLE_ROOT_VAR)
+    if root is not None:
+        return Path(root)
+
+    for candidate in BUNDLE_ROOTS:
+        if os.access(candidate, os.W_OK):
+            return Path(candidate)
+
+    raise RuntimeError(f"No writable node-local directory in {BUNDLE_ROOTS}")
+
+
+def stage_bundle(
+            archive: str|Path, root: str|Path|None = None,
+            timeout: float = 600
+        ) -> Path:
+    """
+    stage_bundle(
+            archive: str|Path, root: str|Path|None = None,
+            timeout: float = 600
+        ) -> Path
+
+
+    Extract the bundle `archive` into the node-local `root` (c.f.
+    `bundle_root`), unless it's already there. All ranks on a node can call
+    this at the same time: only one of them extracts the archive, while the
+    others wait for it. Returns the staged directory.
+    """
+
+    root = bundle_root(root)
+    archive = Path(archive)
+    with tarfile.open(archive) as tar:
+        name = tar.next().name.split("/")[0]
+    target = root / name
+
+    def lookup():
+        return target if (target / BUNDLE_META).is_file() else None
+
+    def extract():
+        tmp = Path(tempfile.mkdtemp(dir=root, prefix=f".{name}."))
+        try:
+            with tarfile.open(archive) as tar:
+                tar.extractall(tmp, filter="data")
+            # atomic: the bundle is complete, or isn't there
+            os.rename(tmp / name, target)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        logger.info(f"Staged mpi4py bundle: {target}")
+        return target
+
+    root.mkdir(parents=True, exist_ok=True)
+    staged, _ = single_flight(
+        root / f".{name}.lock", extract, lookup, timeout=timeout, poll=0.05
+    )
+    return staged
+
+
+def activate_bundle(
+            archive: str|Path, root: str|Path|None = None
+        ) -> Path:
+    """
+    activate_bundle(
+            archive: str|Path, root: str|Path|None = None
+        ) -> Path
+
+
+    Stage the bundle `archive` (c.f. `stage_bundle`), and prepend it to
+    `sys.path` => the following `import mpi4py` uses the node-local copy.
+    Returns the staged directory.
+    """
+
+    staged = stage_bundle(archive, root)
+    if str(staged) not in sys.path:
+        sys.path.insert(0, str(staged))
+    return staged
+
+
+if __name__ == "__main__":
+    # Job-start helper: prints the directory to prepend to PYTHONPATH
+    parser = argparse.ArgumentParser(
+        prog="python -m mpi4py_installer.bundle",
+        description="Stage an mpi4py bundle into node-local storage"
+    )
+    parser.add_argument("archive", type=str, help="Bundle archive")
+    parser.add_argument(
+        "--root", type=str,
+        help=f"Node-local directory (default: ${BUNDLE_ROOT_VAR}, "
+             f"or the first writable of {', '.join(BUNDLE_ROOTS)})"
+    )
+    args = parser.parse_args()
+    print(stage_bundle(args.archive, args.root))
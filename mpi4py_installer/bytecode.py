@@ -0,0 +1,139 @@
+from . import logger
+
+import compileall
+import json
+import os
+import subprocess
+import sys
+
+from pathlib    import Path
+from py_compile import PycInvalidationMode
+
+
+# Run by the interpreter under test: count the file system accesses of the
+# source loader while importing a module (outside of the standard library).
+# MPI is not initialized.
+IMPORT_PROBE = """
+import json, sys, sysconfig
+from importlib.machinery import SourceFileLoader
+
+stdlib = sysconfig.get_paths()["stdlib"]
+
+counts = {"source_stats": 0, "source_reads": 0, "pyc_writes": 0}
+path_stats, get_data, set_data = (
+    SourceFileLoader.path_stats, SourceFileLoader.get_data,
+    SourceFileLoader.set_data
+)
+
+def counting_path_stats(self, path):
+    counts["source_stats"] += not path.startswith(stdlib)
+    return path_stats(self, path)
+
+def counting_get_data(self, path):
+    counts["source_reads"] += path.endswith(".py") \\
+        and not path.startswith(stdlib)
+    return get_data(self, path)
+
+def counting_set_data(self, path, data, **kwargs):
+    counts["pyc_writes"] += not path.startswith(stdlib)
+    return set_data(self, path, data, **kwargs)
+
+SourceFileLoader.path_stats = counting_path_stats
+SourceFileLoader.get_data = counting_get_data
+SourceFileLoader.set_data = counting_set_data
+
+__import__(sys.argv[1])
+print(json.dumps(counts))
+"""
+
+
+def precompile(
+            paths: list[Path], optimize: tuple[int, ...] = (0,),
+            workers: int = 1,
+            mode: PycInvalidationMode = PycInvalidationMode.UNCHECKED_HASH
+        ) -> bool:
+    """
+    precompile(
+            paths: list[Path], optimize: tuple[int, ...] = (0,),
+            workers: int = 1,
+            mode: PycInvalidationMode = PycInvalidationMode.UNCHECKED_HASH
+        ) -> bool
+
+
+    Compile all python files in `paths` to unchecked-hash pycs (or to pycs of
+    another invalidation `mode`), for each of the `optimize` levels. These are
+    valid regardless of the source's mtime, and the source is never read to
+    validate them => they don't go stale when the tree is copied, and ranks
+    don't recompile (and try to write) them. Returns False if any file failed
+    to compile.
+    """
+
+    ok = True
+    for path in paths:
+        if path.is_dir():
+            ok &= bool(compileall.compile_dir(
+                path, quiet=1, force=True, optimize=list(optimize),
+                invalidation_mode=mode, workers=workers
+            ))
+        elif path.suffix == ".py":
+            ok &= bool(compileall.compile_file(
+                path, quiet=1, force=True, optimize=list(optimize),
+                invalidation_mode=mode
+            ))
+
+    logger.info(f"Precompiled bytecode ({optimize=}) in {len(paths)} paths")
+    return ok
+
+
+def import_accesses(
+            python: str = sys.executable, module: str = "mpi4py.MPI",
+            path: tuple[str, ...] = (), optimize: int = 0
+        ) -> dict[str, int]:
+    """
+    import_accesses(
+            python: str = sys.executable, module: str = "mpi4py.MPI",
+            path: tuple[str, ...] = (), optimize: int = 0
+        ) -> dict[str, int]
+
+
+    Count the source stats, source reads and pyc writes that importing
+    `module` (in a fresh `python` process, with `path` prepended to its
+    PYTHONPATH, at the `optimize` level) performs. Raises RuntimeError if the
+    import fails.
+    """
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in [*path, env.get("PYTHONPATH")] if p
+    )
+    # only the import is measured
+    env["MPI4PY_RC_INITIALIZE"] = "0"
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+
+    out = subprocess.run(
+        [python, *["-O"]*optimize, "-c", IMPORT_PROBE, module],
+        capture_output=True, env=env
+    )
+    if out.returncode != 0:
+        raise RuntimeError(f"Could not import {module}: {out.stderr.decode()}")
+
+    return json.loads(out.stdout.decode().splitlines()[-1])
+
+
+def report(before: dict[str, int], after: dict[str, int]) -> str:
+    """
+    report(before: dict[str, int], after: dict[str, int]) -> str
+
+
+    Format the `import_accesses` counts before and after precompiling.
+    """
+
+    width = max(len(name) for name in [*before, "import accesses"])
+    lines = [f"{'import accesses':{width}} {'before':>7} {'after':>7}"]
+    for name in before:
+        lines.append(f"{name:{width}} {before[name]:>7} {after[name]:>7}")
+    lines.append(
+        "(source stats remain: the import system stats each source before "
+        "reading its pyc)"
+    )
+    return "\n".join(lines)
@@ -1,9 +1,26 @@
-from . import logger, load_site, load_user_site, pip_find_mpi4py, pip_cmd, \
-    pip_uninstall_mpi4py, pip_install_mpi4py
+from . import logger, init_env, build_fingerprint, python_abi
 
-from .sites import auto_site, Site
+from .sites       import resolve_site, Site, site_packages
+from .api         import install, resolve, wheel_stores
+from .batch       import run_batch
+from .matrix      import BuildMatrix, report
+from .            import microbench, bytecode, probe, telemetry, topology
+from .bundle      import export_bundle
+from .daemon      import remote_install, ping, request, serve, socket_path
+from .discovery   import discover, site_config, write_site
+from .fingerprint import libmpi
+from .packages    import check_packages
+from .swap        import install_location, rollback
+from .tracing     import TRACER, span
 
 import argparse
+import atexit
+import json
+import os
+import sys
+import time
+
+from pathlib import Path
 
 
 def run():
@@ -47,6 +64,153 @@ def run():
         "--overwrite_system", action="store_true",
         help="Overwrite system prefix"
     )
+    parser.add_argument(
+        "--sanity-only", action="store_true",
+        help="Only run the sanity check on the installed mpi4py"
+    )
+    parser.add_argument(
+        "--batch", type=str, metavar="MANIFEST",
+        help="Install into every environment listed in the MANIFEST csv"
+    )
+    parser.add_argument(
+        "--checkpoint", type=str,
+        help="Batch progress file (default=MANIFEST.checkpoint.json)"
+    )
+    parser.add_argument(
+        "--compile-slots", type=int, default=1,
+        help="Number of concurrent builds: of mpi4py in batch mode and in the "
+             "daemon, and of MPI-aware packages (default=1)"
+    )
+    parser.add_argument(
+        "--install-slots", type=int, default=4,
+        help="Number of concurrent installs in batch mode (default=4)"
+    )
+    parser.add_argument(
+        "--wheelhouse", type=str, metavar="DIR",
+        help="Use the prebuilt wheels in DIR (default: the site's wheelhouse)"
+    )
+    parser.add_argument(
+        "--no-wheelhouse", action="store_true",
+        help="Always build mpi4py, even if a prebuilt (or cached) wheel is "
+             "available"
+    )
+    parser.add_argument(
+        "--publish", action="store_true",
+        help="Build mpi4py and publish the wheel to the wheelhouse"
+    )
+    parser.add_argument(
+        "--lock-timeout", type=float, default=3600,
+        help="Seconds to wait for a concurrent build of the same mpi4py "
+             "configuration (default=3600)"
+    )
+    parser.add_argument(
+        "--profile", type=str,
+        help="Build profile (optimization flags) to use (default: the "
+             "system's 'default' profile, if it has one)"
+    )
+    parser.add_argument(
+        "--microbench", action="store_true",
+        help="Measure the call overhead of the new mpi4py (and compare it to "
+             "the current install)"
+    )
+    parser.add_argument(
+        "--pgo", action="store_true",
+        help="Profile-guided optimization: build an instrumented mpi4py, run "
+             "a training workload using mpiexec, and rebuild using the profile"
+    )
+    parser.add_argument(
+        "--python", type=str, metavar="PY1,PY2,...",
+        help="Install mpi4py for each of these (comma separated) python "
+             "interpreters concurrently (default: this interpreter)"
+    )
+    parser.add_argument(
+        "--rollback", action="store_true",
+        help="Restore the mpi4py install that was replaced by the last install"
+    )
+    parser.add_argument(
+        "--precompile", type=str, choices=["mpi4py", "env"],
+        help="After installing, compile the bytecode of mpi4py (or of the "
+             "whole env) to unchecked-hash pycs"
+    )
+    parser.add_argument(
+        "--precompile-optimize", type=str, default="0", metavar="LEVELS",
+        help="Comma separated optimization levels to precompile (default=0)"
+    )
+    parser.add_argument(
+        "--sweep", type=int, metavar="N",
+        help="Run a sanity probe on N nodes using the site's MPI launcher, "
+             "and summarize the MPI library and startup times per node"
+    )
+    parser.add_argument(
+        "--sweep-ppn", type=int, default=1,
+        help="Ranks per node for --sweep and --probe (default=1)"
+    )
+    parser.add_argument(
+        "--probe", type=int, metavar="N",
+        help="Time job startup (python startup, importing mpi4py and "
+             "mpi4py.MPI, and MPI_Init) on every rank of N nodes, and "
+             "summarize the distributions"
+    )
+    parser.add_argument(
+        "--probe-layouts", type=str, default="installed",
+        help="Comma separated install layouts to compare with --probe: "
+             f"{', '.join(probe.LAYOUTS)}, or all (default=installed)"
+    )
+    parser.add_argument(
+        "--probe-repeat", type=int, default=1,
+        help="Number of launches per layout with --probe (default=1)"
+    )
+    parser.add_argument(
+        "--export-bundle", type=str, metavar="FILE",
+        help="Package the installed mpi4py (with precompiled bytecode) into "
+             "the archive FILE, for staging on node-local storage"
+    )
+    parser.add_argument(
+        "--activate-script", type=str, metavar="FILE",
+        help="Where to write the activation script (default: "
+             "$PREFIX/etc/mpi4py-activate.sh)"
+    )
+    parser.add_argument(
+        "--stats", action="store_true",
+        help="Summarize the install history (durations, failures, build "
+             "time trends)"
+    )
+    parser.add_argument(
+        "--abi-portable", action="store_true",
+        help="Share one build between all variants whose MPI libraries have "
+             "the same ABI (eg. MPICH-compatible), and select the variant's "
+             "MPI library at runtime"
+    )
+    parser.add_argument(
+        "--discover", type=str, nargs="?", const="", metavar="NAME",
+        help="Find the MPI compiler wrappers on this machine, and print a site "
+             "json with one variant per toolchain (or save it as the user "
+             "site NAME)"
+    )
+    parser.add_argument(
+        "--daemon", type=str, choices=["start", "stop", "status"],
+        help="Start (in the foreground), stop, or query the installer daemon: "
+             "while it is running, installs are done by the daemon (with warm "
+             "caches)"
+    )
+    parser.add_argument(
+        "--no-daemon", action="store_true",
+        help="Don't use the installer daemon, even if it is running"
+    )
+    parser.add_argument(
+        "--variant-policy", type=str, choices=topology.POLICIES,
+        help="How the default variant is picked: the site's default variant "
+             "(static), or the one that fits this node's hardware (topology) "
+             "(default: $MPI4PY_INSTALLER_VARIANT_POLICY, or static)"
+    )
+    parser.add_argument(
+        "--trace", type=str, metavar="FILE",
+        help="Record the time spent in each step of the installer to FILE"
+    )
+    parser.add_argument(
+        "--trace-format", type=str, default="chrome", choices=["chrome", "json"],
+        help="Trace format: Chrome trace events, or a json timeline (default=chrome)"
+    )
 
     args = parser.parse_args()
 
@@ -54,43 +218,102 @@ def run():
     logger.setLevel(args.log_level)
     logger.debug(f"Runtime arguments={args}")
 
-    # Populate settings on any configured sites -- this is a signleton class,
-    # once constructed, the constructor does not search for site modules
-    # again -- instead using the cached information.
-    site_info = Site()
+    # The variant policy is read from the environment => it also reaches the
+    # batch rows, and the daemon (whose clients must agree on it)
+    if args.variant_policy is not None:
+        os.environ["MPI4PY_INSTALLER_VARIANT_POLICY"] = args.variant_policy
 
-    # Load site -- if no site is provided, use the auto_site function, which
-    # will run check_site for each of the available sites.
-    if args.site is None:
-        dsite, flag = auto_site()
-        if dsite == None:
-            logger.critical(
-                "Could not decide on which site to use automatically."
-            )
-            print("Valid sites are:")
-            print(f"In mpi4py_installer.sites: {site_info.sites}")
-            print(f"In {site_info.user_path}: {site_info.user_sites}")
-            raise RuntimeError("You must specify a site")
+    # Enable tracing -- the trace is written when the installer exits
+    if args.trace is not None:
+        TRACER.enable()
+        atexit.register(TRACER.write, args.trace, args.trace_format)
 
-        logger.info(f"Determined site as: {dsite}")
+    # If the CLI specifies a batch manifest, then each row of the manifest
+    # selects its own site, system and variant => skip the rest of the CLI.
+    if args.batch is not None:
+        exit(run_batch(
+            args.batch, checkpoint=args.checkpoint,
+            compile_slots=args.compile_slots, install_slots=args.install_slots,
+            abi_portable=args.abi_portable,
+            overwrite_system=args.overwrite_system
+        ))
 
-        assert dsite is not None  # coerce mypy type narrowing
-        if flag:
-            site = load_user_site(dsite, site_info.user_path)
-        else:
-            site = load_site(dsite)
-    else:
-        if args.site in site_info.sites:
-            site = load_site(args.site)
-        elif args.sfite in site_info.user_sites:
-            site = load_user_site(args.site, site_info.user_path)
+    # Summarize the install telemetry => nothing else to do
+    if args.stats:
+        print(telemetry.stats())
+        exit(0)
+
+    # Generate a site from the MPI toolchains found on this machine => nothing
+    # else to do
+    if args.discover is not None:
+        config = site_config(
+            discover(), system="default" if args.system is None else args.system
+        )
+        if args.discover == "":
+            print(json.dumps(config, indent=4))
         else:
-            mod_sites = site_info.sites
-            usr_sites = site_info.user_sites
-            logger.critical(
-                f"Site {args.site} not in {mod_sites=} nor {usr_sites=}"
-            )
-            raise RuntimeError(f"{args.site} could not be found")
+            write_site(args.discover, config, Site().user_path)
+        exit(0)
+
+    # Manage the installer daemon => nothing else to do
+    if args.daemon == "start":
+        serve(socket_path(), workers=args.compile_slots)
+        exit(0)
+    if args.daemon == "status":
+        status = ping()
+        if status is None:
+            print(f"No daemon running at {socket_path()}")
+            exit(1)
+        print(f"Daemon {status['pid']} ({status['python']}) at {socket_path()}")
+        exit(0)
+    if args.daemon == "stop":
+        if ping() is None:
+            print(f"No daemon running at {socket_path()}")
+            exit(1)
+        request("shutdown")
+        exit(0)
+
+    # Swap the previous mpi4py install back in => nothing else to do
+    if args.rollback:
+        exit(0 if rollback(install_location(args.user)) else 1)
+
+    # Plain installs are done by the daemon, if one is running (and serves
+    # this environment) -- otherwise (result is None) in this process. The
+    # daemon has its own working directory => paths are sent as absolute paths
+    result = None
+    if not args.no_daemon and args.python is None and args.trace is None \
+            and not (args.show_systems or args.show_variants) \
+            and not (args.sanity_only or args.no_wheelhouse) \
+            and args.export_bundle is None and args.precompile is None \
+            and args.sweep is None and args.probe is None:
+        result = remote_install(
+            site=args.site, system=args.system, variant=args.variant,
+            profile=args.profile, python=sys.executable, user=args.user,
+            overwrite_system=args.overwrite_system,
+            wheelhouse=_absolute(args.wheelhouse), publish=args.publish,
+            lock_timeout=args.lock_timeout, pgo=args.pgo,
+            run_microbench=args.microbench, compile_slots=args.compile_slots,
+            activate_script=_absolute(args.activate_script),
+            abi_portable=args.abi_portable
+        )
+    if result is not None:
+        logger.info("Installed by the daemon")
+        report_install(result)
+
+    # Load site -- if no site is provided, `resolve_site` uses the auto_site
+    # function, which will run check_site for each of the available sites.
+    # The site module is passed on => it is resolved only once.
+    try:
+        with span("load_site", site=args.site):
+            site = resolve_site(args.site)
+    except RuntimeError:
+        # Populate settings on any configured sites -- this is a signleton
+        # class => the site modules were already searched by `resolve_site`
+        site_info = Site()
+        print("Valid sites are:")
+        print(f"In mpi4py_installer.sites: {site_info.sites}")
+        print(f"In {site_info.user_path}: {site_info.user_sites}")
+        raise
 
     # If the CLI specifies `show_systems`, then print all avaialble systems,
     # and exist (do not install anything). The result returned by `determine
@@ -111,7 +334,8 @@ def run():
     # Set the system using `determine_system` -- the CLI flag can be used to
     # overwrite the output from `determine_system`.
     if args.system is None:
-        system = site.determine_system()
+        with span("determine_system"):
+            system = site.determine_system()
         logger.info(f"Determined system as: {system}")
     else:
         system = args.system
@@ -135,48 +359,167 @@ def run():
     # Set the variant: if no variant is specified on the CLI, then the site's
     # `auto_variant` is used.
     if args.variant is None:
-        variant = site.auto_variant(system)
+        with span("auto_variant"):
+            variant = site.auto_variant(system)
         logger.info(f"Automatically setting {variant=}")
     else:
         variant = args.variant
 
-    config = site.config(system, variant)
-    logger.debug(f"Loaded {config=}")
+    # Resolve the config (with the build profile) -- just like the API does
+    site, system, variant, config = resolve(
+        site, system, variant, args.profile
+    )
 
-    has_mpi4py = pip_find_mpi4py()
-    logger.info(f"{has_mpi4py=}")
+    # If the CLI specifies `sanity_only`, then only check the currently
+    # installed mpi4py (this is used to check installs in other environments)
+    if args.sanity_only:
+        sanity = site.sanity(system, variant, config) \
+            and check_packages(site_packages(site, system, config))
+        logger.info(f"{sanity=}")
+        exit(0 if sanity else 1)
 
-    if config.is_system_prefix:
-        logger.warning(" ".join([
-            "Your python version shares the system prefix.",
-            "Did you forget to activate your python environment?"
-        ]))
+    # If the CLI specifies `export_bundle`, then package the installed mpi4py
+    # (which is assumed to be built for this config) => nothing else to do
+    if args.export_bundle is not None:
+        with span("export_bundle"):
+            fingerprint = build_fingerprint(
+                config, env=init_env(site.init(system, variant))
+            )
+            export_bundle(
+                install_location(args.user), Path(args.export_bundle),
+                fingerprint, meta={
+                    "python": python_abi(), "system": system,
+                    "variant": variant, "profile": config.profile
+                }
+            )
+        exit(0)
+
+    # If the CLI specifies `sweep`, then check the installed mpi4py on the
+    # compute nodes => nothing else to do. Every rank must resolve the MPI
+    # library that MPICC links against.
+    if args.sweep is not None:
+        env = init_env(site.init(system, variant))
+        with span("sweep", nodes=args.sweep, ppn=args.sweep_ppn):
+            results = probe.sweep(
+                config, args.sweep, ppn=args.sweep_ppn, env=env
+            )
+        summary, ok = probe.report(results, expected=libmpi(config, env))
+        print(summary)
+        exit(0 if ok else 1)
 
-        if not args.overwrite_system:
-            logger.critical(" ".join([
-                "Will not overwrite install in system prefix. Use: "
-                "--overwrite_system to force install in system prefix."
-            ]))
+    # If the CLI specifies `probe`, then time the job startup with the
+    # installed mpi4py (in several layouts) => nothing else to do
+    if args.probe is not None:
+        names = tuple(
+            name.strip() for name in args.probe_layouts.split(",")
+        )
+        if names == ("all",):
+            names = probe.LAYOUTS
+        env = init_env(site.init(system, variant))
+        with span("probe", nodes=args.probe, ppn=args.sweep_ppn):
+            results = probe.startup_probe(
+                config, args.probe, install_location(args.user),
+                ppn=args.sweep_ppn, names=names, repeat=args.probe_repeat,
+                env=env
+            )
+        print(probe.startup_report(results))
+        exit(0)
 
+    # If the CLI specifies several interpreters, then build and install mpi4py
+    # for each of them (sharing the `init` environment) => skip the rest of
+    # the CLI.
+    if args.python is not None:
+        if args.no_wheelhouse or args.pgo:
+            logger.critical(
+                "--python can't be used with --no-wheelhouse or --pgo"
+            )
+            exit(1)
+        if config.packages is not None:
+            logger.critical(
+                f"--python can't build the MPI-aware packages {config.packages}"
+            )
             exit(1)
 
-    if has_mpi4py:
-        logger.info("mpi4py install detected! uninstalling current version")
-        pip_uninstall_mpi4py()
+        # Prebuilt wheels: the CLI flag overwrites the site's wheelhouse
+        cache, wheelhouse = wheel_stores(site, system, variant, args.wheelhouse)
+        if args.publish and wheelhouse is None:
+            logger.critical(
+                "--publish requires a wheelhouse (use --wheelhouse)"
+            )
+            exit(1)
+        if args.activate_script is not None:
+            logger.warning("--activate-script is ignored with --python")
 
-    pip_cmd_str = pip_cmd(config)
+        matrix = BuildMatrix(
+            [p.strip() for p in args.python.split(",") if p.strip()],
+            Path(site.__file__).stem, system, variant, config,
+            site.init(system, variant), cache, wheelhouse=wheelhouse,
+            publish=args.publish, use_user=args.user,
+            overwrite_system=args.overwrite_system,
+            lock_timeout=args.lock_timeout, abi_portable=args.abi_portable
+        )
+        results = matrix.run()
+        for r in results:
+            telemetry.append({
+                "time": time.time(), "site": Path(site.__file__).stem,
+                "system": system, "variant": variant,
+                "profile": config.profile, "python": r.python, "ok": r.ok,
+                "phase": r.phase, "error": r.error,
+                "total": sum(t for t in [
+                    r.build_time, r.install_time, r.sanity_time
+                ] if t is not None),
+                "timings": {
+                    phase: t for phase, t in [
+                        ("build", r.build_time), ("stage", r.install_time),
+                        ("sanity_staged", r.sanity_time)
+                    ] if t is not None
+                }
+            })
+        print(report(results))
+        exit(0 if all(r.ok for r in results) else 1)
 
-    logger.info("Installing mpi4py")
-    pip_install_mpi4py(pip_cmd_str, args.user, site.init(system, variant))
+    # Everything else is done by the install API
+    result = install(
+        site=site, system=system, variant=variant,
+        profile=args.profile, user=args.user,
+        overwrite_system=args.overwrite_system, wheelhouse=args.wheelhouse,
+        use_wheelhouse=not args.no_wheelhouse, publish=args.publish,
+        lock_timeout=args.lock_timeout, pgo=args.pgo,
+        compile_slots=args.compile_slots,
+        run_microbench=args.microbench, activate_script=args.activate_script,
+        precompile=args.precompile, precompile_optimize=tuple(
+            int(level) for level in args.precompile_optimize.split(",")
+        ), abi_portable=args.abi_portable
+    )
+    report_install(result)
 
-    logger.info("Checking mpi4py install config")
-    sanity = site.sanity(system, variant, config)
-    logger.info(f"{sanity=}")
-    if sanity:
-        logger.info("Sanity check passed, install successful!")
-        retcode = 0
-    else:
-        logger.critical("Sanity check FAILED, install unsuccessful!")
-        retcode = 1
 
-    exit(retcode)
+def _absolute(path: str|None) -> str|None:
+    return None if path is None else str(Path(path).absolute())
+
+
+def report_install(result):
+    """
+    report_install(result: InstallResult)
+
+
+    Print the reports of an install, record its telemetry, and exit.
+    """
+
+    if result.microbench is not None:
+        print(microbench.report(
+            result.microbench["new"], result.microbench.get("current")
+        ))
+    if result.pgo_microbench is not None:
+        print(microbench.report(
+            result.pgo_microbench["pgo"], result.pgo_microbench["baseline"],
+            labels=("pgo", "no pgo")
+        ))
+    if result.import_accesses is not None:
+        print(bytecode.report(
+            result.import_accesses["before"], result.import_accesses["after"]
+        ))
+    logger.info(f"Phase timings: {result.timings}")
+    telemetry.append(telemetry.install_record(result))
+
+    exit(0 if result.ok else 1)
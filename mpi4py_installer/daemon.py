@@ -0,0 +1,422 @@
+from .                      import logger, init_env, cache_init_envs, \
+    build_fingerprint, python_abi, MPIConfig
+from .                      import fingerprint
+from .api                   import install, resolve, wheel_stores, \
+    InstallResult
+from .sites                 import Site, ConfigStore, auto_site
+from .singleton             import dict_hash
+from .wheelhouse            import cache_path
+
+import json
+import os
+import socket
+import socketserver
+import struct
+import sys
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses        import asdict
+from pathlib            import Path
+from typing             import Any
+
+
+# Requests (and responses) are a single line of json each
+MAX_REQUEST = 1 << 20
+
+# Variables that affect site detection, `init` and builds => the daemon only
+# serves clients that agree on these (c.f. `env_hash`). Everything else (eg.
+# TERM, SSH_*, DISPLAY) differs between any two shells.
+BUILD_VARIABLES = (
+    "PATH", "LD_LIBRARY_PATH", "LIBRARY_PATH", "CPATH", "C_INCLUDE_PATH",
+    "PKG_CONFIG_PATH", "MODULEPATH", "MODULESHOME", "LOADEDMODULES",
+    "_LMFILES_", "CC", "CXX", "MPICC", "CFLAGS", "CPPFLAGS", "LDFLAGS",
+    "HOME", "USER", "XDG_CACHE_HOME", "PYTHONPATH", "PYTHONHOME",
+    "VIRTUAL_ENV", "CONDA_PREFIX", "NERSC_HOST"
+)
+BUILD_PREFIXES = (
+    "MPI4PY_", "PE_", "CRAY_", "LMOD_", "PIP_", "OMPI_", "MPICH_", "I_MPI_"
+)
+
+
+def socket_path() -> Path:
+    """
+    socket_path() -> Path
+
+
+    Location of the daemon's socket: MPI4PY_INSTALLER_SOCKET, or
+    `mpi4py-installer.sock` in XDG_RUNTIME_DIR (or the cache directory).
+    """
+
+    if "MPI4PY_INSTALLER_SOCKET" in os.environ:
+        return Path(os.environ["MPI4PY_INSTALLER_SOCKET"])
+    if "XDG_RUNTIME_DIR" in os.environ:
+        return Path(os.environ["XDG_RUNTIME_DIR"]) / "mpi4py-installer.sock"
+    return cache_path() / "daemon.sock"
+
+
+def env_hash(env: dict[str, str]|None = None) -> str:
+    """
+    env_hash(env: dict[str, str]|None = None) -> str
+
+
+    Hash of the variables of `env` (default: the current environment) that
+    affect site detection, `init` and builds: BUILD_VARIABLES, the variables
+    starting with BUILD_PREFIXES, and the (comma-separated) variables named
+    by MPI4PY_INSTALLER_DAEMON_ENV -- eg. a user site's host variable. The
+    daemon serves only clients with the same environment hash => site
+    detection and `init` give the same results as they would in the client.
+    """
+
+    env = dict(os.environ if env is None else env)
+    extra = env.get("MPI4PY_INSTALLER_DAEMON_ENV", "").split(",")
+    names = set(BUILD_VARIABLES) | {name.strip() for name in extra}
+    return dict_hash({
+        k: v for k, v in env.items()
+        if k in names or k.startswith(BUILD_PREFIXES)
+    })
+
+
+class Caches:
+    """
+    Tracks the files that the daemon's caches depend on: the site modules
+    and jsons, the modulefile directories on MODULEPATH, and the MPI libraries
+    that MPICC introspection has found. If any of them changes, all caches
+    are dropped -- the `Site` scan, the `ConfigStore`s, the loaded site
+    modules, the `init` environments and the MPICC introspection.
+    """
+
+    def __init__(self):
+        self.stamps: dict[str, int|None] = dict()
+        self._lock = threading.Lock()
+
+
+    def _watched(self) -> set[str]:
+        site = Site()
+        paths = set()
+        for root in (site.path, site.user_path):
+            if root.is_dir():
+                paths.add(str(root))
+                paths |= {str(p) for p in root.glob("*.py")}
+                paths |= {str(p) for p in root.glob("*.json")}
+
+        # New module versions are added one level below MODULEPATH
+        for root in os.environ.get("MODULEPATH", "").split(os.pathsep):
+            if root and os.path.isdir(root):
+                paths.add(root)
+                paths |= {e.path for e in os.scandir(root) if e.is_dir()}
+
+        with fingerprint._LIBMPI_LOCK:
+            paths |= {p for p in fingerprint._LIBMPI_CACHE.values() if p}
+
+        return paths
+
+
+    @staticmethod
+    def _mtime(path: str) -> int|None:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+
+    def check(self) -> bool:
+        """
+        check(self) -> bool
+
+
+        Drop all caches if any of the watched files has changed since the
+        last check. Returns True if the caches were dropped.
+        """
+
+        with self._lock:
+            current = {
+                p: Caches._mtime(p) for p in self._watched() | set(self.stamps)
+            }
+            changed = [
+                p for p, mtime in current.items()
+                if p in self.stamps and self.stamps[p] != mtime
+            ]
+            if changed:
+                logger.info(f"Dropping caches, changed: {changed}")
+                Caches.clear()
+                current = {p: Caches._mtime(p) for p in self._watched()}
+            self.stamps = current
+
+        return bool(changed)
+
+
+    @staticmethod
+    def clear():
+        """
+        clear()
+
+
+        Drop all caches: the next request scans and loads everything again.
+        """
+
+        Site.forget()
+        ConfigStore.forget()
+        for name in list(sys.modules):
+            if name.startswith("mpi4py_installer.sites.") \
+                    or name.startswith("mpi4py_installer_user_site_"):
+                del sys.modules[name]
+        with fingerprint._LIBMPI_LOCK:
+            fingerprint._LIBMPI_CACHE.clear()
+        cache_init_envs(True)
+
+
+def detect(site: str|None = None, system: str|None = None) -> dict[str, Any]:
+    """
+    detect(site: str|None = None, system: str|None = None) -> dict[str, Any]
+
+
+    The site, system and variant that the installer would pick, and the
+    available sites and variants.
+    """
+
+    site_info = Site()
+    if site is None:
+        site, _ = auto_site()
+    site_module, system, variant, _ = resolve(site, system)
+
+    return {
+        "site": Path(site_module.__file__).stem, "system": system,
+        "variant": variant, "variants": site_module.available_variants(system),
+        "sites": site_info.sites, "user_sites": site_info.user_sites
+    }
+
+
+def plan(
+            site: str|None = None, system: str|None = None,
+            variant: str|None = None, profile: str|None = None,
+            python: str = sys.executable, wheelhouse: str|None = None
+        ) -> dict[str, Any]:
+    """
+    plan(
+            site: str|None = None, system: str|None = None,
+            variant: str|None = None, profile: str|None = None,
+            python: str = sys.executable, wheelhouse: str|None = None
+        ) -> dict[str, Any]
+
+
+    What `install` would do, without doing it: the resolved config, the
+    build fingerprint, the MPI library, and whether a wheel with this
+    fingerprint is already cached (or in the wheelhouse).
+    """
+
+    site_module, system, variant, config = resolve(
+        site, system, variant, profile
+    )
+    env = init_env(site_module.init(system, variant))
+    fp = build_fingerprint(config, env=env, python=python)
+    cache, wheels = wheel_stores(site_module, system, variant, wheelhouse)
+
+    return {
+        "site": Path(site_module.__file__).stem, "system": system,
+        "variant": variant, "config": asdict(config), "python": python,
+        "abi": python_abi(python), "fingerprint": fp,
+        "libmpi": fingerprint.libmpi(config, env=env),
+        "cache_hit": any(
+            store is not None and store.lookup(fp) is not None
+            for store in (wheels, cache)
+        )
+    }
+
+
+class Daemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Serves `detect`, `plan` and `install` requests over a Unix socket, with
+    warm caches (c.f. `Caches`). Installs run on a pool of `workers` threads.
+    Only connections of the same user are accepted, and only clients with the
+    daemon's environment (c.f. `env_hash`) are served -- except for `ping`
+    and `shutdown`. The protocol is one line of json per request and per
+    response:
+
+        {"op": "install", "args": {...}, "env": "<env_hash>"}
+        {"ok": true, "result": {...}}  or  {"ok": false, "error": "..."}
+
+    Responses to clients with another environment also have
+    `"env_mismatch": true`.
+    """
+
+    daemon_threads = True
+
+
+    def __init__(self, path: Path, workers: int = 1):
+        self.path = Path(path)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.caches = Caches()
+        self.env = env_hash()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            if ping(self.path) is not None:
+                raise RuntimeError(f"A daemon is already running: {self.path}")
+            self.path.unlink()
+
+        cache_init_envs(True)
+        super().__init__(str(self.path), _Handler)
+        os.chmod(self.path, 0o600)
+
+
+    def verify_request(self, request, client_address) -> bool:
+        creds = request.getsockopt(
+            socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+        )
+        _, uid, _ = struct.unpack("3i", creds)
+        return uid == os.getuid()
+
+
+    def handle_op(self, op: str, args: dict[str, Any]) -> Any:
+        if op == "ping":
+            return {"pid": os.getpid(), "python": sys.executable}
+        if op == "shutdown":
+            threading.Thread(target=self.shutdown).start()
+            return None
+
+        self.caches.check()
+        # environments at the same path can be recreated for another python
+        python_abi.cache_clear()
+
+        if op == "detect":
+            return detect(**args)
+        if op == "plan":
+            return self.pool.submit(plan, **args).result()
+        if op == "install":
+            if "precompile_optimize" in args:
+                args["precompile_optimize"] = tuple(args["precompile_optimize"])
+            return asdict(self.pool.submit(install, **args).result())
+
+        raise RuntimeError(f"Unknown request: {op}")
+
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline(MAX_REQUEST))
+            if request["op"] not in ("ping", "shutdown") \
+                    and request.get("env") != self.server.env:
+                logger.info("Rejected a client with another environment")
+                self.reply({
+                    "ok": False, "error": "the client's environment differs",
+                    "env_mismatch": True
+                })
+                return
+            response = {
+                "ok": True,
+                "result": self.server.handle_op(
+                    request["op"], request.get("args", dict())
+                )
+            }
+        except Exception as e:
+            logger.warning(f"Request failed: {e}")
+            response = {"ok": False, "error": str(e)}
+
+        self.reply(response)
+
+
+    def reply(self, response: dict[str, Any]):
+        self.wfile.write((json.dumps(response) + "\n").encode())
+
+
+def serve(path: Path|None = None, workers: int = 1):
+    """
+    serve(path: Path|None = None, workers: int = 1)
+
+
+    Run the daemon on the socket `path` (default: `socket_path()`) until it
+    is shut down (or interrupted).
+    """
+
+    path = socket_path() if path is None else path
+    with Daemon(path, workers) as daemon:
+        logger.info(f"Serving on {path} ({workers=})")
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def request(
+            op: str, args: dict[str, Any]|None = None,
+            path: Path|None = None, timeout: float|None = None
+        ) -> dict[str, Any]:
+    """
+    request(
+            op: str, args: dict[str, Any]|None = None,
+            path: Path|None = None, timeout: float|None = None
+        ) -> dict[str, Any]
+
+
+    Send the request `op` (with `args`) to the daemon at `path`, and return
+    its response. Raises OSError if the daemon can't be reached.
+    """
+
+    path = socket_path() if path is None else path
+    message = {"op": op, "args": args or dict(), "env": env_hash()}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(str(path))
+        sock.sendall((json.dumps(message) + "\n").encode())
+        with sock.makefile("r") as f:
+            line = f.readline()
+    if not line:
+        raise OSError("The daemon closed the connection")
+    return json.loads(line)
+
+
+def ping(path: Path|None = None) -> dict[str, Any]|None:
+    """
+    ping(path: Path|None = None) -> dict[str, Any]|None
+
+
+    The pid and python of the daemon at `path` -- None if it isn't running.
+    """
+
+    try:
+        response = request("ping", path=path, timeout=5)
+    except OSError:
+        return None
+    return response.get("result")
+
+
+def remote_install(**kwargs) -> InstallResult|None:
+    """
+    remote_install(**kwargs) -> InstallResult|None
+
+
+    Run `install(**kwargs)` in the daemon. Returns None if no daemon is
+    running (or reachable), or if it doesn't serve this client's environment
+    => the caller installs in-process instead. Raises RuntimeError if the
+    daemon fails to run the install (eg. the site can't be resolved).
+    """
+
+    path = socket_path()
+    if not path.exists():
+        return None
+
+    try:
+        response = request("install", kwargs, path=path)
+    except OSError as e:
+        logger.debug(f"Daemon not reachable: {e}")
+        return None
+    if not response["ok"]:
+        error = response["error"]
+        if response.get("env_mismatch"):
+            logger.info(f"Daemon can't serve this install: {error}")
+            return None
+        raise RuntimeError(f"The daemon failed to install: {error}")
+
+    result = response["result"]
+    result["config"] = MPIConfig(**result["config"])
+    return InstallResult(**result)
@@ -0,0 +1,401 @@
+from .                      import logger
+from .sites                 import find_mpi_library
+from .validated_dataclasses import ValidatedDataClass
+from .wheelhouse            import cache_path
+
+import glob
+import json
+import os
+import re
+import shlex
+import subprocess
+
+from pathlib            import Path
+from dataclasses        import dataclass, asdict
+from concurrent.futures import ThreadPoolExecutor
+from typing             import Any
+
+
+# MPI compiler wrappers to look for
+WRAPPERS = ("mpicc", "mpiicx", "mpiicc")
+
+# Where MPI installs usually live (in addition to PATH and modulefiles)
+PREFIX_GLOBS = (
+    "/opt/*/bin", "/opt/*/*/bin", "/opt/*/*/*/bin",
+    "/usr/lib64/*/bin", "/usr/lib/*/bin", "/usr/local/*/bin"
+)
+
+# Identify the MPI implementation from the wrapper's version output (MVAPICH
+# before MPICH: MVAPICH's output also matches MPICH)
+IMPLEMENTATIONS = (
+    ("openmpi",  re.compile(r"Open MPI\s+v?([\w.]+)")),
+    ("mvapich",  re.compile(r"MVAPICH\d?\s+version\s+([\w.]+)", re.I)),
+    ("intelmpi", re.compile(r"Intel\(R\) MPI Library\s+([\w.]+)")),
+    ("mpich",    re.compile(r"MPICH\s+version\s+([\w.]+)", re.I))
+)
+
+# PATH entries of modulefiles (Tcl and Lua) -- only literal absolute paths
+MODULE_PATH_PATTERNS = (
+    re.compile(
+        r"^\s*(?:prepend|append)-path\s+(?:-\S+\s+)*PATH\s+(/\S+)", re.M
+    ),
+    re.compile(
+        r"(?:prepend|append)_path\s*\(\s*[\"']PATH[\"']\s*,\s*[\"'](/[^\"']+)"
+    )
+)
+
+# Generated user site module: loads the json next to it. It is never picked
+# by `auto_site` => select it with `--site`
+SITE_MODULE = '''\
+# Generated by `mpi4py-installer --discover`: the variants are in the json
+# file next to this module
+from mpi4py_installer.sites import ConfigStore, MPIConfig, PackageRecipe, \\
+    default_available_systems, default_available_variants, default_config, \\
+    default_determine_system, default_available_packages, default_package, \\
+    default_auto_variant
+from mpi4py_installer.sites.local import sanity
+
+
+CONFIG = ConfigStore(__file__)
+
+
+def check_site() -> bool:
+    return False
+
+
+def available_systems() -> list[str]:
+    return default_available_systems(CONFIG)
+
+
+def determine_system() -> str:
+    return default_determine_system(CONFIG)
+
+
+def available_variants(system: str) -> list[str]:
+    return default_available_variants(CONFIG, system)
+
+
+def auto_variant(system: str) -> str:
+    return default_auto_variant(CONFIG, system)
+
+
+def config(system: str, variant: str) -> MPIConfig:
+    return default_config(CONFIG, system, variant)
+
+
+def init(system: str, variant: str) -> str|None:
+    config = default_config(CONFIG, system, variant)
+    if config.init is not None:
+        return "\\n".join(config.init)
+    return None
+
+
+def available_packages(system: str) -> list[str]:
+    return default_available_packages(CONFIG, system)
+
+
+def package(system: str, name: str) -> PackageRecipe:
+    return default_package(CONFIG, system, name)
+'''
+
+
+@dataclass(frozen=True)
+class Toolchain(metaclass=ValidatedDataClass):
+    """
+    An MPI compiler wrapper found by `discover`: its `mpicc_show` flag, the MPI
+    `implementation` and `version`, the underlying compiler `CC`, the MPI
+    library that it links against, and the `module` that provides it (if it
+    was found in a modulefile).
+    """
+    MPICC: str
+    mpicc_show: str
+    implementation: str
+    version: str
+    CC: str
+    libmpi: str|None = None
+    module: str|None = None
+
+
+    @property
+    def name(self) -> str:
+        """
+        name -> str
+
+
+        Variant name, eg. openmpi-4.1.4-gcc
+        """
+        name = f"{self.implementation}-{self.version}-{Path(self.CC).name}"
+        return re.sub(r"[^\w.+-]", "_", name.lower())
+
+
+def module_bin_dirs(modulepath: str|None) -> list[tuple[Path, str]]:
+    """
+    module_bin_dirs(modulepath: str|None) -> list[tuple[Path, str]]
+
+
+    Directories that the modulefiles in `modulepath` (eg. $MODULEPATH) add to
+    PATH, with the name of the module that adds them. Only literal absolute
+    paths are found (not paths built from modulefile variables).
+    """
+
+    modulefiles = list()
+    for root in (modulepath or "").split(os.pathsep):
+        if not root or not os.path.isdir(root):
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for f in filenames:
+                if f.startswith("."):
+                    continue
+                path = Path(dirpath) / f
+                name = str(path.relative_to(root)).removesuffix(".lua")
+                modulefiles.append((path, name))
+
+    def scan(modulefile):
+        path, name = modulefile
+        try:
+            with open(path, "r", errors="replace") as f:
+                text = f.read(1 << 16)
+        except OSError:
+            return list()
+        return [
+            (Path(d), name)
+            for pattern in MODULE_PATH_PATTERNS
+            for d in pattern.findall(text)
+        ]
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        return [d for dirs in pool.map(scan, modulefiles) for d in dirs]
+
+
+def candidate_dirs(
+            env: dict[str, str]|None = None
+        ) -> list[tuple[Path, str|None]]:
+    """
+    candidate_dirs(
+            env: dict[str, str]|None = None
+        ) -> list[tuple[Path, str|None]]
+
+
+    Directories that may contain MPI compiler wrappers: PATH, the usual
+    install prefixes, and the bin directories of the modulefiles in
+    MODULEPATH -- each with the module that provides it (or None).
+    """
+
+    env = os.environ if env is None else env
+    dirs: list[tuple[Path, str|None]] = [
+        (Path(d), None) for d in env.get("PATH", "").split(os.pathsep) if d
+    ]
+    for pattern in PREFIX_GLOBS:
+        dirs += [(Path(d), None) for d in sorted(glob.glob(pattern))]
+    dirs += module_bin_dirs(env.get("MODULEPATH"))
+
+    return dirs
+
+
+def _run(cmd: list[str], env: dict[str, str]|None) -> str|None:
+    try:
+        out = subprocess.run(
+            cmd, capture_output=True, text=True, env=env, timeout=30,
+            stdin=subprocess.DEVNULL
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return out.stdout + out.stderr if out.returncode == 0 else None
+
+
+def introspect(
+            mpicc: Path, module: str|None = None,
+            env: dict[str, str]|None = None
+        ) -> Toolchain|None:
+    """
+    introspect(
+            mpicc: Path, module: str|None = None,
+            env: dict[str, str]|None = None
+        ) -> Toolchain|None
+
+
+    Ask the MPI compiler wrapper `mpicc` for the compiler command that it
+    runs, and for its MPI implementation and version. Returns None if it
+    isn't a working MPI wrapper.
+    """
+
+    for show in ("-show", "--showme"):
+        out = _run([str(mpicc), show], env)
+        if out and out.split():
+            break
+    else:
+        return None
+
+    command = shlex.split(next(l for l in out.splitlines() if l.strip()))
+    lib_dirs = [a[2:] for a in command if a.startswith("-L")]
+    libs = [a[2:] for a in command if a.startswith("-l")]
+
+    versions = "\n".join(
+        _run([str(mpicc), flag], env) or ""
+        for flag in ("--showme:version", "-v")
+    )
+    for implementation, pattern in IMPLEMENTATIONS:
+        match = pattern.search(versions)
+        if match is not None:
+            version = match.group(1).rstrip(".")
+            break
+    else:
+        implementation, version = "mpi", "unknown"
+
+    return Toolchain(
+        MPICC=str(mpicc), mpicc_show=show, implementation=implementation,
+        version=version, CC=command[0],
+        libmpi=find_mpi_library(lib_dirs, libs), module=module
+    )
+
+
+def _load_cache(path: Path) -> dict[str, Any]:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return dict()
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Ignoring unreadable discovery cache: {e}")
+        return dict()
+
+
+def _save_cache(path: Path, cache: dict[str, Any]):
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}")
+        with open(tmp, "w") as f:
+            json.dump(cache, f, indent=2, sort_keys=True)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"Could not write the discovery cache: {e}")
+
+
+def discover(
+            env: dict[str, str]|None = None, cache: Path|None = None,
+            workers: int = 8
+        ) -> list[Toolchain]:
+    """
+    discover(
+            env: dict[str, str]|None = None, cache: Path|None = None,
+            workers: int = 8
+        ) -> list[Toolchain]
+
+
+    Find the MPI compiler wrappers in `candidate_dirs`, and introspect them
+    (using `workers` threads). Wrappers are deduplicated by their real path.
+    The introspection results are cached in `cache` (default:
+    `discovery.json` in the installer's cache directory), keyed by the
+    wrapper's path, size and mtime => repeat runs don't run any wrappers.
+    """
+
+    cache = cache_path() / "discovery.json" if cache is None else cache
+    known = _load_cache(cache)
+
+    def wrappers(candidate):
+        d, module = candidate
+        found = list()
+        for name in WRAPPERS:
+            path = d / name
+            if os.access(path, os.X_OK) and path.is_file():
+                found.append((path, module))
+        return found
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        found = [
+            w for ws in pool.map(wrappers, candidate_dirs(env)) for w in ws
+        ]
+
+    # The first occurrence wins: PATH before prefixes before modules
+    unique = dict()
+    for path, module in found:
+        unique.setdefault(str(path.resolve()), (path, module))
+
+    def lookup(item):
+        real, (path, module) = item
+        stat = os.stat(real)
+        key = f"{real}:{module}"
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        entry = known.get(key)
+        if entry is not None and entry["stamp"] == stamp:
+            toolchain = entry["toolchain"]
+            return key, stamp, toolchain and Toolchain(**toolchain)
+        logger.debug(f"Introspecting {path}")
+        return key, stamp, introspect(path, module, env)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lookup, unique.items()))
+
+    updated = {
+        key: {"stamp": stamp, "toolchain": t and asdict(t)}
+        for key, stamp, t in results
+    }
+    if updated != known:
+        _save_cache(cache, updated)
+
+    toolchains = [t for _, _, t in results if t is not None]
+    logger.info(f"Discovered {len(toolchains)} MPI toolchains")
+    return sorted(
+        toolchains,
+        key=lambda t: (t.implementation, t.version, t.module or "", t.MPICC)
+    )
+
+
+def site_config(
+            toolchains: list[Toolchain], system: str = "default"
+        ) -> dict[str, Any]:
+    """
+    site_config(
+            toolchains: list[Toolchain], system: str = "default"
+        ) -> dict[str, Any]
+
+
+    Site json with one variant of `system` per toolchain. Variants of
+    toolchains that are provided by a module load it in `init`.
+    """
+
+    variants = dict()
+    for t in toolchains:
+        name, i = t.name, 1
+        while name in variants:
+            i += 1
+            name = f"{t.name}-{i}"
+
+        variant: dict[str, Any] = {
+            "MPICC": t.MPICC, "CC": t.CC, "mpicc_show": t.mpicc_show
+        }
+        if t.module is not None:
+            variant["init"] = [f"module load {t.module}"]
+        variants[name] = variant
+
+    return {
+        "environment": {"host": "MPI4PY_HOST", "blacklist": []},
+        "systems": {system: variants}
+    }
+
+
+def write_site(name: str, config: dict[str, Any], root: Path) -> Path:
+    """
+    write_site(name: str, config: dict[str, Any], root: Path) -> Path
+
+
+    Write the site json `config` and a site module that loads it to `root`
+    (eg. the user site path) => the site can be used with `--site name`.
+    Returns the path of the json.
+    """
+
+    root.mkdir(parents=True, exist_ok=True)
+    module = root / f"{name}.py"
+    if not module.exists():
+        module.write_text(SITE_MODULE)
+    elif "mpi4py-installer --discover" not in module.read_text():
+        raise RuntimeError(f"{module} exists, and was not generated")
+
+    path = root / f"{name}.json"
+    with open(path, "w") as f:
+        json.dump(config, f, indent=4)
+        f.write("\n")
+
+    logger.info(f"Wrote site {name}: {path}")
+    return path
@@ -0,0 +1,139 @@
+from .           import logger, python_abi
+from .singleton  import dict_hash
+from .mpi_config import MPIConfig
+from .sites      import get_mpicc_link_data, find_mpi_library
+
+import os
+import platform
+import re
+import sys
+import threading
+
+from pathlib import Path
+
+
+# The MPI library only depends on the config and the environment (not on the
+# python interpreter) => introspect MPICC once, and share the result between
+# the builds for several interpreters
+_LIBMPI_CACHE: dict[str, str|None] = dict()
+_LIBMPI_LOCK = threading.Lock()
+
+# ABI families of MPI libraries, by soname version: mpi4py built against a
+# library of a family runs with any other library of that family. Eg. MPICH,
+# Intel MPI, MVAPICH and Cray MPICH all provide libmpi.so.12 -- Cray MPICH's
+# compiler-specific builds (eg. libmpi_gnu_123.so.12, libmpi_cray.so.12)
+# included
+ABI_FAMILIES = {"libmpi.so.12": "mpich", "libmpi.so.40": "openmpi"}
+
+# libmpi.so.<major>, libmpich.so.<major> or libmpi_<suffix>.so.<major>
+_SONAME = re.compile(r"libmpi(?:ch)?(?:_\w+)?\.so\.(\d+)(?:\.|$)")
+
+
+def libmpi(config: MPIConfig, env: dict[str, str]|None = None) -> str|None:
+    """
+    libmpi(config: MPIConfig, env: dict[str, str]|None = None) -> str|None
+
+
+    Resolved path of the MPI library that `config.MPICC` links against (when
+    run in `env`). Returns None if MPICC can't be introspected -- i.e. if
+    `config.mpicc_show` is not set, or if the MPI library could not be found.
+    """
+
+    if config.MPICC is None or config.mpicc_show is None:
+        return None
+
+    key = dict_hash({"config": config.fingerprint, "env": env})
+    with _LIBMPI_LOCK:
+        if key not in _LIBMPI_CACHE:
+            link_data = get_mpicc_link_data(config, env=env)
+            _LIBMPI_CACHE[key] = None if link_data is None \
+                else find_mpi_library(*link_data)
+
+        return _LIBMPI_CACHE[key]
+
+
+def abi_family(
+            config: MPIConfig, env: dict[str, str]|None = None
+        ) -> str|None:
+    """
+    abi_family(
+            config: MPIConfig, env: dict[str, str]|None = None
+        ) -> str|None
+
+
+    ABI family (c.f. ABI_FAMILIES) of the MPI library that `config.MPICC`
+    links against in `env`. None if the library is unknown, or not part of a
+    known family.
+    """
+
+    path = libmpi(config, env=env)
+    if path is None:
+        return None
+
+    soname = _SONAME.match(Path(path).name)
+    if soname is None:
+        return None
+    return ABI_FAMILIES.get(f"libmpi.so.{soname.group(1)}")
+
+
+def select_libmpi(config: MPIConfig, env: dict[str, str]) -> dict[str, str]:
+    """
+    select_libmpi(config: MPIConfig, env: dict[str, str]) -> dict[str, str]
+
+
+    Copy of `env` that makes an ABI-portable mpi4py use the MPI library of
+    `config` at runtime: its directory is prepended to LD_LIBRARY_PATH (and
+    MPI4PY_LIBMPI names it, for mpi4py builds that load the MPI library
+    dynamically). Raises RuntimeError if the library is unknown.
+    """
+
+    path = libmpi(config, env=env)
+    if path is None:
+        raise RuntimeError(f"Could not find the MPI library of {config.MPICC}")
+
+    env = dict(env)
+    env["LD_LIBRARY_PATH"] = os.pathsep.join(
+        p for p in [str(Path(path).parent), env.get("LD_LIBRARY_PATH")] if p
+    )
+    env["MPI4PY_LIBMPI"] = path
+    return env
+
+
+def build_fingerprint(
+            config: MPIConfig, env: dict[str, str]|None = None,
+            python: str = sys.executable, abi_portable: bool = False
+        ) -> str:
+    """
+    build_fingerprint(
+            config: MPIConfig, env: dict[str, str]|None = None,
+            python: str = sys.executable, abi_portable: bool = False
+        ) -> str
+
+
+    Identifies an mpi4py build: mpi4py wheels built with the same fingerprint
+    are interchangeable. The fingerprint covers the MPIConfig, the `python`
+    interpreter's ABI, the machine architecture, and the MPI library that
+    MPICC links against in `env` (i.e. after `init` has been run).
+
+    ABI-portable builds (`abi_portable`) only cover the ABI family of the MPI
+    library instead, and not the toolchain => variants of the same family
+    share a build. Unless the MPI library isn't part of a known family.
+    """
+
+    family = abi_family(config, env=env) if abi_portable else None
+    if family is None:
+        data = {
+            "config": config.fingerprint,
+            "abi":    python_abi(python),
+            "arch":   platform.machine(),
+            "libmpi": libmpi(config, env=env)
+        }
+    else:
+        data = {
+            "config": config.portable_fingerprint,
+            "abi":    python_abi(python),
+            "arch":   platform.machine(),
+            "mpiabi": family
+        }
+    logger.debug(f"Build fingerprint data: {data}")
+    return dict_hash(data)
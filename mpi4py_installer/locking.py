@@ -0,0 +1,284 @@
+from .         import logger
+from .tracing  import span
+
+import fcntl
+import json
+import os
+import socket
+import threading
+import time
+
+from contextlib import contextmanager
+from pathlib    import Path
+from typing     import Any, Callable, Iterator
+
+
+# Serializes the threads of this process (flock might only lock per process,
+# eg. on NFS)
+_LOCATION_LOCKS: dict[str, threading.Lock] = dict()
+_LOCATION_LOCKS_LOCK = threading.Lock()
+
+LOCATION_LOCK_FILE = ".mpi4py-installer.lock"
+
+
+@contextmanager
+def location_lock(location: str|Path) -> Iterator[None]:
+    """
+    location_lock(location: str|Path) -> Iterator[None]
+
+
+    Context manager that serializes installs (uninstall, stage, swap and
+    rollback) into `location` (eg. site-packages) -- between the threads of
+    this process, and between processes (eg. the installer daemon and a CLI
+    run, or concurrent batch runs) via `flock` on a lock file in `location`.
+    The lock is released when its holder exits, even if it crashes.
+    """
+
+    location = Path(location)
+    with _LOCATION_LOCKS_LOCK:
+        thread_lock = _LOCATION_LOCKS.setdefault(
+            str(location.resolve()), threading.Lock()
+        )
+
+    with thread_lock:
+        location.mkdir(parents=True, exist_ok=True)
+        with open(location / LOCATION_LOCK_FILE, "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.info(f"Waiting for another install into {location}")
+                with span("wait_location", location=str(location)):
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class BuildLock:
+    """
+    Cross-process lock around a build, implemented as a lock file that is
+    created with O_EXCL (this also works on NFS). The lock file records the
+    holder's pid and host, and the holder touches it every `stale_after/4`
+    seconds (heartbeat). A lock is stale -- and may be broken by anyone -- if
+    its heartbeat is older than `stale_after` seconds, or if its holder ran on
+    this host and is no longer alive.
+    """
+
+    def __init__(self, path: str|Path, stale_after: float = 120):
+        self.path = Path(path)
+        self.stale_after = stale_after
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+
+    def holder(self) -> dict[str, Any]|None:
+        """
+        holder(self) -> dict[str, Any]|None
+
+
+        Contents of the lock file (pid, host, time), or None if the lock is
+        free (or is being written).
+        """
+
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+
+    def try_acquire(self) -> bool:
+        """
+        try_acquire(self) -> bool
+
+
+        Take the lock if it is free. Returns True if the lock has been taken,
+        and False if it is held by someone else.
+        """
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+
+        with os.fdopen(fd, "w") as f:
+            json.dump({
+                "pid": os.getpid(),
+                "host": socket.gethostname(),
+                "time": time.time()
+            }, f)
+
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._beat, daemon=True)
+        self._heartbeat.start()
+        logger.debug(f"Acquired build lock {self.path}")
+        return True
+
+
+    def _beat(self):
+        while not self._stop.wait(self.stale_after/4):
+            try:
+                os.utime(self.path)
+            except OSError as e:
+                logger.warning(f"Build lock heartbeat failed: {e}")
+
+
+    def release(self):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+        logger.debug(f"Released build lock {self.path}")
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+    def is_stale(self) -> bool:
+        """
+        is_stale(self) -> bool
+
+
+        True if the lock is held, but its holder stopped sending heartbeats
+        (or died).
+        """
+
+        try:
+            age = time.time() - self.path.stat().st_mtime
+        except FileNotFoundError:
+            return False
+        if age > self.stale_after:
+            return True
+
+        holder = self.holder()
+        if holder is None or holder.get("host") != socket.gethostname():
+            return False
+        try:
+            os.kill(holder["pid"], 0)
+        except ProcessLookupError:
+            return True
+        except (PermissionError, KeyError, TypeError):
+            pass
+        return False
+
+
+    def break_stale(self) -> bool:
+        """
+        break_stale(self) -> bool
+
+
+        Remove the lock file if it is stale. Returns True if it was removed.
+        The lock file is renamed to a name that is unique to this process
+        first, so only one of several waiting processes breaks it.
+        """
+
+        try:
+            inode = self.path.stat().st_ino
+        except FileNotFoundError:
+            return False
+        if not self.is_stale():
+            return False
+
+        grave = self.path.with_name(f".{self.path.name}.{os.getpid()}.stale")
+        try:
+            os.rename(self.path, grave)
+        except FileNotFoundError:
+            return False
+        if grave.stat().st_ino != inode:
+            # The lock changed hands between the check and the rename => put
+            # it back (unless somebody already took it again)
+            try:
+                os.link(grave, self.path)
+            except FileExistsError:
+                pass
+            grave.unlink()
+            return False
+
+        logger.warning(f"Broke stale build lock {self.path}")
+        grave.unlink()
+        return True
+
+
+    def wait(self, timeout: float, poll: float = 1):
+        """
+        wait(self, timeout: float, poll: float = 1)
+
+
+        Wait until the lock is released (or broken because it is stale).
+        Raises RuntimeError after `timeout` seconds.
+        """
+
+        deadline = time.monotonic() + timeout
+        while self.path.exists():
+            if self.break_stale():
+                return
+            if time.monotonic() > deadline:
+                raise RuntimeError(
+                    f"Timed out after {timeout}s waiting for build lock "
+                    f"{self.path} (held by {self.holder()})"
+                )
+            time.sleep(poll)
+
+
+def single_flight(
+            lock_path: str|Path, build: Callable[[], Any],
+            lookup: Callable[[], Any], rebuild: bool = False,
+            timeout: float = 3600, stale_after: float = 120, poll: float = 1
+        ) -> tuple[Any, float]:
+    """
+    single_flight(
+            lock_path: str|Path, build: Callable[[], Any],
+            lookup: Callable[[], Any], rebuild: bool = False,
+            timeout: float = 3600, stale_after: float = 120, poll: float = 1
+        ) -> tuple[Any, float]
+
+
+    Run `build` in only one of several concurrent processes (the one holding
+    the lock at `lock_path`). The other processes wait for it to finish, and
+    then use the result of `lookup` (which returns None if there is no build
+    result yet). If the building process fails, one of the waiting processes
+    takes over. Unless `rebuild` is set, an existing result is used without
+    building. Returns the result and the time spent waiting for others.
+    """
+
+    waited = 0.
+    if not rebuild:
+        result = lookup()
+        if result is not None:
+            return result, waited
+
+    lock = BuildLock(lock_path, stale_after=stale_after)
+    while True:
+        if lock.try_acquire():
+            with lock:
+                # Another process might have finished building between the
+                # lookup and taking the lock
+                if waited > 0 or not rebuild:
+                    result = lookup()
+                    if result is not None:
+                        return result, waited
+                return build(), waited
+
+        holder = lock.holder()
+        logger.info(f"Waiting for concurrent build (held by {holder})")
+        start = time.monotonic()
+        with span("wait_build", lock=str(lock_path), holder=str(holder)):
+            lock.wait(max(timeout - waited, 0), poll=poll)
+        waited += time.monotonic() - start
+        logger.info(f"Waited {waited:.1f}s for concurrent build")
+
+        result = lookup()
+        if result is not None:
+            return result, waited
+        logger.warning("Concurrent build did not produce a result, retrying")
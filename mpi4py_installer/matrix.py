@@ -0,0 +1,215 @@
+from .                      import logger, pip_cmd, python_abi, init_env, \
+    pip_wheel_mpi4py
+from .activate              import write_activation_script, activation_path
+from .fingerprint           import libmpi, abi_family, select_libmpi
+from .locking               import location_lock
+from .mpi_config            import MPIConfig
+from .swap                  import interpreter_paths, stage_wheel, swap_in, \
+    rollback, run_sanity
+from .tracing               import span
+from .validated_dataclasses import ValidatedDataClass
+from .wheelhouse            import Wheelhouse
+
+import shutil
+import time
+
+from pathlib            import Path
+from dataclasses        import dataclass
+from concurrent.futures import ThreadPoolExecutor
+
+
+@dataclass(frozen=True)
+class MatrixResult(metaclass=ValidatedDataClass):
+    """
+    Outcome of installing mpi4py for one interpreter of a build matrix. The
+    `phase` is the last phase that was started (and failed, unless `ok`).
+    """
+    python: str
+    ok: bool
+    phase: str
+    abi: str|None = None
+    wheel: str|None = None
+    build_time: float|None = None
+    install_time: float|None = None
+    sanity_time: float|None = None
+    error: str|None = None
+
+
+class BuildMatrix:
+    """
+    Installs mpi4py for several python interpreters concurrently, using the
+    same MPI variant. The `init` environment and the MPICC introspection are
+    shared by all builds, and interpreters with the same ABI share a wheel.
+    Every interpreter goes through the same build -> stage -> sanity -> swap
+    -> sanity (or rollback) -> activation script pipeline as a single install,
+    and installs into the same location are serialized. With `abi_portable`,
+    the wheels are ABI-portable builds (c.f. `install`).
+    """
+
+    def __init__(
+                self, pythons: list[str], site: str, system: str, variant: str,
+                config: MPIConfig, init: str|None, cache: Wheelhouse,
+                wheelhouse: Wheelhouse|None = None, publish: bool = False,
+                use_user: bool = False, overwrite_system: bool = False,
+                lock_timeout: float = 3600, abi_portable: bool = False
+            ):
+        self.pythons = pythons
+        self.site = site
+        self.system = system
+        self.variant = variant
+        self.config = config
+        self.init = init
+        self.cache = cache
+        self.wheelhouse = wheelhouse
+        self.publish = publish
+        self.use_user = use_user
+        self.overwrite_system = overwrite_system
+        self.lock_timeout = lock_timeout
+        self.abi_portable = abi_portable
+        self.env: dict[str, str]|None = None
+        # runtime environment of ABI-portable builds
+        self.run_env: dict[str, str]|None = None
+
+
+    def _install(self, python: str) -> MatrixResult:
+        phase = "inspect"
+        result = {"python": python}
+        try:
+            result["abi"] = python_abi(python)
+            paths = interpreter_paths(python)
+            if self.config.in_system_prefix(paths["prefix"]) \
+                    and not self.overwrite_system:
+                raise RuntimeError(
+                    f"{python} is in the system prefix (use --overwrite_system)"
+                )
+
+            phase = "build"
+            start = time.perf_counter()
+            with span("matrix.build", python=python):
+                wheel = pip_wheel_mpi4py(
+                    pip_cmd(self.config, python), self.init, self.config,
+                    wheelhouse=self.wheelhouse, publish=self.publish,
+                    cache=self.cache, lock_timeout=self.lock_timeout,
+                    env=self.env, python=python,
+                    abi_portable=self.run_env is not None
+                )
+            result["wheel"] = str(wheel)
+            result["build_time"] = time.perf_counter() - start
+
+            location = Path(paths["usersite" if self.use_user else "platlib"])
+            with location_lock(location):
+                phase = "install"
+                start = time.perf_counter()
+                with span("matrix.stage", python=python):
+                    staging = stage_wheel(wheel, location, python=python)
+                result["install_time"] = time.perf_counter() - start
+
+                phase = "sanity"
+                start = time.perf_counter()
+                with span("matrix.sanity", python=python):
+                    sanity = run_sanity(
+                        python, self.site, self.system, self.variant,
+                        path=(str(staging),), env=self.run_env
+                    )
+                result["sanity_time"] = time.perf_counter() - start
+                if not sanity:
+                    shutil.rmtree(staging)
+                    raise RuntimeError(
+                        "sanity check failed, kept current install"
+                    )
+
+                phase = "swap"
+                swap_in(staging, location)
+
+                phase = "sanity"
+                if not run_sanity(
+                            python, self.site, self.system, self.variant,
+                            env=self.run_env
+                        ):
+                    rollback(location)
+                    raise RuntimeError("sanity check failed, rolled back")
+
+            phase = "activate"
+            write_activation_script(
+                activation_path(
+                    paths["prefix"], self.use_user, paths["usersite"]
+                ),
+                self.run_env or self.env, self.config,
+                comment=f"system={self.system!r}, variant={self.variant!r}"
+            )
+        except Exception as e:
+            logger.critical(f"{python}: {phase} failed: {e}")
+            return MatrixResult(ok=False, phase=phase, error=str(e), **result)
+
+        logger.info(f"{python}: mpi4py installed")
+        return MatrixResult(ok=True, phase=phase, **result)
+
+
+    def run(self, slots: int|None = None) -> list[MatrixResult]:
+        """
+        run(self, slots: int|None = None) -> list[MatrixResult]
+
+
+        Install mpi4py for every interpreter, using at most `slots` concurrent
+        workers (default: one per interpreter). Returns the results in the
+        order of `pythons`.
+        """
+
+        self.env = init_env(self.init)
+        # warm the shared MPICC introspection before the workers need it
+        with span("matrix.libmpi"):
+            logger.info(f"MPI library: {libmpi(self.config, env=self.env)}")
+
+        if self.abi_portable:
+            family = abi_family(self.config, env=self.env)
+            if family is None:
+                logger.warning(
+                    "The MPI library is not part of a known MPI ABI family => "
+                    "building for this library only"
+                )
+            else:
+                logger.info(f"ABI-portable builds for {family}")
+                self.config = self.config.portable()
+                self.run_env = select_libmpi(self.config, self.env)
+
+        slots = slots or len(self.pythons)
+        with ThreadPoolExecutor(max_workers=slots) as pool:
+            return list(pool.map(self._install, self.pythons))
+
+
+def report(results: list[MatrixResult]) -> str:
+    """
+    report(results: list[MatrixResult]) -> str
+
+
+    Format the results of a build matrix as a table with one line per
+    interpreter, followed by the failures.
+    """
+
+    def seconds(value):
+        return "-" if value is None else f"{value:.1f}s"
+
+    wheels = [r.wheel for r in results if r.wheel is not None]
+    lines = [
+        f"{'status':8} {'build':>9} {'install':>9} {'sanity':>9}  "
+        f"python (abi)"
+    ]
+    failures = list()
+    for r in results:
+        build = seconds(r.build_time)
+        if r.wheel is not None and wheels.count(r.wheel) > 1:
+            build = "*" + build
+        lines.append(" ".join([
+            f"{'done' if r.ok else 'failed':8}", f"{build:>9}",
+            f"{seconds(r.install_time):>9}", f"{seconds(r.sanity_time):>9} ",
+            f"{r.python} ({r.abi})"
+        ]))
+        if not r.ok:
+            failures.append(f"  {r.python}: {r.phase} -- {r.error}")
+
+    lines.append("(* = wheel shared with other interpreters)")
+    if failures:
+        lines.append(f"{len(failures)} failures:")
+        lines += failures
+
+    return "\n".join(lines)
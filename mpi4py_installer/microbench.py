@@ -0,0 +1,106 @@
+from . import logger
+
+import json
+import os
+import subprocess
+import sys
+
+
+# Run by the interpreter under test: time mpi4py calls that are dominated by
+# the call overhead (rather than by communication). Each result is the best
+# (lowest) time per call out of `repeat` runs of `n` calls, in ns.
+BENCH_SCRIPT = """
+import array, json, sys, time
+from mpi4py import MPI
+
+n, repeat = int(sys.argv[1]), int(sys.argv[2])
+world, comm = MPI.COMM_WORLD, MPI.COMM_SELF
+sbuf, rbuf = array.array("d", [1.0]), array.array("d", [0.0])
+
+calls = {
+    "Get_rank":         lambda: world.Get_rank(),
+    "Wtime":            lambda: MPI.Wtime(),
+    "Barrier(SELF)":    lambda: comm.Barrier(),
+    "Allreduce(SELF)":  lambda: comm.Allreduce(sbuf, rbuf),
+    "Sendrecv(SELF)":   lambda: comm.Sendrecv(sbuf, 0, recvbuf=rbuf, source=0),
+    "allreduce(SELF)":  lambda: comm.allreduce(1),
+}
+
+results = dict()
+for name, call in calls.items():
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(n):
+            call()
+        best = min(best, time.perf_counter() - start)
+    results[name] = best / n * 1e9
+
+print(json.dumps(results))
+"""
+
+
+def run_microbench(
+            python: str = sys.executable, path: tuple[str, ...] = (),
+            n: int = 20000, repeat: int = 5,
+            env: dict[str, str]|None = None
+        ) -> dict[str, float]:
+    """
+    run_microbench(
+            python: str = sys.executable, path: tuple[str, ...] = (),
+            n: int = 20000, repeat: int = 5,
+            env: dict[str, str]|None = None
+        ) -> dict[str, float]
+
+
+    Measure the call overhead (ns per call) of a few mpi4py functions, using
+    the mpi4py that the `python` interpreter imports (with `path` prepended
+    to its PYTHONPATH -- eg. to measure a staged install). The benchmark runs
+    in `env` (default: the current environment) -- eg. the environment that
+    provides the MPI library. Raises RuntimeError if mpi4py can't be imported
+    or initialized.
+    """
+
+    env = dict(os.environ if env is None else env)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in [*path, env.get("PYTHONPATH")] if p
+    )
+    out = subprocess.run(
+        [python, "-c", BENCH_SCRIPT, str(n), str(repeat)],
+        capture_output=True, env=env
+    )
+
+    logger.debug(f"stderr={out.stderr.decode()}")
+    if out.returncode != 0:
+        raise RuntimeError(f"mpi4py microbenchmark failed: {out.stderr.decode()}")
+
+    return json.loads(out.stdout.decode().splitlines()[-1])
+
+
+def report(
+            results: dict[str, float], base: dict[str, float]|None = None,
+            labels: tuple[str, str] = ("new", "current")
+        ) -> str:
+    """
+    report(
+            results: dict[str, float], base: dict[str, float]|None = None,
+            labels: tuple[str, str] = ("new", "current")
+        ) -> str
+
+
+    Format microbenchmark `results` as a table, next to the `base` results
+    (if any) and their ratio.
+    """
+
+    width = max(len(name) for name in results)
+    lines = [f"{'mpi4py call':{width}} {labels[0]:>12}"]
+    if base is not None:
+        lines[0] += f" {labels[1]:>12} {'ratio':>7}"
+
+    for name, value in results.items():
+        line = f"{name:{width}} {value:>10.1f}ns"
+        if base is not None and name in base:
+            line += f" {base[name]:>10.1f}ns {value/base[name]:>7.2f}"
+        lines.append(line)
+
+    return "\n".join(lines)
@@ -1,8 +1,114 @@
+from .singleton             import dict_hash
 from .validated_dataclasses import ValidatedDataClass
 
+import shlex
 import sys
 
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict, replace
+
+
+@dataclass(frozen=True)
+class BuildProfile(metaclass=ValidatedDataClass):
+    """
+    Named set of optimization settings, which are added to the CFLAGS and
+    LDFLAGS of an MPIConfig. `march`/`mtune` should name the compute nodes'
+    CPU (which can differ from the login nodes' CPU). `march` can't be
+    "native": the fingerprint doesn't cover the build host's CPU => the wheel
+    would be reused on other CPUs.
+    """
+
+    opt:   str|None = None  # -O level: eg. "2", "3", "s", "g"
+    march: str|None = None
+    mtune: str|None = None
+    lto:   bool     = False
+    no_semantic_interposition: bool = False
+    as_needed: bool = False  # link with -Wl,--as-needed
+
+    CFLAGS:  str|None = None  # any additional flags
+    LDFLAGS: str|None = None
+
+
+    def __post_validate__(self):
+        if self.march == "native":
+            raise RuntimeError(
+                "march='native' builds for the build host's CPU -- name the "
+                "target CPU instead (eg. 'x86-64-v3' or 'znver3')"
+            )
+
+
+    @property
+    def cflags(self) -> list[str]:
+        """
+        cflags -> list[str]
+
+        Compiler flags for this profile
+        """
+
+        flags = list()
+        if self.opt is not None:
+            flags.append(f"-O{self.opt}")
+        if self.march is not None:
+            flags.append(f"-march={self.march}")
+        if self.mtune is not None:
+            flags.append(f"-mtune={self.mtune}")
+        if self.lto:
+            flags.append("-flto")
+        if self.no_semantic_interposition:
+            flags.append("-fno-semantic-interposition")
+        if self.CFLAGS:
+            flags.append(self.CFLAGS)
+        return flags
+
+
+    @property
+    def ldflags(self) -> list[str]:
+        """
+        ldflags -> list[str]
+
+        Linker flags for this profile -- with LTO, code generation happens at
+        link time => the optimization flags are needed here too
+        """
+
+        flags = list()
+        if self.lto:
+            flags += [f for f in self.cflags if f != self.CFLAGS]
+        if self.as_needed:
+            flags.append("-Wl,--as-needed")
+        if self.LDFLAGS:
+            flags.append(self.LDFLAGS)
+        return flags
+
+
+@dataclass(frozen=True)
+class PackageRecipe(metaclass=ValidatedDataClass):
+    """
+    How to build an MPI-aware package (eg. h5py, petsc4py) against the same
+    MPI as mpi4py. The `env` values can refer to the variant's `{MPICC}`,
+    `{CC}`, `{CFLAGS}` and `{LDFLAGS}`. Packages are built without build
+    isolation (unless `build_isolation`) => the staged mpi4py, and the
+    packages that this one `depends` on, are used by the build.
+    """
+
+    requirement: str|None = None  # pip requirement (default: the name)
+    env: dict[str, str]|None = None
+    depends: list[str]|None = None  # other packages of the set
+    module: str|None = None  # imported by the sanity check (default: name)
+    build_isolation: bool = False
+
+
+    def build_env(self, config: "MPIConfig") -> dict[str, str]:
+        """
+        build_env(self, config: MPIConfig) -> dict[str, str]
+
+        Environment variables of this recipe's build, with the fields of
+        `config` filled in
+        """
+
+        fields = {
+            "MPICC": config.MPICC or "mpicc", "CC": config.CC or "",
+            "CFLAGS": config.CFLAGS or "", "LDFLAGS": config.LDFLAGS or ""
+        }
+        return {k: v.format(**fields) for k, v in (self.env or {}).items()}
 
 
 @dataclass(frozen=True)
@@ -17,6 +123,38 @@ class MPIConfig(metaclass=ValidatedDataClass):
     init:       str|list[str]|None = None
     mpicc_show: str|None           = None
 
+    profile: str|None = None
+
+    # MPI-aware packages (c.f. PackageRecipe) to build on top of mpi4py --
+    # these have their own fingerprints
+    packages: list[str]|None = None
+
+    # Command that launches MPI programs -- `{nprocs}` is replaced by the
+    # number of ranks, and `{nodes}` by the number of nodes. This does not
+    # affect the build.
+    launcher: str|None = None
+
+    # Environment variables to set at runtime (eg. MPI tuning) -- these are
+    # written to the activation script. This does not affect the build.
+    runtime_env: dict[str, str]|None = None
+
+    # Fields that don't affect the build => not part of the fingerprint
+    RUNTIME_FIELDS = ("launcher", "runtime_env")
+
+    # Fields that select the packages built on top of mpi4py => not part of
+    # mpi4py's fingerprint
+    PACKAGE_FIELDS = ("packages",)
+
+    # Used when no launcher is configured
+    DEFAULT_LAUNCHER = "mpiexec -n {nprocs}"
+
+    # Fields that only select the toolchain (and MPI library) => ABI-portable
+    # builds of variants of the same ABI family don't depend on them
+    TOOLCHAIN_FIELDS = ("MPICC", "CC", "sys_prefix", "init", "mpicc_show")
+
+    # Emit rpaths as RUNPATH => LD_LIBRARY_PATH can select the MPI library
+    PORTABLE_LDFLAGS = "-Wl,--enable-new-dtags"
+
 
     def __post_init__(self):
         if isinstance(self.sys_prefix, list):
@@ -27,10 +165,16 @@ class MPIConfig(metaclass=ValidatedDataClass):
             if not self.init: # empty list
                 object.__setattr__(self, "init", None)
 
+        if isinstance(self.packages, list):
+            if not self.packages: # empty list
+                object.__setattr__(self, "packages", None)
+
 
     @staticmethod
-    def check_prefix(prefix):
-        return sys.prefix.startswith(prefix)
+    def check_prefix(prefix, python_prefix=None):
+        if python_prefix is None:
+            python_prefix = sys.prefix
+        return python_prefix.startswith(prefix)
 
 
     @property
@@ -42,15 +186,103 @@ class MPIConfig(metaclass=ValidatedDataClass):
         with a string contained in MPIConfig.sys_prefix
         """
 
+        return self.in_system_prefix(sys.prefix)
+
+
+    def in_system_prefix(self, python_prefix: str) -> bool:
+        """
+        in_system_prefix(self, python_prefix: str) -> bool
+
+        Returns True only if `python_prefix` (the `sys.prefix` of an
+        interpreter) starts with a string contained in MPIConfig.sys_prefix
+        """
+
         if self.sys_prefix is None:
             return False
 
         if isinstance(self.sys_prefix, str):
-            return MPIConfig.check_prefix(self.sys_prefix)
+            return MPIConfig.check_prefix(self.sys_prefix, python_prefix)
 
         # only remaining type for self.sys_prefix => list[str]
         for prefix in self.sys_prefix:
-            if MPIConfig.check_prefix(prefix):
+            if MPIConfig.check_prefix(prefix, python_prefix):
                 return True
 
         return False
+
+
+    def launch_command(self, nprocs: int, nodes: int = 1) -> list[str]:
+        """
+        launch_command(self, nprocs: int, nodes: int = 1) -> list[str]
+
+        Command (to be followed by the program) that launches `nprocs` MPI
+        ranks on `nodes` nodes, using the configured (or default) launcher
+        """
+
+        launcher = self.launcher or MPIConfig.DEFAULT_LAUNCHER
+        return shlex.split(launcher.format(nprocs=nprocs, nodes=nodes))
+
+
+    def with_profile(self, name: str, profile: BuildProfile) -> "MPIConfig":
+        """
+        with_profile(self, name: str, profile: BuildProfile) -> MPIConfig
+
+        Copy of this MPIConfig, with the flags of the build `profile` (called
+        `name`) appended to CFLAGS and LDFLAGS
+        """
+
+        def join(flags, extra):
+            return " ".join(([flags] if flags else []) + extra) or None
+
+        return replace(
+            self, profile=name,
+            CFLAGS=join(self.CFLAGS, profile.cflags),
+            LDFLAGS=join(self.LDFLAGS, profile.ldflags)
+        )
+
+
+    def portable(self) -> "MPIConfig":
+        """
+        portable(self) -> MPIConfig
+
+        Copy of this MPIConfig for ABI-portable builds: the MPI library that
+        the build links against can be replaced at runtime (using
+        LD_LIBRARY_PATH) by any library of the same ABI family
+        """
+
+        if self.LDFLAGS and MPIConfig.PORTABLE_LDFLAGS in self.LDFLAGS:
+            return self
+        return replace(self, LDFLAGS=" ".join(
+            [f for f in [self.LDFLAGS, MPIConfig.PORTABLE_LDFLAGS] if f]
+        ))
+
+
+    @property
+    def portable_fingerprint(self) -> str:
+        """
+        portable_fingerprint -> str
+
+        Hash of the build settings of this MPIConfig that ABI-portable builds
+        depend on (i.e. without the toolchain fields)
+        """
+
+        settings = asdict(self)
+        for name in MPIConfig.RUNTIME_FIELDS + MPIConfig.PACKAGE_FIELDS \
+                + MPIConfig.TOOLCHAIN_FIELDS:
+            settings.pop(name)
+        return dict_hash(settings)
+
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        fingerprint -> str
+
+        Hash of all (build) settings in this MPIConfig. Two configs with the
+        same fingerprint will result in identical `pip` build commands.
+        """
+
+        settings = asdict(self)
+        for name in MPIConfig.RUNTIME_FIELDS + MPIConfig.PACKAGE_FIELDS:
+            settings.pop(name)
+        return dict_hash(settings)
@@ -0,0 +1,309 @@
+from .           import logger
+from .locking    import single_flight
+from .mpi_config import MPIConfig, PackageRecipe
+from .runners    import ShellRunner
+from .singleton  import dict_hash
+from .swap       import install_target
+from .tracing    import span
+from .wheelhouse import Wheelhouse
+
+import graphlib
+import importlib
+import os
+import re
+import shlex
+import sys
+import tempfile
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses        import asdict
+from pathlib            import Path
+
+
+# Shared objects of MPI libraries (eg. libmpi.so.40, libmpi_gnu_123.so.12)
+LIBMPI_PATTERN = re.compile(r"/libmpi(?:_\w+)?\.so[.\d]*$")
+
+
+def dependency_graph(
+            recipes: dict[str, PackageRecipe]
+        ) -> dict[str, set[str]]:
+    """
+    dependency_graph(
+            recipes: dict[str, PackageRecipe]
+        ) -> dict[str, set[str]]
+
+
+    The packages that each package of `recipes` depends on (mpi4py is implicit
+    => not included). Raises RuntimeError if a package depends on one that is
+    not in `recipes`.
+    """
+
+    graph = dict()
+    for name, recipe in recipes.items():
+        depends = set(recipe.depends or []) - {"mpi4py"}
+        missing = depends - set(recipes)
+        if missing:
+            raise RuntimeError(
+                f"Package '{name}' depends on {sorted(missing)}, which are not "
+                "part of the package set"
+            )
+        graph[name] = depends
+    return graph
+
+
+def _sorter(recipes: dict[str, PackageRecipe]) -> graphlib.TopologicalSorter:
+    sorter = graphlib.TopologicalSorter(dependency_graph(recipes))
+    try:
+        sorter.prepare()
+    except graphlib.CycleError as e:
+        raise RuntimeError(f"Dependency cycle between packages: {e.args[1]}")
+    return sorter
+
+
+def build_order(recipes: dict[str, PackageRecipe]) -> list[list[str]]:
+    """
+    build_order(recipes: dict[str, PackageRecipe]) -> list[list[str]]
+
+
+    The packages of `recipes` in generations: the packages of each generation
+    only depend on earlier generations => they can be built in parallel.
+    Raises RuntimeError if the dependencies have a cycle.
+    """
+
+    sorter = _sorter(recipes)
+    order = list()
+    while sorter.is_active():
+        ready = sorted(sorter.get_ready())
+        order.append(ready)
+        sorter.done(*ready)
+    return order
+
+
+def package_fingerprints(
+            recipes: dict[str, PackageRecipe], base: str
+        ) -> dict[str, str]:
+    """
+    package_fingerprints(
+            recipes: dict[str, PackageRecipe], base: str
+        ) -> dict[str, str]
+
+
+    Build fingerprint of each package: it covers the recipe, the build
+    fingerprint of mpi4py (`base`, which covers the config, the python ABI and
+    the MPI library), and the fingerprints of the packages it depends on =>
+    changing a package rebuilds everything that depends on it.
+    """
+
+    graph = dependency_graph(recipes)
+    fingerprints: dict[str, str] = dict()
+    for generation in build_order(recipes):
+        for name in generation:
+            fingerprints[name] = dict_hash({
+                "mpi4py":  base,
+                "package": name,
+                "recipe":  asdict(recipes[name]),
+                "depends": {d: fingerprints[d] for d in sorted(graph[name])}
+            })
+    return fingerprints
+
+
+def set_fingerprint(base: str, fingerprints: dict[str, str]) -> str:
+    """
+    set_fingerprint(base: str, fingerprints: dict[str, str]) -> str
+
+
+    Fingerprint of an install of mpi4py (build fingerprint `base`) together
+    with its packages (c.f. `package_fingerprints`). Without packages, this is
+    mpi4py's fingerprint.
+    """
+
+    if not fingerprints:
+        return base
+    return dict_hash({"mpi4py": base, "packages": fingerprints})
+
+
+def pip_build_package(
+            name: str, recipe: PackageRecipe, config: MPIConfig,
+            wheel_dir: str|Path, env: dict[str, str],
+            python: str = sys.executable, path: tuple[str, ...] = ()
+        ) -> Path:
+    """
+    pip_build_package(
+            name: str, recipe: PackageRecipe, config: MPIConfig,
+            wheel_dir: str|Path, env: dict[str, str],
+            python: str = sys.executable, path: tuple[str, ...] = ()
+        ) -> Path
+
+
+    Build a wheel of the package `name` from source, in the environment `env`
+    (i.e. after `init`) with the recipe's variables, and `path` (eg. the
+    staged mpi4py) prepended to the PYTHONPATH. Returns the wheel.
+    """
+
+    env = dict(env)
+    env.update(recipe.build_env(config))
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in [*path, env.get("PYTHONPATH")] if p
+    )
+
+    cmd = f"{python} -m pip wheel --no-cache-dir --no-deps"
+    cmd += f" --no-binary={name} -w {wheel_dir}"
+    if not recipe.build_isolation:
+        cmd += " --no-build-isolation"
+    cmd += f" {shlex.quote(recipe.requirement or name)}"
+
+    with ShellRunner(env=env) as bash_runner:
+        logger.info(f"Running build command: {cmd}")
+        with span("compile", package=name):
+            out = bash_runner.run(cmd, capture_output=True)
+
+        logger.debug(f"stderr={out.stderr.decode()}")
+        out.check_returncode()
+        logger.debug(f"stdout={out.stdout.decode()}")
+
+    wheels = sorted(Path(wheel_dir).glob("*.whl"))
+    if not wheels:
+        raise RuntimeError(f"pip did not produce a {name} wheel in {wheel_dir}")
+
+    logger.info(f"Build resource usage ({name}): {bash_runner.usage}")
+    return wheels[-1]
+
+
+def build_packages(
+            recipes: dict[str, PackageRecipe], config: MPIConfig,
+            fingerprints: dict[str, str], env: dict[str, str], staging: Path,
+            cache: Wheelhouse, wheelhouse: Wheelhouse|None = None,
+            publish: bool = False, lock_timeout: float = 3600,
+            python: str = sys.executable, workers: int = 1
+        ) -> dict[str, Path]:
+    """
+    build_packages(
+            recipes: dict[str, PackageRecipe], config: MPIConfig,
+            fingerprints: dict[str, str], env: dict[str, str], staging: Path,
+            cache: Wheelhouse, wheelhouse: Wheelhouse|None = None,
+            publish: bool = False, lock_timeout: float = 3600,
+            python: str = sys.executable, workers: int = 1
+        ) -> dict[str, Path]
+
+
+    Build (or fetch) the wheels of the packages in `recipes`, and install them
+    into `staging` (where the new mpi4py is staged). A package is built as soon
+    as the packages it depends on are staged, on a pool of `workers` threads
+    => independent packages are built in parallel. Wheels are cached (or
+    published) by their fingerprint, just like mpi4py's. Returns the wheel of
+    each package.
+    """
+
+    stage_lock = threading.Lock()
+
+    def build(name):
+        recipe, fingerprint = recipes[name], fingerprints[name]
+
+        wheel = None
+        if (wheelhouse is not None) and not publish:
+            wheel = wheelhouse.lookup(fingerprint)
+
+        if wheel is None:
+            target = wheelhouse if publish else cache
+
+            def build_wheel():
+                with tempfile.TemporaryDirectory() as wheel_dir:
+                    built = pip_build_package(
+                        name, recipe, config, wheel_dir, env, python=python,
+                        path=(str(staging),)
+                    )
+                    return target.publish(
+                        fingerprint, built,
+                        meta={"package": name, "python": python}
+                    )
+
+            wheel, waited = single_flight(
+                target.lock_path(fingerprint), build_wheel,
+                lambda: target.lookup(fingerprint), rebuild=publish,
+                timeout=lock_timeout
+            )
+            if waited > 0:
+                logger.info(f"Waited {waited:.1f}s for a build of {name}")
+
+        # pip doesn't expect concurrent installs into one target
+        with stage_lock:
+            install_target(wheel, staging, python=python)
+        return wheel
+
+    sorter = _sorter(recipes)
+    wheels = dict()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        running = dict()
+        while sorter.is_active():
+            for name in sorted(sorter.get_ready()):
+                logger.info(f"Building {name}")
+                running[pool.submit(build, name)] = name
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                wheels[name] = future.result()
+                sorter.done(name)
+
+    return wheels
+
+
+def loaded_mpi_libraries() -> set[str]|None:
+    """
+    loaded_mpi_libraries() -> set[str]|None
+
+
+    The MPI libraries that are loaded into this process -- None if this can't
+    be determined (no /proc).
+    """
+
+    try:
+        with open("/proc/self/maps") as f:
+            maps = f.read()
+    except OSError:
+        return None
+
+    libraries = set()
+    for line in maps.splitlines():
+        fields = line.split(maxsplit=5)
+        if len(fields) == 6 and LIBMPI_PATTERN.search(fields[5]):
+            libraries.add(os.path.realpath(fields[5]))
+    return libraries
+
+
+def check_packages(recipes: dict[str, PackageRecipe]) -> bool:
+    """
+    check_packages(recipes: dict[str, PackageRecipe]) -> bool
+
+
+    Import the packages of `recipes` (after mpi4py.MPI, i.e. after the site's
+    sanity check), and check that they all use mpi4py's MPI library: a package
+    that was built against another MPI loads a second library.
+    """
+
+    if not recipes:
+        return True
+
+    # Packages may use MPI when they are imported (the site's sanity check
+    # doesn't need to initialize it)
+    from mpi4py import MPI
+    if not MPI.Is_initialized():
+        MPI.Init()
+
+    for name, recipe in recipes.items():
+        module = recipe.module or name
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            logger.critical(f"Could not import {module}: {e}")
+            return False
+        logger.info(f"Imported {module}")
+
+    # One MPI installs several libmpi*.so (eg. Open MPI's libmpi_mpifh)
+    libraries = loaded_mpi_libraries()
+    logger.info(f"Loaded MPI libraries: {libraries}")
+    if libraries is not None and len({Path(l).parent for l in libraries}) > 1:
+        logger.critical(f"Several MPI libraries are loaded: {libraries}")
+        return False
+
+    return True
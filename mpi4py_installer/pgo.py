@@ -0,0 +1,275 @@
+from .            import logger, pip_cmd, pip_build_mpi4py
+from .mpi_config import MPIConfig, BuildProfile
+from .microbench import run_microbench
+from .swap       import install_target
+from .tracing    import span
+
+import os
+import shlex
+import shutil
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+from pathlib import Path
+
+
+# Training workload for the instrumented build: exercises the code paths of
+# typical small-message workloads -- point-to-point (buffers and pickled
+# objects), collectives, and request handling.
+TRAINING_SCRIPT = """
+import array, sys
+from mpi4py import MPI
+
+iterations = int(sys.argv[1])
+comm = MPI.COMM_WORLD
+rank, size = comm.Get_rank(), comm.Get_size()
+dest, source = (rank + 1) % size, (rank - 1) % size
+sbuf, rbuf = array.array("d", [1.0]*64), array.array("d", [0.0]*64)
+gbuf = array.array("d", [0.0]*64*size)
+
+for i in range(iterations):
+    # point-to-point
+    comm.Sendrecv(sbuf, dest, recvbuf=rbuf, source=source)
+    reqs = [comm.Irecv(rbuf, source=source), comm.Isend(sbuf, dest)]
+    MPI.Request.Waitall(reqs)
+    req = comm.isend({"i": i}, dest)
+    comm.recv(source=source)
+    req.wait()
+    # request handling
+    req = comm.Irecv(rbuf, source=source)
+    comm.Send(sbuf, dest)
+    while not req.Test():
+        pass
+    # collectives
+    comm.Barrier()
+    comm.Bcast(sbuf, root=0)
+    comm.Allreduce(sbuf, rbuf, op=MPI.SUM)
+    comm.Reduce(sbuf, rbuf, op=MPI.MAX, root=0)
+    comm.Allgather(sbuf, gbuf)
+    comm.bcast(i, root=0)
+    comm.allreduce(rank)
+    comm.Get_rank(); comm.Get_size(); MPI.Wtime()
+"""
+
+
+def compiler_family(config: MPIConfig, env: dict[str, str]) -> str:
+    """
+    compiler_family(config: MPIConfig, env: dict[str, str]) -> str
+
+
+    "clang" if the C compiler (CC, or MPICC) in `env` is clang-based, "gcc"
+    otherwise. These need different PGO flags.
+    """
+
+    cc = config.CC or config.MPICC or env.get("CC", "cc")
+    try:
+        out = subprocess.run(
+            shlex.split(cc) + ["--version"], capture_output=True, text=True,
+            env=env
+        ).stdout
+    except OSError:
+        out = ""
+    return "clang" if "clang" in out.lower() else "gcc"
+
+
+def pgo_profile(family: str, profile_dir: Path, phase: str) -> BuildProfile:
+    """
+    pgo_profile(family: str, profile_dir: Path, phase: str) -> BuildProfile
+
+
+    Compiler and linker flags for the "generate" (instrumented build) or "use"
+    (optimized build) `phase` of PGO, with the profile data in `profile_dir`.
+    """
+
+    if phase == "generate":
+        flags = f"-fprofile-generate={profile_dir}"
+        if family == "gcc":
+            # the training workload is multi-threaded (progress threads)
+            return BuildProfile(
+                CFLAGS=flags + " -fprofile-update=atomic", LDFLAGS=flags
+            )
+        return BuildProfile(CFLAGS=flags, LDFLAGS=flags)
+
+    if family == "gcc":
+        flags = f"-fprofile-use={profile_dir} -fprofile-correction"
+        flags += " -Wno-missing-profile"
+    else:
+        flags = f"-fprofile-use={profile_dir / 'default.profdata'}"
+    return BuildProfile(CFLAGS=flags, LDFLAGS=flags)
+
+
+def fetch_sdist(python: str, dest: Path, env: dict[str, str]) -> Path:
+    """
+    fetch_sdist(python: str, dest: Path, env: dict[str, str]) -> Path
+
+
+    Download and extract the mpi4py sdist into `dest`. Returns the source
+    directory. Both PGO builds must compile the same source paths, otherwise
+    gcc can't match the profile data to the object files.
+    """
+
+    subprocess.run(
+        [
+            python, "-m", "pip", "download", "--no-binary=:all:",
+            "--no-deps", "-d", str(dest), "mpi4py"
+        ],
+        capture_output=True, check=True, env=env
+    )
+    sdist = next(dest.glob("mpi4py-*.tar.gz"))
+    with tarfile.open(sdist) as tar:
+        tar.extractall(dest, filter="data")
+
+    return dest / sdist.name.removesuffix(".tar.gz")
+
+
+def train(
+            python: str, path: Path, launcher: list[str], iterations: int,
+            env: dict[str, str]
+        ):
+    """
+    train(
+            python: str, path: Path, launcher: list[str], iterations: int,
+            env: dict[str, str]
+        )
+
+
+    Run the training workload using the `launcher` command, with the
+    (instrumented) mpi4py in `path`.
+    """
+
+    env = dict(env)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in [str(path), env.get("PYTHONPATH")] if p
+    )
+    cmd = launcher + [python, "-c", TRAINING_SCRIPT, str(iterations)]
+
+    logger.info(f"Running PGO training: {shlex.join(cmd[:-2])} ...")
+    out = subprocess.run(cmd, capture_output=True, env=env)
+    logger.debug(f"stdout={out.stdout.decode()}")
+    if out.returncode != 0:
+        logger.critical(f"stderr={out.stderr.decode()}")
+        raise RuntimeError("PGO training workload failed")
+
+
+def merge_profiles(family: str, profile_dir: Path, env: dict[str, str]):
+    """
+    merge_profiles(family: str, profile_dir: Path, env: dict[str, str])
+
+
+    Check that the training produced profile data -- and merge it into the
+    format that the compiler reads (clang only).
+    """
+
+    if family == "gcc":
+        if not any(profile_dir.rglob("*.gcda")):
+            raise RuntimeError(f"PGO training wrote no profiles: {profile_dir}")
+        return
+
+    raw = sorted(profile_dir.rglob("*.profraw"))
+    if not raw:
+        raise RuntimeError(f"PGO training wrote no profiles: {profile_dir}")
+    subprocess.run(
+        ["llvm-profdata", "merge", "-o", str(profile_dir / "default.profdata")]
+        + [str(r) for r in raw],
+        capture_output=True, check=True, env=env
+    )
+
+
+def pgo_build(
+            config: MPIConfig, wheel_dir: str|Path, env: dict[str, str],
+            python: str = sys.executable, nprocs: int = 2,
+            iterations: int = 2000
+        ) -> Path:
+    """
+    pgo_build(
+            config: MPIConfig, wheel_dir: str|Path, env: dict[str, str],
+            python: str = sys.executable, nprocs: int = 2,
+            iterations: int = 2000
+        ) -> Path
+
+
+    Build a profile-guided optimized mpi4py wheel (in `wheel_dir`) for
+    `config`, in the environment `env` (set up by `init`):
+    1. build mpi4py with instrumentation
+    2. run the training workload with it, using the config's launcher
+    3. rebuild mpi4py (from the same sources) using the collected profile
+    Returns the path of the PGO wheel (c.f. `compare_builds`).
+    """
+
+    launcher = config.launch_command(nprocs)
+    family = compiler_family(config, env)
+    logger.info(f"PGO build using {family=}, launcher={shlex.join(launcher)}")
+
+    with tempfile.TemporaryDirectory(prefix="mpi4py-pgo-") as work:
+        work = Path(work)
+        profile_dir = work / "profile"
+
+        with span("pgo.fetch"):
+            src = fetch_sdist(python, work, env)
+
+        instrumented = config.with_profile(
+            f"{config.profile}+pgo-generate",
+            pgo_profile(family, profile_dir, "generate")
+        )
+        with span("pgo.instrumented"):
+            wheel, _ = pip_build_mpi4py(
+                pip_cmd(instrumented, python), work / "instrumented", None,
+                env=env, source=src
+            )
+            install_target(wheel, work / "train", python=python)
+
+        with span("pgo.train"):
+            train(python, work / "train", launcher, iterations, env)
+            merge_profiles(family, profile_dir, env)
+
+        # Don't reuse the instrumented objects
+        shutil.rmtree(src / "build", ignore_errors=True)
+        optimized = config.with_profile(
+            f"{config.profile}+pgo-use", pgo_profile(family, profile_dir, "use")
+        )
+        with span("pgo.optimized"):
+            wheel, _ = pip_build_mpi4py(
+                pip_cmd(optimized, python), wheel_dir, None, env=env,
+                source=src
+            )
+
+    return wheel
+
+
+def compare_builds(
+            wheel: Path, baseline: Path, python: str = sys.executable,
+            env: dict[str, str]|None = None
+        ) -> dict[str, dict[str, float]]:
+    """
+    compare_builds(
+            wheel: Path, baseline: Path, python: str = sys.executable,
+            env: dict[str, str]|None = None
+        ) -> dict[str, dict[str, float]]
+
+
+    Measure the call overhead (in `env`) of the PGO `wheel` and of the
+    `baseline` (non-PGO) wheel. Returns the microbenchmark results of both
+    ("pgo" and "baseline") -- c.f. `microbench.report`. Warns if the PGO
+    build is slower.
+    """
+
+    with tempfile.TemporaryDirectory(prefix="mpi4py-pgo-") as work:
+        work = Path(work)
+        with span("pgo.microbench"):
+            pgo = install_target(wheel, work / "pgo", python=python)
+            base = install_target(baseline, work / "base", python=python)
+            results = run_microbench(python, path=(str(pgo),), env=env)
+            base_results = run_microbench(
+                python, path=(str(base),), env=env
+            )
+
+    ratios = [results[k]/base_results[k] for k in results if k in base_results]
+    if ratios and statistics.geometric_mean(ratios) > 1:
+        logger.warning(
+            "The PGO build is slower than the non-PGO build -- the training "
+            "workload may not match the benchmarked calls"
+        )
+    return {"pgo": results, "baseline": base_results}
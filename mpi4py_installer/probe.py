@@ -0,0 +1,389 @@
+from .                      import logger
+from .bundle                import bundle_root
+from .bytecode              import precompile
+from .mpi_config            import MPIConfig
+from .swap                  import PACKAGE_ROOT, installed_entries
+from .telemetry             import percentile
+from .validated_dataclasses import ValidatedDataClass
+
+import json
+import os
+import shlex
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from collections import defaultdict
+from contextlib  import contextmanager
+from dataclasses import dataclass
+from pathlib     import Path
+from py_compile  import PycInvalidationMode
+from typing      import Iterator
+
+
+# Run on every rank: time the startup (from the launch until the first line of
+# python runs), importing mpi4py and mpi4py.MPI, and MPI_Init, find the MPI
+# library that the rank resolved, and gather the results on rank 0
+PROBE_SCRIPT = """
+import time
+started = time.time()
+import json, os, socket
+launched = os.environ.get("MPI4PY_PROBE_LAUNCH")
+start = time.perf_counter()
+import mpi4py
+package = time.perf_counter()
+mpi4py.rc.initialize = False
+mpi4py.rc.finalize = False
+from mpi4py import MPI
+imported = time.perf_counter()
+MPI.Init()
+initialized = time.perf_counter()
+
+from mpi4py_installer.sites import get_mpi_library_path
+comm = MPI.COMM_WORLD
+results = comm.gather({
+    "host": socket.gethostname(),
+    "rank": comm.Get_rank(),
+    "libmpi": os.path.realpath(get_mpi_library_path(MPI)),
+    "version": MPI.Get_library_version().strip("\\0 \\n").splitlines()[0],
+    "import_time": imported - start,
+    "init_time": initialized - imported,
+    "import_package": package - start,
+    "startup": None if launched is None else started - float(launched),
+}, root=0)
+if comm.Get_rank() == 0:
+    print(json.dumps(results))
+MPI.Finalize()
+"""
+
+
+@dataclass(frozen=True)
+class ProbeResult(metaclass=ValidatedDataClass):
+    """
+    What one rank of the sweep found: the MPI library that it resolved, and
+    the time it took to import mpi4py.MPI (of which `import_package` was spent
+    importing the mpi4py package) and to initialize MPI (in seconds). The
+    `startup` is the time from the launch until the rank ran python code --
+    this includes the launcher.
+    """
+    host: str
+    rank: int
+    libmpi: str|None
+    version: str
+    import_time: float
+    init_time: float
+    import_package: float|None = None
+    startup: float|None = None
+
+
+def sweep(
+            config: MPIConfig, nodes: int, ppn: int = 1,
+            python: str = sys.executable, env: dict[str, str]|None = None,
+            timeout: float = 600, path: tuple[str, ...] = ()
+        ) -> list[ProbeResult]:
+    """
+    sweep(
+            config: MPIConfig, nodes: int, ppn: int = 1,
+            python: str = sys.executable, env: dict[str, str]|None = None,
+            timeout: float = 600, path: tuple[str, ...] = ()
+        ) -> list[ProbeResult]
+
+
+    Run the probe on `ppn` ranks on each of `nodes` nodes, using the config's
+    launcher, in the environment `env` (eg. set up by `init`), with `path`
+    prepended to PYTHONPATH. Returns the results of all ranks. Raises
+    RuntimeError if the probe fails.
+    """
+
+    env = dict(os.environ if env is None else env)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in [*path, str(PACKAGE_ROOT), env.get("PYTHONPATH")] if p
+    )
+    cmd = config.launch_command(nodes*ppn, nodes=nodes)
+    cmd += [python, "-c", PROBE_SCRIPT]
+
+    logger.info(f"Running probe: {shlex.join(cmd[:-2])} ...")
+    env["MPI4PY_PROBE_LAUNCH"] = repr(time.time())
+    try:
+        out = subprocess.run(
+            cmd, capture_output=True, env=env, timeout=timeout
+        )
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"Sanity sweep timed out after {timeout}s")
+
+    logger.debug(f"stderr={out.stderr.decode()}")
+    if out.returncode != 0:
+        logger.critical(f"stderr={out.stderr.decode()}")
+        raise RuntimeError("Sanity sweep failed")
+
+    return [
+        ProbeResult(**r)
+        for r in json.loads(out.stdout.decode().splitlines()[-1])
+    ]
+
+
+def outliers(
+            results: list[ProbeResult], factor: float = 3,
+            minimum: float = 0.05
+        ) -> list[tuple[ProbeResult, str]]:
+    """
+    outliers(
+            results: list[ProbeResult], factor: float = 3,
+            minimum: float = 0.05
+        ) -> list[tuple[ProbeResult, str]]
+
+
+    Ranks whose import or init time is more than `factor` times the median
+    (and more than `minimum` seconds), with the name of the slow phase.
+    """
+
+    slow = list()
+    for phase in ("import_time", "init_time"):
+        median = statistics.median(getattr(r, phase) for r in results)
+        for r in results:
+            value = getattr(r, phase)
+            if value > factor*median and value > minimum:
+                slow.append((r, phase))
+
+    return slow
+
+
+def report(
+            results: list[ProbeResult], expected: str|None = None
+        ) -> tuple[str, bool]:
+    """
+    report(
+            results: list[ProbeResult], expected: str|None = None
+        ) -> tuple[str, bool]
+
+
+    Summarize the sweep `results` per node, and flag outliers. The sweep
+    passes (True) only if every rank resolved the `expected` MPI library (if
+    given), or else all ranks resolved the same one.
+    """
+
+    by_host = defaultdict(list)
+    for r in results:
+        by_host[r.host].append(r)
+
+    if expected is None:
+        libs = [r.libmpi for r in results]
+        expected = max(set(libs), key=libs.count)
+
+    lines = [
+        f"{'node':20} {'ranks':>5} {'import':>9} {'init':>9}  libmpi (version)"
+    ]
+    mismatches = list()
+    for host, ranks in sorted(by_host.items()):
+        libs = sorted({str(r.libmpi) for r in ranks})
+        versions = sorted({r.version for r in ranks})
+        lines.append(" ".join([
+            f"{host:20}", f"{len(ranks):>5}",
+            f"{max(r.import_time for r in ranks):>8.3f}s",
+            f"{max(r.init_time for r in ranks):>8.3f}s ",
+            f"{', '.join(libs)} ({', '.join(versions)})"
+        ]))
+        mismatches += [r for r in ranks if r.libmpi != expected]
+    lines.append("(import and init: slowest rank on the node)")
+
+    if mismatches:
+        lines.append(f"{len(mismatches)} ranks did not resolve {expected}:")
+        lines += [
+            f"  {r.host} rank {r.rank}: {r.libmpi}" for r in mismatches
+        ]
+
+    slow = outliers(results)
+    if slow:
+        lines.append(f"{len(slow)} outliers:")
+        lines += [
+            f"  {r.host} rank {r.rank}: {phase}={getattr(r, phase):.3f}s"
+            for r, phase in slow
+        ]
+
+    return "\n".join(lines), not mismatches
+
+
+# Install layouts that `startup_probe` can compare: the install as-is, copies
+# of it next to the install (i.e. on the same file system) with timestamp or
+# unchecked-hash pycs, and a node-local copy with unchecked-hash pycs
+LAYOUTS = ("installed", "shared-timestamp", "shared-hash", "node-local-hash")
+
+
+def _copy_install(location: Path, root: Path, mode: PycInvalidationMode):
+    for entry in installed_entries(location, "mpi4py"):
+        src = location / entry
+        if src.is_dir():
+            shutil.copytree(src, root / entry, symlinks=True)
+        else:
+            shutil.copy2(src, root / entry)
+    if not precompile([root], mode=mode):
+        raise RuntimeError(f"Could not compile the mpi4py bytecode in {root}")
+
+
+@contextmanager
+def layouts(
+            location: Path, names: tuple[str, ...] = LAYOUTS
+        ) -> Iterator[dict[str, tuple[str, ...]]]:
+    """
+    layouts(
+            location: Path, names: tuple[str, ...] = LAYOUTS
+        ) -> Iterator[dict[str, tuple[str, ...]]]
+
+
+    Context manager that sets up the install layouts `names` (c.f. LAYOUTS)
+    of the mpi4py installed in `location` (a site-packages directory), and
+    yields the path to prepend to PYTHONPATH for each of them. The copies are
+    removed afterwards. Node-local copies are made in `bundle_root` -- on the
+    node running the installer, so this needs a single-node probe.
+    """
+
+    unknown = set(names) - set(LAYOUTS)
+    if unknown:
+        raise RuntimeError(f"Unknown layouts {unknown} (use: {LAYOUTS})")
+    if not installed_entries(location, "mpi4py"):
+        raise RuntimeError(f"mpi4py is not installed in {location}")
+
+    copies = list()
+    try:
+        paths = dict()
+        for name in names:
+            if name == "installed":
+                paths[name] = ()
+                continue
+
+            where, pyc = name.rsplit("-", 1)
+            root = location if where == "shared" else bundle_root()
+            copy = Path(tempfile.mkdtemp(dir=root, prefix=".mpi4py-probe-"))
+            copies.append(copy)
+            _copy_install(location, copy, {
+                "timestamp": PycInvalidationMode.TIMESTAMP,
+                "hash": PycInvalidationMode.UNCHECKED_HASH
+            }[pyc])
+            paths[name] = (str(copy),)
+        yield paths
+    finally:
+        for copy in copies:
+            shutil.rmtree(copy, ignore_errors=True)
+
+
+def startup_probe(
+            config: MPIConfig, nodes: int, location: Path, ppn: int = 1,
+            names: tuple[str, ...] = ("installed",), repeat: int = 1,
+            python: str = sys.executable, env: dict[str, str]|None = None
+        ) -> dict[str, list[ProbeResult]]:
+    """
+    startup_probe(
+            config: MPIConfig, nodes: int, location: Path, ppn: int = 1,
+            names: tuple[str, ...] = ("installed",), repeat: int = 1,
+            python: str = sys.executable, env: dict[str, str]|None = None
+        ) -> dict[str, list[ProbeResult]]
+
+
+    Launch the probe on `ppn` ranks on each of `nodes` nodes for each of the
+    install layouts `names` of the mpi4py in `location`, `repeat` times. The
+    layouts take turns => file system caches warmed up by one layout don't
+    favor it. Returns the results of all ranks and repeats per layout.
+    """
+
+    if nodes > 1 and any(name.startswith("node-local") for name in names):
+        raise RuntimeError("Node-local layouts need a single-node probe")
+
+    results: dict[str, list[ProbeResult]] = {name: list() for name in names}
+    with layouts(location, names) as paths:
+        for _ in range(repeat):
+            for name in names:
+                logger.info(f"Probing the {name} layout")
+                results[name] += sweep(
+                    config, nodes, ppn=ppn, python=python, env=env,
+                    path=paths[name]
+                )
+
+    return results
+
+
+def steps(result: ProbeResult) -> dict[str, float]:
+    """
+    steps(result: ProbeResult) -> dict[str, float]
+
+
+    Seconds that a rank spent in each step of its startup.
+    """
+
+    package = result.import_package or 0.
+    times = {
+        "startup": result.startup,
+        "import mpi4py": result.import_package,
+        "from mpi4py import MPI": result.import_time - package,
+        "MPI_Init": result.init_time,
+    }
+    times = {name: t for name, t in times.items() if t is not None}
+    times["total"] = sum(times.values())
+    return times
+
+
+def histogram(values: list[float], bins: int = 8, width: int = 40) -> list[str]:
+    """
+    histogram(values: list[float], bins: int = 8, width: int = 40) -> list[str]
+
+
+    Text histogram of `values` (in seconds) with `bins` equal bins, the
+    longest bar being `width` characters.
+    """
+
+    low, high = min(values), max(values)
+    size = (high - low) / bins or 1.
+    counts = [0] * bins
+    for value in values:
+        counts[min(int((value - low) / size), bins - 1)] += 1
+
+    lines = list()
+    for i, count in enumerate(counts):
+        bar = "#" * round(width * count / max(counts))
+        lines.append(f"  {low + i*size:>8.3f}s {count:>6} {bar}".rstrip())
+    return lines
+
+
+def startup_report(results: dict[str, list[ProbeResult]]) -> str:
+    """
+    startup_report(results: dict[str, list[ProbeResult]]) -> str
+
+
+    Summarize the `startup_probe` results: the min/median/p99/max of every
+    startup step per layout, a histogram of the total, and the median total
+    of every layout relative to the first one.
+    """
+
+    lines = list()
+    medians = dict()
+    for name, ranks in results.items():
+        per_step = defaultdict(list)
+        for r in ranks:
+            for step, t in steps(r).items():
+                per_step[step].append(t)
+
+        lines += [
+            f"{name} ({len(ranks)} ranks)",
+            f"  {'step':24} {'min':>8} {'median':>8} {'p99':>8} {'max':>8}"
+        ]
+        for step, values in per_step.items():
+            lines.append(f"  {step:24} " + " ".join(
+                f"{v:>7.3f}s" for v in [
+                    min(values), statistics.median(values),
+                    percentile(values, 99), max(values)
+                ]
+            ))
+        lines += ["  total:"] + histogram(per_step["total"]) + [""]
+        medians[name] = statistics.median(per_step["total"])
+
+    if len(medians) > 1:
+        base_name, base = next(iter(medians.items()))
+        lines.append(f"median total relative to {base_name}:")
+        lines += [
+            f"  {name:24} {median/base:>6.2f}x"
+            for name, median in medians.items()
+        ]
+
+    return "\n".join(lines).rstrip("\n")
@@ -1,16 +1,273 @@
+from .tracing               import span
+from .validated_dataclasses import ValidatedDataClass
+
+import asyncio
+import builtins
 import json
+import logging
 import os
+import select
+import signal
 import subprocess
 import sys
+import threading
+import time
+
+from contextlib  import AbstractContextManager, AbstractAsyncContextManager
+from dataclasses import dataclass
+
+
+# Same as `mpi4py_installer.logger` (which can't be imported here, as this
+# module is imported while `mpi4py_installer` is initialized)
+logger = logging.getLogger(__package__)
+
+def env_snapshot_cmd(fd_write: int, bsc: int) -> str:
+    """
+    env_snapshot_cmd(fd_write: int, bsc: int) -> str
+
+
+    Bash snippet (appended to each command) which sends the environment as a
+    json to the file descriptor `fd_write`, preceded by the payload size as a
+    `bsc`-byte integer. The exit code of the preceding command is preserved.
+    """
+
+    write_env_pycode = ";".join([
+        "import os",
+        "import json",
+        # capture env as json
+        "env_json = json.dumps(dict(os.environ)).encode()",
+        # send payload size ahead of message
+        "plen = len(env_json)",
+        f"plen = plen.to_bytes({bsc}, \"big\", signed=False)",
+        f"os.write({fd_write}, plen)",
+        # send env json payload
+        f"os.write({fd_write}, env_json)"
+    ])
+    return "\n".join([
+        "__ShellRunner_exit_code_trap=$?",
+        f"{sys.executable} -c '{write_env_pycode}'",
+        "exit $__ShellRunner_exit_code_trap"
+    ])
+
+
+@dataclass(frozen=True)
+class ResourceUsage(metaclass=ValidatedDataClass):
+    """
+    @dataclass(frozen=True)
+    class ResourceUsage(metaclass=ValidatedDataClass):
+        runs:    int
+        wall:    float
+        utime:   float
+        stime:   float
+        maxrss:  int
+        inblock: int
+        oublock: int
+        nvcsw:   int
+        nivcsw:  int
+
+
+    Resources used by one or more commands (including all of their child
+    processes): wall time, user/sys CPU time (seconds), peak resident set size
+    (KiB on Linux), block I/O operations, and (in)voluntary context switches.
+    Adding two ResourceUsage objects sums everything, except for `maxrss`,
+    which is the maximum of both.
+    """
+
+    runs:    int   = 0
+    wall:    float = 0.
+    utime:   float = 0.
+    stime:   float = 0.
+    maxrss:  int   = 0
+    inblock: int   = 0
+    oublock: int   = 0
+    nvcsw:   int   = 0
+    nivcsw:  int   = 0
+
+
+    @staticmethod
+    def from_rusage(rusage, wall: float) -> "ResourceUsage":
+        return ResourceUsage(
+            runs=1, wall=wall,
+            utime=rusage.ru_utime, stime=rusage.ru_stime,
+            maxrss=rusage.ru_maxrss,
+            inblock=rusage.ru_inblock, oublock=rusage.ru_oublock,
+            nvcsw=rusage.ru_nvcsw, nivcsw=rusage.ru_nivcsw
+        )
+
+
+    def __add__(self, other: "ResourceUsage") -> "ResourceUsage":
+        return ResourceUsage(
+            runs=self.runs + other.runs, wall=self.wall + other.wall,
+            utime=self.utime + other.utime, stime=self.stime + other.stime,
+            maxrss=max(self.maxrss, other.maxrss),
+            inblock=self.inblock + other.inblock,
+            oublock=self.oublock + other.oublock,
+            nvcsw=self.nvcsw + other.nvcsw, nivcsw=self.nivcsw + other.nivcsw
+        )
+
+
+    @property
+    def cpu(self) -> float:
+        """
+        cpu -> float
+
+
+        Total (user + sys) CPU time in seconds
+        """
+        return self.utime + self.stime
+
+
+class RunResult(subprocess.CompletedProcess):
+    """
+    CompletedProcess together with the resources used by the command (`None`
+    if these could not be collected).
+    """
+
+    def __init__(self, args, returncode, stdout=None, stderr=None, rusage=None):
+        super().__init__(args, returncode, stdout, stderr)
+        self.rusage: ResourceUsage|None = rusage
+
+
+def _communicate(
+            process: subprocess.Popen, input, timeout: float|None,
+            deadline: float|None
+        ) -> tuple:
+    # Same as `Popen.communicate`, except the child is not waited for (=>
+    # `_wait4` can reap it). The output pipes are read on threads, so that a
+    # child that fills one pipe doesn't block while `input` is written.
+    output: dict[str, bytes|str] = dict()
+
+    def read(name, pipe):
+        with pipe:
+            output[name] = pipe.read()
+
+    readers = [
+        threading.Thread(target=read, args=(name, pipe), daemon=True)
+        for name, pipe in (("stdout", process.stdout),
+                           ("stderr", process.stderr))
+        if pipe is not None
+    ]
+    for reader in readers:
+        reader.start()
+
+    if process.stdin is not None:
+        try:
+            if input:
+                process.stdin.write(input)
+            process.stdin.close()
+        except BrokenPipeError:
+            pass  # the child doesn't read all of its input
+
+    for reader in readers:
+        reader.join(
+            None if deadline is None else max(deadline - time.monotonic(), 0)
+        )
+        if reader.is_alive():
+            raise subprocess.TimeoutExpired(process.args, timeout)
+
+    return output.get("stdout"), output.get("stderr")
+
+
+def _wait4(
+            process: subprocess.Popen, timeout: float|None,
+            deadline: float|None
+        ):
+    # Reap the child using `os.wait4`, and set its `returncode` (=> Popen
+    # doesn't wait for it again). Returns the child's resource usage -- None
+    # if the child can't be waited for (eg. SIGCLD is ignored).
+    while True:
+        try:
+            pid, status, rusage = os.wait4(
+                process.pid, 0 if deadline is None else os.WNOHANG
+            )
+        except ChildProcessError:
+            process.returncode = 0
+            return None
+
+        if pid == process.pid:
+            process.returncode = os.waitstatus_to_exitcode(status)
+            return rusage
 
-from contextlib import AbstractContextManager
+        assert deadline is not None
+        if time.monotonic() >= deadline:
+            raise subprocess.TimeoutExpired(process.args, timeout)
+        time.sleep(0.01)
+
+
+def run_with_rusage(
+            args, input=None, capture_output=False, timeout=None, check=False,
+            **kwargs
+        ) -> RunResult:
+    """
+    run_with_rusage(
+            args, input=None, capture_output=False, timeout=None, check=False,
+            **kwargs
+        ) -> RunResult
+
+
+    Same as `subprocess.run`, except the returned RunResult also contains
+    the resource usage of the command. The child is reaped using `os.wait4`,
+    so the usage covers all of its descendants that have been waited for (eg.
+    all the compilers run by a `pip install`) -- and only those: unlike
+    `RUSAGE_CHILDREN`, concurrent commands don't add to each other's usage.
+    """
+
+    if capture_output:
+        kwargs["stdout"] = subprocess.PIPE
+        kwargs["stderr"] = subprocess.PIPE
+    if input is not None:
+        kwargs["stdin"] = subprocess.PIPE
+
+    start = time.perf_counter()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with subprocess.Popen(args, **kwargs) as process:
+        try:
+            stdout, stderr = _communicate(process, input, timeout, deadline)
+            rusage = _wait4(process, timeout, deadline)
+        except:
+            if process.returncode is None:
+                process.kill()
+                _wait4(process, None, None)
+            raise
+    wall = time.perf_counter() - start
+
+    usage = None
+    if rusage is not None:
+        usage = ResourceUsage.from_rusage(rusage, wall)
+
+    result = RunResult(process.args, process.returncode, stdout, stderr, usage)
+    if check:
+        result.check_returncode()
+    return result
+
+
+def parse_env_snapshot(payload: bytes, bsc: int) -> dict[str, str]|None:
+    """
+    parse_env_snapshot(payload: bytes, bsc: int) -> dict[str, str]|None
+
+
+    Decode the environment sent by `env_snapshot_cmd`. Returns None if the
+    payload is incomplete (eg. if the command exited before the snapshot).
+    """
+
+    # message on pipe:
+    # [payload length (plen)][json containing os.environ]
+    #  ^^^^ _BSC bytes ^^^^   ^^^^^^^ plen bytes ^^^^^^^
+    if len(payload) < bsc:
+        return None
+    plen = int.from_bytes(payload[:bsc], byteorder="big", signed=False)
+    if len(payload) < bsc + plen:
+        return None
+    return json.loads(payload[bsc:bsc + plen].decode())
 
 
 class ShellRunner(AbstractContextManager):
     """Run multiple bash scripts with persisent environment.
 
     Environment is stored to "env" member between runs. This can be updated
-    directly to adjust the environment, or read to get variables.
+    directly to adjust the environment, or read to get variables. The resources
+    used by each run are returned as part of its RunResult, and are summed up
+    in the "usage" member.
     """
 
     # max size of payload size descriptor in bytes
@@ -21,54 +278,67 @@ class ShellRunner(AbstractContextManager):
         if env is None:
             env = dict(os.environ)
         self.env = env
+        self.usage = ResourceUsage()
 
         self._fd_read: int
         self._fd_write: int
         self._fd_read, self._fd_write = os.pipe()
         self._fd_open = True
 
-        write_env_pycode = ";".join([
-            "import os",
-            "import json",
-            # capture env as json
-            "env_json = json.dumps(dict(os.environ)).encode()",
-            # send payload size ahead of message
-            "plen = len(env_json)",
-            f"plen = plen.to_bytes({self._BSC}, \"big\", signed=False)",
-            f"os.write({self._fd_write}, plen)",
-            # send env json payload
-            f"os.write({self._fd_write}, env_json)"
-        ])
-        self._env_snapshot = "\n".join([
-            "__ShellRunner_exit_code_trap=$?",
-            f"{sys.executable} -c '{write_env_pycode}'",
-            "exit $__ShellRunner_exit_code_trap"
-        ])
+        self._env_snapshot = env_snapshot_cmd(self._fd_write, self._BSC)
 
 
     def run(self, cmd, **opts):
         if not self._fd_open:
             raise RuntimeError("ShellRunner is already closed")
 
-        cmd += "\n" + self._env_snapshot
-        result = subprocess.run(
-            ["bash", "-c", cmd],
-            pass_fds=[self._fd_write],
-            env=self.env,
-            **opts
-        )
+        with span("ShellRunner.run", cmd=cmd) as trace:
+            # The env snapshot is read while the command runs: snapshots that
+            # are larger than the pipe's buffer would block the command
+            # otherwise.
+            payload = bytearray()
+            stop_read, stop_write = os.pipe()
+            reader = threading.Thread(
+                target=self._read_env_snapshot, args=(payload, stop_read),
+                daemon=True
+            )
+            reader.start()
 
-        # message on pipe:
-        # [payload length (plen)][json containing os.environ]
-        #  ^^^^ _BSC bytes ^^^^   ^^^^^^^ plen bytes ^^^^^^^
-        # read json size first:
-        env_json_len_bytes = os.read(self._fd_read, self._BSC)
-        env_json_len       = int.from_bytes(
-            env_json_len_bytes, byteorder="big", signed=False
-        )
-        # read env json
-        env_json = os.read(self._fd_read, env_json_len).decode()
-        self.env = json.loads(env_json)
+            try:
+                result = run_with_rusage(
+                    ["bash", "-c", cmd + "\n" + self._env_snapshot],
+                    pass_fds=[self._fd_write],
+                    env=self.env,
+                    **opts
+                )
+            finally:
+                # The command has exited (or failed to run, or timed out) =>
+                # stop reading the env snapshot once the pipe is empty
+                os.write(stop_write, b"\0")
+                reader.join()
+                os.close(stop_read)
+                os.close(stop_write)
+
+            env = parse_env_snapshot(payload, self._BSC)
+            if env is not None:
+                self.env = env
+
+            if result.rusage is not None:
+                self.usage += result.rusage
+
+            if trace:
+                trace.set(
+                    returncode=result.returncode,
+                    stdout_bytes=len(result.stdout or b""),
+                    stderr_bytes=len(result.stderr or b""),
+                    env_bytes=len(payload) - self._BSC
+                )
+                if result.rusage is not None:
+                    trace.set(
+                        cpu=result.rusage.cpu, maxrss=result.rusage.maxrss,
+                        inblock=result.rusage.inblock,
+                        oublock=result.rusage.oublock
+                    )
 
         # Alternative: send f"os.write({self._fd_write}, \"\\0\".encode())"
         # then read stream bit-by-bit looking for null character. This should be
@@ -82,6 +352,16 @@ class ShellRunner(AbstractContextManager):
         return result
 
 
+    def _read_env_snapshot(self, payload: bytearray, stop_read: int):
+        while parse_env_snapshot(payload, self._BSC) is None:
+            ready, _, _ = select.select([self._fd_read, stop_read], [], [])
+            if self._fd_read in ready:
+                payload += os.read(self._fd_read, 65536)
+            else:
+                # the command exited without sending an env snapshot
+                return
+
+
     def __exit__(self, exc_type, exc_value, traceback):
         if self._fd_open:
             os.close(self._fd_read)
@@ -91,3 +371,406 @@ class ShellRunner(AbstractContextManager):
 
     def __del__(self):
         self.__exit__(None, None, None)
+
+
+class _ModuleEnviron(dict):
+    # `os.environ` stand-in for the python code emitted by module commands:
+    # unsetting a variable that is not set is not an error
+    def __delitem__(self, key):
+        self.pop(key, None)
+
+    def unsetenv(self, key):
+        self.pop(key, None)
+
+
+class ModuleDriver:
+    """Apply `module` commands to a ShellRunner's environment in-process.
+
+    Lmod (`$LMOD_CMD`) and Environment Modules (`$MODULES_CMD`) can emit the
+    environment changes of a module command as python code. For each `module`
+    line in a script, the module command's python backend is called directly,
+    and its output is executed against the runner's "env" -- which avoids the
+    bash round-trip and the environment snapshot. Lines that are not plain
+    `module` commands (or if no supported module system is found in the
+    runner's environment) are run by the ShellRunner, in order.
+    """
+
+    # Lines containing any of these need a shell
+    _SHELL_CHARS = set(";&|<>()`$\\*?[]{}~'\"#")
+    # Scripts containing any of these can run lines conditionally (or
+    # repeatedly) => they are run by the shell as a whole
+    _COMPOUND = {
+        "if", "then", "else", "elif", "fi", "for", "while", "until", "do",
+        "done", "case", "esac", "select", "function", "{", "}"
+    }
+
+    def __init__(self, runner: ShellRunner):
+        self.runner = runner
+
+
+    def backend(self) -> list[str]|None:
+        """
+        backend(self) -> list[str]|None
+
+
+        Command that prints the python code for a module (sub)command (i.e.
+        the module system's python backend), or None if the runner's
+        environment has no supported module system.
+        """
+
+        for var in ("LMOD_CMD", "MODULES_CMD"):
+            cmd = self.runner.env.get(var)
+            if cmd and os.access(cmd, os.X_OK):
+                return [cmd, "python"]
+        return None
+
+
+    @classmethod
+    def module_args(cls, line: str) -> list[str]|None:
+        """
+        module_args(line: str) -> list[str]|None
+
+
+        The arguments of a plain `module ...` command line, or None if `line`
+        is anything else (or needs a shell to be interpreted).
+        """
+
+        words = line.split()
+        if len(words) < 2 or words[0] != "module":
+            return None
+        if cls._SHELL_CHARS.intersection(line):
+            return None
+        return words[1:]
+
+
+    @classmethod
+    def is_simple(cls, script: str) -> bool:
+        """
+        is_simple(script: str) -> bool
+
+
+        True if every line of `script` is a complete command that is run
+        unconditionally (no compound commands, functions, line continuations
+        or here-documents).
+        """
+
+        for line in script.splitlines():
+            words = line.split()
+            if not words:
+                continue
+            if cls._COMPOUND.intersection(words) or "(" in line \
+                    or "<<" in line or line.rstrip().endswith("\\"):
+                return False
+        return True
+
+
+    def _module(self, backend: list[str], args: list[str]) -> RunResult:
+        with span("ModuleDriver.module", args=" ".join(args)) as trace:
+            result = run_with_rusage(
+                backend + args, capture_output=True, env=self.runner.env
+            )
+            if result.rusage is not None:
+                self.runner.usage += result.rusage
+            if trace:
+                trace.set(returncode=result.returncode)
+
+        if result.returncode == 0:
+            # `import os` in the module code must pick up the stand-in
+            environ = _ModuleEnviron(self.runner.env)
+            shim = type("os", (), {"environ": environ})
+            namespace = dict(vars(builtins))
+            namespace["__import__"] = lambda name, *args, **kwargs: shim \
+                if name == "os" else __import__(name, *args, **kwargs)
+            exec(result.stdout.decode(), {"__builtins__": namespace, "os": shim})
+            self.runner.env = dict(environ)
+
+        return result
+
+
+    def run(self, script: str) -> subprocess.CompletedProcess:
+        """
+        run(self, script: str) -> subprocess.CompletedProcess
+
+
+        Run `script` line-by-line, applying `module` lines natively and
+        running everything else with the ShellRunner (consecutive non-module
+        lines are run together). Like `bash -c`, a failing line doesn't stop
+        the script (it is logged). Returns the combined stdout and stderr, and
+        the return code of the last line.
+        """
+
+        backend = self.backend()
+        if backend is None or not self.is_simple(script):
+            logger.debug("No module system backend, or compound script => bash")
+            return self.runner.run(script, capture_output=True)
+
+        stdout, stderr = list(), list()
+        returncode = 0
+        pending = list()
+
+        def flush():
+            out = self.runner.run("\n".join(pending), capture_output=True)
+            pending.clear()
+            stdout.append(out.stdout)
+            stderr.append(out.stderr)
+            return out.returncode
+
+        for line in script.splitlines():
+            args = self.module_args(line.strip())
+            if args is None:
+                pending.append(line)
+                continue
+            if pending:
+                returncode = flush()
+
+            logger.debug(f"Running module command natively: {args}")
+            out = self._module(backend, args)
+            stdout.append(b"")
+            stderr.append(out.stderr)
+            returncode = out.returncode
+            if returncode != 0:
+                logger.warning(
+                    f"Module command failed ({returncode=}): {line.strip()}"
+                )
+        if pending:
+            returncode = flush()
+
+        return subprocess.CompletedProcess(
+            script, returncode, b"".join(stdout), b"".join(stderr)
+        )
+
+
+class _AsyncShellProcess:
+    """A single bash process started by an AsyncShellRunner.
+
+    The environment snapshot is read from a dedicated pipe by the event loop
+    while the process runs, so large environments never block the child. Each
+    process is started in its own session so that `kill` can take out the
+    whole process group.
+    """
+
+    def __init__(self, runner, cmd):
+        self.runner = runner
+        self.cmd = cmd
+        self.proc: asyncio.subprocess.Process|None = None
+
+        self._fd_read: int|None = None
+        self._payload = bytearray()
+
+
+    async def start(self, **opts):
+        self._fd_read, fd_write = os.pipe()
+        os.set_blocking(self._fd_read, False)
+        try:
+            self.proc = await asyncio.create_subprocess_exec(
+                "bash", "-c",
+                self.cmd + "\n" + env_snapshot_cmd(fd_write, self.runner._BSC),
+                pass_fds=[fd_write],
+                env=self.runner.env,
+                start_new_session=True,
+                **opts
+            )
+        except BaseException:
+            self._close_pipe()
+            raise
+        finally:
+            os.close(fd_write)
+
+        asyncio.get_running_loop().add_reader(self._fd_read, self._drain)
+        self.runner._processes.add(self)
+
+
+    def _drain(self):
+        while self._fd_read is not None:
+            try:
+                chunk = os.read(self._fd_read, 65536)
+            except BlockingIOError:
+                return
+            if not chunk:
+                self._close_pipe()
+                return
+            self._payload += chunk
+
+
+    def _close_pipe(self):
+        if self._fd_read is not None:
+            asyncio.get_running_loop().remove_reader(self._fd_read)
+            os.close(self._fd_read)
+            self._fd_read = None
+
+
+    async def finish(self) -> int:
+        assert self.proc is not None
+        returncode = await self.proc.wait()
+
+        # bash waits for the env snapshot to be written before exiting => all
+        # of the payload is available on the pipe by now
+        self._drain()
+        self._close_pipe()
+        self.runner._processes.discard(self)
+
+        # an incomplete payload means that `cmd` exited before the snapshot
+        # => keep the previous environment
+        env = parse_env_snapshot(self._payload, self.runner._BSC)
+        if env is not None:
+            self.runner.env = env
+
+        return returncode
+
+
+    def kill(self):
+        if self.proc is not None and self.proc.returncode is None:
+            try:
+                os.killpg(self.proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+
+    async def abort(self):
+        self.kill()
+        if self.proc is not None:
+            await self.proc.wait()
+        self._close_pipe()
+        self.runner._processes.discard(self)
+
+
+class AsyncShellStream(AbstractAsyncContextManager):
+    """Stream the output of a command run by an AsyncShellRunner.
+
+    Iterating yields `(name, line)` tuples, where `name` is either "stdout" or
+    "stderr". Once the context is exited, `returncode` is set and the runner's
+    environment is updated. If the context is exited by an exception (or
+    cancellation), the command's process group is killed instead:
+
+    async with runner.stream(cmd) as stream:
+        async for name, line in stream:
+            ...
+    """
+
+    def __init__(self, runner, cmd, **opts):
+        self.runner = runner
+        self.returncode: int|None = None
+
+        self._process = _AsyncShellProcess(runner, cmd)
+        self._opts = opts
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._pumps: list[asyncio.Task] = list()
+        self._open_streams = 2
+
+
+    async def _pump(self, name, reader):
+        async for line in reader:
+            await self._queue.put((name, line))
+        await self._queue.put((name, None))
+
+
+    async def __aenter__(self):
+        await self.runner._lock.acquire()
+        try:
+            await self._process.start(
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, **self._opts
+            )
+        except BaseException:
+            self.runner._lock.release()
+            raise
+
+        proc = self._process.proc
+        self._pumps = [
+            asyncio.create_task(self._pump("stdout", proc.stdout)),
+            asyncio.create_task(self._pump("stderr", proc.stderr))
+        ]
+        return self
+
+
+    def __aiter__(self):
+        return self
+
+
+    async def __anext__(self) -> tuple[str, bytes]:
+        while self._open_streams > 0:
+            name, line = await self._queue.get()
+            if line is None:
+                self._open_streams -= 1
+                continue
+            return name, line
+        raise StopAsyncIteration
+
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                # discard any output that hasn't been consumed yet
+                async for _ in self:
+                    pass
+                self.returncode = await self._process.finish()
+        except BaseException:
+            exc_type = True
+            raise
+        finally:
+            if exc_type is not None:
+                for pump in self._pumps:
+                    pump.cancel()
+                await self._process.abort()
+            self.runner._lock.release()
+
+
+class AsyncShellRunner(AbstractAsyncContextManager):
+    """Run multiple bash scripts with persisent environment from asyncio.
+
+    Same semantics as ShellRunner: the environment is stored to the "env"
+    member between runs. Commands sent to the same runner run one at a time
+    (in the order they were sent), commands sent to different runners run
+    concurrently. Cancelling a run kills its whole process group.
+    """
+
+    # max size of payload size descriptor in bytes
+    _BSC: int = ShellRunner._BSC
+
+    def __init__(self, env=None):
+        self.env: dict[str, str]
+        if env is None:
+            env = dict(os.environ)
+        self.env = env
+
+        self._lock = asyncio.Lock()
+        self._processes: set[_AsyncShellProcess] = set()
+
+
+    async def run(self, cmd, capture_output=False, input=None, **opts):
+        if capture_output:
+            opts["stdout"] = subprocess.PIPE
+            opts["stderr"] = subprocess.PIPE
+        if input is not None:
+            opts["stdin"] = subprocess.PIPE
+
+        async with self._lock:
+            with span("AsyncShellRunner.run", cmd=cmd) as trace:
+                process = _AsyncShellProcess(self, cmd)
+                await process.start(**opts)
+                try:
+                    stdout, stderr = await process.proc.communicate(input)
+                    returncode = await process.finish()
+                except BaseException:
+                    await process.abort()
+                    raise
+
+                if trace:
+                    trace.set(
+                        returncode=returncode,
+                        stdout_bytes=len(stdout or b""),
+                        stderr_bytes=len(stderr or b""),
+                        env_bytes=len(process._payload) - self._BSC
+                    )
+
+        return subprocess.CompletedProcess(
+            ["bash", "-c", cmd], returncode, stdout, stderr
+        )
+
+
+    def stream(self, cmd, **opts) -> AsyncShellStream:
+        return AsyncShellStream(self, cmd, **opts)
+
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        for process in list(self._processes):
+            await process.abort()
@@ -1,5 +1,6 @@
 import hashlib
 import json
+import threading
 
 from typing import Any
 
@@ -28,13 +29,19 @@ class Singleton(type):
     Setting `metaclass=Singleton` in the classes meta descriptor marks it as a
     singleton object: if the object has already been constructed elsewhere in
     the code, subsequent calls to the constructor just return this original
-    instance.
+    instance. Construction is thread-safe: concurrent calls construct the
+    instance only once.
     """
 
     # Stores instances in a dictionary:
     # {class: instance}
     _instances: dict[Any, Any] = dict()
 
+    # Each instance is constructed while holding its own lock (in `_locks`),
+    # so that constructing one singleton can construct another one
+    _lock = threading.Lock()
+    _locks: dict[Any, threading.Lock] = dict()
+
     def __call__(cls, *args, **kwargs):
         """
         Metclass __call__ operator is called before the class constructor -- so
@@ -45,9 +52,30 @@ class Singleton(type):
         """
 
         hash = dict_hash({"args": args, "kwargs": kwargs})
-        if (cls, hash) not in cls._instances:
-            cls._instances[(cls, hash)] = super(Singleton, cls).__call__(
-                *args, **kwargs
-            )
+        if (cls, hash) in cls._instances:
+            return cls._instances[(cls, hash)]
+
+        with Singleton._lock:
+            lock = Singleton._locks.setdefault((cls, hash), threading.Lock())
+
+        with lock:
+            if (cls, hash) not in cls._instances:
+                cls._instances[(cls, hash)] = super(Singleton, cls).__call__(
+                    *args, **kwargs
+                )
 
         return cls._instances[(cls, hash)]
+
+
+    def forget(cls):
+        """
+        forget(cls)
+
+        Drop all instances of `cls` => the next call to the constructor
+        constructs a new instance (eg. after its inputs have changed).
+        """
+
+        with Singleton._lock:
+            for key in [k for k in cls._instances if k[0] is cls]:
+                del cls._instances[key]
+                Singleton._locks.pop(key, None)
@@ -1,16 +1,19 @@
 import subprocess
 import ctypes
 import json
+import shlex
 import re
 
 from .. import load_site, load_user_site, logger, makecls,\
-    Singleton, MPIConfig, ValidatedDataClass
+    Singleton, MPIConfig, BuildProfile, PackageRecipe, ValidatedDataClass
+from ..topology import detect, select_variant, variant_policy
 
 from os              import environ, fsdecode
 from sys             import platform
 from types           import ModuleType
 from pathlib         import Path
 from dataclasses     import dataclass, field
+from typing          import Any
 from collections.abc import KeysView
 
 
@@ -115,6 +118,42 @@ def auto_site() -> tuple[str|None, bool]:
     return found, flag
 
 
+def resolve_site(site: str|None) -> ModuleType:
+    """
+    resolve_site(site: str|None) -> ModuleType
+
+
+    Load the site module named `site` -- searching `mpi4py_installer.sites`
+    first, and then the user site path. If `site` is `None`, then `auto_site`
+    is used to pick the site. Raises RuntimeError if no site could be found.
+    """
+
+    site_info = Site()
+
+    if site is None:
+        dsite, flag = auto_site()
+        if dsite is None:
+            logger.critical(
+                "Could not decide on which site to use automatically."
+            )
+            raise RuntimeError("You must specify a site")
+
+        logger.info(f"Determined site as: {dsite}")
+        if flag:
+            return load_user_site(dsite, site_info.user_path)
+        return load_site(dsite)
+
+    if site in site_info.sites:
+        return load_site(site)
+    if site in site_info.user_sites:
+        return load_user_site(site, site_info.user_path)
+
+    mod_sites = site_info.sites
+    usr_sites = site_info.user_sites
+    logger.critical(f"Site {site} not in {mod_sites=} nor {usr_sites=}")
+    raise RuntimeError(f"{site} could not be found")
+
+
 @dataclass(frozen=True)
 class ConfigEnv(metaclass=ValidatedDataClass):
     """
@@ -183,6 +222,10 @@ class ConfigStore(metaclass=makecls(Singleton, ValidatedDataClass)): # type: ign
     env:           ConfigEnv  = field(init=False)
     sys: dict[str, ConfigSys] = field(init=False)
 
+    prof: dict[str, dict[str, BuildProfile]] = field(init=False)
+    pkgs: dict[str, dict[str, PackageRecipe]] = field(init=False)
+    caps: dict[str, dict[str, list[str]]] = field(init=False)
+
 
     def __post_init__(self):
         """
@@ -197,7 +240,8 @@ class ConfigStore(metaclass=makecls(Singleton, ValidatedDataClass)): # type: ign
 
         module_path = Path(self.file).resolve()
         config_file = module_path.parent / Path(module_path.stem + ".json")
-        env_config, sys_config = ConfigStore.load_config_file(config_file)
+        env_config, sys_config, prof_config, pkg_config, cap_config = \
+            ConfigStore.load_config_file(config_file)
 
         object.__setattr__(
             self, "_valid",
@@ -219,6 +263,32 @@ class ConfigStore(metaclass=makecls(Singleton, ValidatedDataClass)): # type: ign
                     for variant, var_config in sys_config[system].items()
                 })
 
+            # Build profiles are optional
+            object.__setattr__(self, "prof", {
+                system: {
+                    name: BuildProfile(**profile)
+                    for name, profile in profiles.items()
+                }
+                for system, profiles in (prof_config or dict()).items()
+            })
+
+            # MPI-aware package recipes are optional
+            object.__setattr__(self, "pkgs", {
+                system: {
+                    name: PackageRecipe(**recipe)
+                    for name, recipe in recipes.items()
+                }
+                for system, recipes in (pkg_config or dict()).items()
+            })
+
+            # Capability tags of the variants are optional
+            object.__setattr__(self, "caps", {
+                system: {
+                    variant: list(tags) for variant, tags in variants.items()
+                }
+                for system, variants in (cap_config or dict()).items()
+            })
+
 
     @property
     def valid(self) -> bool:
@@ -253,20 +323,59 @@ class ConfigStore(metaclass=makecls(Singleton, ValidatedDataClass)): # type: ign
         return [variant for variant in self.sys[system].keys()]
 
 
+    def profiles(self, system: str) -> list[str]:
+        """
+        def profiles(self, system: str) -> list[str]:
+
+
+        List of all build profiles on this site for a given system
+        """
+        return [profile for profile in self.prof.get(system, dict()).keys()]
+
+
+    def packages(self, system: str) -> list[str]:
+        """
+        def packages(self, system: str) -> list[str]:
+
+
+        List of all MPI-aware package recipes on this site for a given system
+        """
+        return [name for name in self.pkgs.get(system, dict()).keys()]
+
+
+    def capabilities(self, system: str) -> dict[str, list[str]]:
+        """
+        def capabilities(self, system: str) -> dict[str, list[str]]:
+
+
+        Capability tags that each variant on this site requires for a given
+        system (c.f. `topology.select_variant`) -- variants without tags are
+        not listed
+        """
+        return self.caps.get(system, dict())
+
+
     @staticmethod
     def load_config_file(config_file_path: Path) -> tuple[
                 dict[str, str | list[str]] | None,
-                dict[str, dict[str, dict[str, str | list[str] | None ]]] | None
+                dict[str, dict[str, dict[str, str | list[str] | None ]]] | None,
+                dict[str, dict[str, dict[str, str | bool]]] | None,
+                dict[str, dict[str, dict[str, Any]]] | None,
+                dict[str, dict[str, list[str]]] | None
             ]:
         """
         load_config_file(config_file_path: Path) -> tuple[
                 dict[str, str | list[str]] | None,
-                dict[str, dict[str, dict[str, str | list[str] | None ]]] | None
+                dict[str, dict[str, dict[str, str | list[str] | None ]]] | None,
+                dict[str, dict[str, dict[str, str | bool]]] | None,
+                dict[str, dict[str, dict[str, Any]]] | None,
+                dict[str, dict[str, list[str]]] | None
             ]
 
         Load a json at the location of `config_file_path`. Does some basic
         validation (file is a json file, file exists). The contents of the json
-        object are not validated.
+        object are not validated. The "profiles", "packages" and "capabilities"
+        root keys are optional.
 
         * If the config file does not exist, or if it's not a json file, then
           return None
@@ -274,13 +383,13 @@ class ConfigStore(metaclass=makecls(Singleton, ValidatedDataClass)): # type: ign
 
         if not config_file_path.is_file():
             logger.critical(f"File {config_file_path=} does not exist")
-            return None, None
+            return None, None, None, None, None
 
         if config_file_path.suffix != ".json":
             logger.critical(
                 f"Cannot load config file at {config_file_path=} -- not a json"
             )
-            return None, None
+            return None, None, None, None, None
 
         with open(config_file_path, "r") as f:
             data = json.load(f)
@@ -289,16 +398,17 @@ class ConfigStore(metaclass=makecls(Singleton, ValidatedDataClass)): # type: ign
             logger.critical(
                 f"'environment' is not a root key of {config_file_path}"
             )
-            return None, None
+            return None, None, None, None, None
 
 
         if "systems" not in data.keys():
             logger.critical(
                 f"'systems' is not a root key of {config_file_path}"
             )
-            return None, None
+            return None, None, None, None, None
 
-        return data["environment"], data["systems"]
+        return data["environment"], data["systems"], data.get("profiles"), \
+            data.get("packages"), data.get("capabilities")
 
 
 def default_check_site(config: ConfigStore) -> bool:
@@ -318,6 +428,18 @@ def default_check_site(config: ConfigStore) -> bool:
     return is_site
 
 
+def default_wheelhouse(config: ConfigStore) -> str|None:
+    logger.debug("Using default wheelhouse")
+
+    if "wheelhouse" not in config.env.keys():
+        return None
+
+    wheelhouse = config.env["wheelhouse"]
+    # type narrowing for mypy
+    assert isinstance(wheelhouse, str)
+    return wheelhouse
+
+
 def default_available_systems(config: ConfigStore) -> list[str]:
     logger.debug("Using default available_systems")
     return config.systems
@@ -361,6 +483,24 @@ def default_available_variants(config: ConfigStore, system: str) -> list[str]:
     return config.variants(system)
 
 
+def default_auto_variant(config: ConfigStore, system: str) -> str:
+    logger.debug("Using default auto_variant")
+
+    variants = default_available_variants(config, system)
+    capabilities = config.capabilities(system)
+    if not capabilities or variant_policy() == "static":
+        return variants[0]
+
+    # Variants without capability tags run anywhere
+    selected = select_variant(
+        {variant: capabilities.get(variant, list()) for variant in variants},
+        detect(), default=variants[0]
+    )
+    if selected is None:
+        raise RuntimeError(f"No variant of system '{system}' fits this node")
+    return selected
+
+
 def default_config(
             config: ConfigStore, system: str, variant: str
         ) -> MPIConfig:
@@ -381,12 +521,55 @@ def default_config(
     return config.sys[system][variant]
 
 
-def get_mpicc_link_data(config: MPIConfig) -> tuple[list[str], list[str]]|None:
+def default_available_profiles(config: ConfigStore, system: str) -> list[str]:
+    logger.debug("Using default available_profiles")
+    return config.profiles(system)
+
+
+def default_profile(
+            config: ConfigStore, system: str, profile: str
+        ) -> BuildProfile:
+    logger.debug(f"Using default profile for {system=}, {profile=}")
+
+    if profile not in config.profiles(system):
+        logger.critical(
+            f"No profile '{profile}' for system '{system}' in: "
+            f"{config.config_file}"
+        )
+        raise RuntimeError(f"Could not find settings for profile '{profile}'")
+
+    return config.prof[system][profile]
+
+
+def default_available_packages(config: ConfigStore, system: str) -> list[str]:
+    logger.debug("Using default available_packages")
+    return config.packages(system)
+
+
+def default_package(
+            config: ConfigStore, system: str, name: str
+        ) -> PackageRecipe:
+    logger.debug(f"Using default package for {system=}, {name=}")
+
+    if name not in config.packages(system):
+        logger.critical(
+            f"No package '{name}' for system '{system}' in: "
+            f"{config.config_file}"
+        )
+        raise RuntimeError(f"Could not find a recipe for package '{name}'")
+
+    return config.pkgs[system][name]
+
+
+def get_mpicc_link_data(
+            config: MPIConfig, env: dict[str, str]|None = None
+        ) -> tuple[list[str], list[str]]|None:
     try:
-        # Run the mpicc command to show the underlying compiler command
+        # Run the mpicc command to show the underlying compiler command -- use
+        # `env` to run it in the environment set up by `init`
         output = subprocess.run(
-            [config.MPICC, config.mpicc_show],
-            capture_output=True, text=True, check=True
+            shlex.split(config.MPICC) + [config.mpicc_show],
+            capture_output=True, text=True, check=True, env=env
         ).stdout
 
         # Print the output for debugging purposes
@@ -406,11 +589,141 @@ def get_mpicc_link_data(config: MPIConfig) -> tuple[list[str], list[str]]|None:
 
         return lib_paths, lib_names
 
-    except subprocess.CalledProcessError as e:
+    except (OSError, subprocess.CalledProcessError) as e:
         logger.critical("Failed to run mpicc command")
         return None
 
 
+def find_mpi_library(
+            lib_dirs: list[str], lib_names: list[str]
+        ) -> str|None:
+    """
+    find_mpi_library(lib_dirs: list[str], lib_names: list[str]) -> str|None
+
+
+    Resolved path of the first `lib<name>.so` in `lib_dirs` where `name`
+    starts with "mpi" (eg. `libmpi.so` or `libmpi_gnu_123.so`). This is the
+    MPI library that MPICC links against. Returns None if there is no match.
+    """
+
+    for dir in lib_dirs:
+        for lib in lib_names:
+            if not lib.startswith("mpi"):
+                continue
+            f = Path(dir) / ("lib" + lib + ".so")
+            if f.exists():
+                return str(f.resolve())
+
+    return None
+
+
+def site_wheelhouse(site: ModuleType, system: str, variant: str) -> str|None:
+    """
+    site_wheelhouse(site: ModuleType, system: str, variant: str) -> str|None
+
+
+    Location of the prebuilt wheelhouse for `system` and `variant`. The
+    MPI4PY_INSTALLER_WHEELHOUSE environment variable takes precedence over the
+    site's (optional) `wheelhouse(system, variant)` function.
+    """
+
+    if "MPI4PY_INSTALLER_WHEELHOUSE" in environ:
+        return environ["MPI4PY_INSTALLER_WHEELHOUSE"]
+
+    if hasattr(site, "wheelhouse"):
+        return site.wheelhouse(system, variant)
+
+    return None
+
+
+def site_profile(
+            site: ModuleType, system: str, profile: str|None
+        ) -> tuple[str, BuildProfile]|None:
+    """
+    site_profile(
+            site: ModuleType, system: str, profile: str|None
+        ) -> tuple[str, BuildProfile]|None
+
+
+    Name and settings of the build `profile` for `system`, using the site's
+    (optional) `available_profiles(system)` and `profile(system, name)`
+    functions. If `profile` is None, the site's "default" profile is used (if
+    it has one). Returns None if no profile applies.
+    """
+
+    available = list()
+    if hasattr(site, "available_profiles"):
+        available = site.available_profiles(system)
+
+    if profile is None:
+        if "default" not in available:
+            return None
+        profile = "default"
+
+    if profile not in available:
+        logger.critical(f"Profile '{profile}' not in {available=}")
+        raise RuntimeError(f"Could not find settings for profile '{profile}'")
+
+    return profile, site.profile(system, profile)
+
+
+def site_packages(
+            site: ModuleType, system: str, config: MPIConfig
+        ) -> dict[str, PackageRecipe]:
+    """
+    site_packages(
+            site: ModuleType, system: str, config: MPIConfig
+        ) -> dict[str, PackageRecipe]
+
+
+    Recipes of the MPI-aware packages that `config` (i.e. the variant) selects,
+    using the site's (optional) `available_packages(system)` and
+    `package(system, name)` functions. Raises RuntimeError if the site has no
+    recipe for one of them.
+    """
+
+    if config.packages is None:
+        return dict()
+
+    available = list()
+    if hasattr(site, "available_packages"):
+        available = site.available_packages(system)
+
+    missing = [name for name in config.packages if name not in available]
+    if missing:
+        logger.critical(f"Packages {missing} not in {available=}")
+        raise RuntimeError(f"Could not find recipes for packages {missing}")
+
+    return {name: site.package(system, name) for name in config.packages}
+
+
+def match_mpi_library(
+            mpi_lib_path: str, lib_dirs: list[str], lib_names: list[str]
+        ) -> bool:
+    """
+    match_mpi_library(
+            mpi_lib_path: str, lib_dirs: list[str], lib_names: list[str]
+        ) -> bool
+
+
+    Returns True if `mpi_lib_path` is any of the `lib<name>.so` libraries in
+    `lib_dirs`. Symlinks are resolved -- so we'll always compare the "real"
+    paths.
+    """
+
+    target = Path(mpi_lib_path).resolve()
+    for dir in lib_dirs:
+        for lib in lib_names:
+            f = Path(dir) / ("lib" + lib + ".so")
+            f = f.resolve()
+            logger.debug(f"Checking: {f}")
+            if f == target:
+                return True
+
+    # Clearly no matches found
+    return False
+
+
 def get_mpi_library_path(MPI_module: ModuleType) -> str | None:
     if platform.startswith("linux") or platform == "darwin":
         # Linux and macOS
@@ -1,7 +1,10 @@
 from .  import ConfigStore, MPIConfig, \
     default_check_site, default_available_systems, default_determine_system, \
-    default_available_variants, default_config, get_mpi_library_path, \
-    get_mpicc_link_data
+    default_available_variants, default_config, default_wheelhouse, \
+    default_available_profiles, default_profile, BuildProfile, \
+    default_auto_variant, \
+    default_available_packages, default_package, PackageRecipe, \
+    get_mpi_library_path, get_mpicc_link_data, match_mpi_library
 from .. import logger
 
 from os      import environ
@@ -29,8 +32,7 @@ def available_variants(system: str) -> list[str]:
 
 
 def auto_variant(system: str) -> str:
-    variants = default_available_variants(CONFIG, system)
-    return variants[0]
+    return default_auto_variant(CONFIG, system)
 
 
 def config(system: str, variant: str) -> MPIConfig:
@@ -46,6 +48,26 @@ def init(system: str, variant: str) -> str|None:
     return None
 
 
+def available_profiles(system: str) -> list[str]:
+    return default_available_profiles(CONFIG, system)
+
+
+def profile(system: str, name: str) -> BuildProfile:
+    return default_profile(CONFIG, system, name)
+
+
+def available_packages(system: str) -> list[str]:
+    return default_available_packages(CONFIG, system)
+
+
+def package(system: str, name: str) -> PackageRecipe:
+    return default_package(CONFIG, system, name)
+
+
+def wheelhouse(system: str, variant: str) -> str|None:
+    return default_wheelhouse(CONFIG)
+
+
 def sanity(system: str, variant: str, config: MPIConfig) -> bool:
     logger.debug(f"{system=}, {variant=}, {config=}")
 
@@ -62,19 +84,6 @@ def sanity(system: str, variant: str, config: MPIConfig) -> bool:
     logger.info(f"{mpicc_lib_dirs=}")
     logger.info(f"{mpicc_libs=}")
 
-    # Going through all possible combinations of lib_dir/lib_name. Use the
-    # `resolve` function to resolve symlinks -- we'll always compare the "real"
-    # paths.
-    target = Path(mpi_lib_path).resolve()
-    for dir in mpicc_lib_dirs:
-        for lib in mpicc_libs:
-            f = Path(dir) / ("lib" + lib + ".so")
-            f = f.resolve()
-            logger.debug(f"Checking: {f}")
-            if f == target:
-                return True
-
-    # Clearly no matches found => the MPI library used by mpi4py (as resolved
-    # by the linker) is NOT any of the libraries linked against by MPICC
-    return False
-
+    # Check if the MPI library used by mpi4py (as resolved by the linker) is
+    # any of the libraries linked against by MPICC
+    return match_mpi_library(mpi_lib_path, mpicc_lib_dirs, mpicc_libs)
@@ -1,7 +1,16 @@
-from .. import logger
+from ..          import logger
+from ..topology import detect, select_variant, variant_policy
 from os import environ
 
 
+# Capability tags that the variants require (c.f. `topology.select_variant`)
+CAPABILITIES = {
+    "perlmutter": {
+        "cpu:gnu": [], "gpu:gnu": ["gpu:nvidia"], "gpu:nvidia": ["gpu:nvidia"]
+    }
+}
+
+
 def check_site() -> bool:
     # Guard to allow local config on NERSC Systems
     if "MPI4PY_LOCAL" in environ:
@@ -26,7 +35,12 @@ def available_variants(system: str) -> list[str]:
 def auto_variant(system: str) -> str:
     logger.debug(f"{system=}")
     if system == "perlmutter":
-        return "gpu:gnu"
+        # Perlmutter has CPU-only and GPU nodes => pick the build that fits
+        if variant_policy() == "static":
+            return "gpu:gnu"
+        return select_variant(
+            CAPABILITIES[system], detect(), default="gpu:gnu"
+        ) or "cpu:gnu"
     elif system == "cori":
         return "gnu"
     else:
@@ -0,0 +1,275 @@
+from .        import logger
+from .runners import ShellRunner
+from .tracing import span
+
+import importlib
+import importlib.metadata
+import json
+import os
+import re
+import shutil
+import site
+import subprocess
+import sys
+import threading
+import sysconfig
+
+from pathlib import Path
+
+
+# Root of the directory containing the `mpi4py_installer` package. This is
+# prepended to the PYTHONPATH of other interpreters so that sanity checks can
+# be run by them.
+PACKAGE_ROOT = Path(__file__).parent.parent.resolve()
+# Previous installs are kept here, next to the live install, for rollback
+ROLLBACK_DIR = ".mpi4py-rollback"
+# The distributions that were swapped (in ROLLBACK_DIR) => rolled back together
+SWAPPED_NAMES = ".names.json"
+
+
+def run_sanity(
+            python: str, site: str, system: str, variant: str,
+            path: tuple[str, ...] = (), env: dict[str, str]|None = None
+        ) -> bool:
+    """
+    run_sanity(
+            python: str, site: str, system: str, variant: str,
+            path: tuple[str, ...] = (), env: dict[str, str]|None = None
+        ) -> bool
+
+
+    Run the site's sanity check using the `python` interpreter (in a new
+    process), with `path` prepended to its PYTHONPATH. Eg. to check a staged
+    mpi4py install. The check runs in `env` (default: the current
+    environment) -- eg. the runtime environment of an ABI-portable build.
+    """
+
+    env = dict(os.environ if env is None else env)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in [*path, str(PACKAGE_ROOT), env.get("PYTHONPATH")] if p
+    )
+    out = subprocess.run(
+        [
+            python, "-m", "mpi4py_installer", "--sanity-only",
+            f"--site={site}", f"--system={system}", f"--variant={variant}"
+        ],
+        capture_output=True, env=env
+    )
+
+    logger.debug(f"stderr={out.stderr.decode()}")
+    logger.debug(f"stdout={out.stdout.decode()}")
+    return out.returncode == 0
+
+
+def interpreter_paths(python: str = sys.executable) -> dict[str, str]:
+    """
+    interpreter_paths(python: str = sys.executable) -> dict[str, str]
+
+
+    The `prefix`, `platlib` (site-packages) and `usersite` directories of the
+    `python` interpreter.
+    """
+
+    if python == sys.executable:
+        return {
+            "prefix": sys.prefix,
+            "platlib": sysconfig.get_paths()["platlib"],
+            "usersite": site.getusersitepackages()
+        }
+
+    out = subprocess.run(
+        [python, "-c", "; ".join([
+            "import json, site, sys, sysconfig",
+            "print(json.dumps({'prefix': sys.prefix, "
+            "'platlib': sysconfig.get_paths()['platlib'], "
+            "'usersite': site.getusersitepackages()}))"
+        ])],
+        capture_output=True, check=True
+    )
+    return json.loads(out.stdout.decode())
+
+
+def install_location(use_user: bool, python: str = sys.executable) -> Path:
+    """
+    install_location(use_user: bool, python: str = sys.executable) -> Path
+
+
+    The directory that pip installs (platform specific) packages to, for the
+    `python` interpreter: the user site if `use_user` is set.
+    """
+
+    paths = interpreter_paths(python)
+    return Path(paths["usersite" if use_user else "platlib"])
+
+
+def installed_entries(location: Path, name: str = "mpi4py") -> list[str]:
+    """
+    installed_entries(location: Path, name: str = "mpi4py") -> list[str]
+
+
+    Top-level files and directories (in `location`) that belong to the
+    distribution `name` installed in `location` -- according to its RECORD.
+    """
+
+    def normalize(name):
+        return re.sub(r"[-_.]+", "-", name).lower()
+
+    entries = set()
+    for dist in importlib.metadata.distributions(path=[str(location)]):
+        if normalize(dist.metadata["Name"]) != normalize(name) \
+                or dist.files is None:
+            continue
+        for f in dist.files:
+            top = f.parts[0]
+            if top not in ("..", "__pycache__", "bin"):
+                entries.add(top)
+
+    return sorted(e for e in entries if (location / e).exists())
+
+
+def install_target(
+            wheel: Path, target: Path, python: str = sys.executable
+        ) -> Path:
+    """
+    install_target(
+            wheel: Path, target: Path, python: str = sys.executable
+        ) -> Path
+
+
+    Install `wheel` (using the `python` interpreter's pip) into the `target`
+    directory -- which can then be put on the PYTHONPATH. Returns `target`.
+    """
+
+    cmd = f"{python} -m pip install --no-index --no-deps"
+    cmd += f" --target {target} {wheel}"
+
+    with ShellRunner() as bash_runner:
+        out = bash_runner.run(cmd, capture_output=True)
+
+        logger.debug(f"stderr={out.stderr.decode()}")
+        out.check_returncode()
+        logger.debug(f"stdout={out.stdout.decode()}")
+
+    return target
+
+
+def stage_wheel(
+            wheel: Path, location: Path, python: str = sys.executable
+        ) -> Path:
+    """
+    stage_wheel(
+            wheel: Path, location: Path, python: str = sys.executable
+        ) -> Path
+
+
+    Install `wheel` (using the `python` interpreter's pip) into a staging
+    directory inside `location` (so that it can be moved into place by
+    renaming). Returns the staging directory.
+    """
+
+    location.mkdir(parents=True, exist_ok=True)
+    staging = location / \
+        f".mpi4py-staging-{os.getpid()}-{threading.get_ident()}"
+    if staging.exists():
+        shutil.rmtree(staging)
+
+    logger.info(f"Staging {wheel} in {staging}")
+    return install_target(wheel, staging, python=python)
+
+
+def _exchange(location: Path, outgoing: list[str], incoming: Path) -> Path:
+    # Move the `outgoing` entries of `location` into a new directory, and the
+    # contents of `incoming` into `location`. Each move is a rename, so the
+    # live install is missing only for the time between two renames. Undoes
+    # all moves if one of them fails. The parked directory is unique per
+    # thread, like the staging directory.
+    parked = location / \
+        f".mpi4py-parked-{os.getpid()}-{threading.get_ident()}"
+    parked.mkdir()
+
+    moved_out, moved_in = list(), list()
+    try:
+        for e in outgoing:
+            os.rename(location / e, parked / e)
+            moved_out.append(e)
+        for e in sorted(os.listdir(incoming)):
+            if e in ("bin", SWAPPED_NAMES):
+                continue
+            if (location / e).exists():
+                raise FileExistsError(f"{location / e} is in the way")
+            os.rename(incoming / e, location / e)
+            moved_in.append(e)
+    except OSError:
+        logger.critical("Swapping mpi4py installs failed => undoing swap")
+        for e in moved_in:
+            os.rename(location / e, incoming / e)
+        for e in moved_out:
+            os.rename(parked / e, location / e)
+        shutil.rmtree(parked)
+        raise
+
+    importlib.invalidate_caches()
+    return parked
+
+
+def swap_in(
+            staging: Path, location: Path, names: tuple[str, ...] = ("mpi4py",)
+        ) -> Path:
+    """
+    swap_in(
+            staging: Path, location: Path, names: tuple[str, ...] = ("mpi4py",)
+        ) -> Path
+
+
+    Replace the installs of `names` (eg. mpi4py and the packages built against
+    it) in `location` with the staged installs in `staging`. The previous
+    installs are kept (in ROLLBACK_DIR) for `rollback`. Returns the rollback
+    directory.
+    """
+
+    outgoing = sorted({
+        e for name in names for e in installed_entries(location, name)
+    })
+    logger.info(f"Swapping {outgoing} for {sorted(os.listdir(staging))}")
+    with span("swap"):
+        parked = _exchange(location, outgoing, staging)
+
+    backup = location / ROLLBACK_DIR
+    if backup.exists():
+        shutil.rmtree(backup)
+    os.rename(parked, backup)
+    (backup / SWAPPED_NAMES).write_text(json.dumps(sorted(names)))
+    shutil.rmtree(staging)
+
+    return backup
+
+
+def rollback(location: Path, names: tuple[str, ...] = ("mpi4py",)) -> bool:
+    """
+    rollback(location: Path, names: tuple[str, ...] = ("mpi4py",)) -> bool
+
+
+    Swap the previous installs of `names` -- and of all other distributions
+    that were swapped in with them -- back into `location`. The replaced
+    installs become the new rollback -- so rolling back twice restores the
+    original state. Returns False if there is nothing to roll back to.
+    """
+
+    backup = location / ROLLBACK_DIR
+    if not backup.is_dir():
+        logger.critical(f"No previous install in {backup}")
+        return False
+
+    if (backup / SWAPPED_NAMES).is_file():
+        names = (*names, *json.loads((backup / SWAPPED_NAMES).read_text()))
+    outgoing = sorted({
+        e for name in names for e in installed_entries(location, name)
+    })
+    logger.info(f"Rolling back {outgoing} to {sorted(os.listdir(backup))}")
+    with span("rollback"):
+        parked = _exchange(location, outgoing, backup)
+
+    shutil.rmtree(backup)
+    os.rename(parked, backup)
+    (backup / SWAPPED_NAMES).write_text(json.dumps(sorted(set(names))))
+    return True
@@ -0,0 +1,244 @@
+from .            import logger
+from .wheelhouse import cache_path
+
+import fcntl
+import json
+import math
+import os
+import time
+
+from collections import defaultdict
+from pathlib     import Path
+from typing      import Any, Iterator
+
+
+# Rotate the log once it is larger than MAX_BYTES, keeping KEEP old logs
+MAX_BYTES = 1 << 20
+KEEP = 3
+
+
+def telemetry_path() -> Path:
+    """
+    telemetry_path() -> Path
+
+
+    Location of the install log: MPI4PY_INSTALLER_TELEMETRY, or
+    `telemetry.jsonl` in the installer's cache directory.
+    """
+
+    if "MPI4PY_INSTALLER_TELEMETRY" in os.environ:
+        return Path(os.environ["MPI4PY_INSTALLER_TELEMETRY"])
+    return cache_path() / "telemetry.jsonl"
+
+
+def _rotate(path: Path, keep: int):
+    for i in range(keep - 1, 0, -1):
+        older = path.with_name(f"{path.name}.{i}")
+        if older.exists():
+            os.replace(older, path.with_name(f"{path.name}.{i + 1}"))
+    os.replace(path, path.with_name(f"{path.name}.1"))
+
+
+def append(
+            record: dict[str, Any], path: Path|None = None,
+            max_bytes: int = MAX_BYTES, keep: int = KEEP
+        ):
+    """
+    append(
+            record: dict[str, Any], path: Path|None = None,
+            max_bytes: int = MAX_BYTES, keep: int = KEEP
+        )
+
+
+    Append `record` (as one json line) to the install log at `path` (default:
+    `telemetry_path()`). If the log has grown beyond `max_bytes` it is rotated
+    first (`<log>.1` ... `<log>.<keep>`). Concurrent installers serialize on
+    a lock file. Failures are logged, never raised: telemetry must not break
+    an install.
+    """
+
+    path = telemetry_path() if path is None else path
+    line = json.dumps(record, sort_keys=True) + "\n"
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path.with_name(f".{path.name}.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if path.exists() and path.stat().st_size >= max_bytes:
+                _rotate(path, keep)
+            with open(path, "a") as f:
+                f.write(line)
+    except OSError as e:
+        logger.warning(f"Could not write install telemetry to {path}: {e}")
+
+
+def install_record(result) -> dict[str, Any]:
+    """
+    install_record(result: InstallResult) -> dict[str, Any]
+
+
+    Telemetry record of an `install` result.
+    """
+
+    return {
+        "time": time.time(), "site": result.site, "system": result.system,
+        "variant": result.variant, "profile": result.config.profile,
+        "python": result.python, "fingerprint": result.fingerprint,
+        "libmpi": result.libmpi, "mpiabi": result.mpiabi, "ok": result.ok,
+        "phase": result.phase, "error": result.error,
+        "cache_hit": result.cache_hit,
+        "timings": result.timings, "total": sum(result.timings.values())
+    }
+
+
+def read(path: Path|None = None, keep: int = KEEP) -> Iterator[dict[str, Any]]:
+    """
+    read(path: Path|None = None, keep: int = KEEP) -> Iterator[dict[str, Any]]
+
+
+    All records of the install log (including the rotated logs), oldest
+    first. Lines that can't be parsed are skipped.
+    """
+
+    path = telemetry_path() if path is None else path
+    logs = [path.with_name(f"{path.name}.{i}") for i in range(keep, 0, -1)]
+    for log in logs + [path]:
+        if not log.is_file():
+            continue
+        with open(log) as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    percentile(values: list[float], q: float) -> float
+
+
+    The `q`-th percentile (nearest rank) of `values`.
+    """
+
+    ordered = sorted(values)
+    rank = max(math.ceil(q/100*len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def build_times(
+            records: list[dict[str, Any]], site: str, system: str,
+            variant: str, profile: str|None
+        ) -> list[float]:
+    """
+    build_times(
+            records: list[dict[str, Any]], site: str, system: str,
+            variant: str, profile: str|None
+        ) -> list[float]
+
+
+    Durations of the successful builds (not cache hits) of this configuration.
+    """
+
+    return [
+        r["timings"]["build"] for r in records
+        if (r.get("site"), r.get("system"), r.get("variant"), r.get("profile"))
+            == (site, system, variant, profile)
+        and r.get("ok") and r.get("cache_hit") is False
+        and "build" in r.get("timings", {})
+    ]
+
+
+def eta(
+            site: str, system: str, variant: str, profile: str|None,
+            path: Path|None = None
+        ) -> tuple[float, int]|None:
+    """
+    eta(
+            site: str, system: str, variant: str, profile: str|None,
+            path: Path|None = None
+        ) -> tuple[float, int]|None
+
+
+    Expected build time (the median of previous builds of this configuration)
+    and the number of builds it is based on -- None if there are none.
+    """
+
+    records = list(read(path))
+    times = build_times(records, site, system, variant, profile)
+    if not times:
+        return None
+    return percentile(times, 50), len(times)
+
+
+def stats(path: Path|None = None) -> str:
+    """
+    stats(path: Path|None = None) -> str
+
+
+    Summary of the install log: p50/p95 durations per variant, failure rates
+    by phase, and build times per MPI library (eg. across PE upgrades).
+    """
+
+    path = telemetry_path() if path is None else path
+    records = list(read(path))
+    if not records:
+        return f"No installs recorded in {path}"
+
+    def seconds(values):
+        if not values:
+            return f"{'-':>8} {'-':>8}"
+        p50, p95 = percentile(values, 50), percentile(values, 95)
+        return f"{p50:>7.1f}s {p95:>7.1f}s"
+
+    def is_build(r):
+        return r.get("ok") and r.get("cache_hit") is False \
+            and "build" in r.get("timings", {})
+
+    by_variant = defaultdict(list)
+    for r in records:
+        key = "/".join(str(r.get(k)) for k in ("site", "system", "variant"))
+        by_variant[key].append(r)
+
+    lines = [
+        f"{'installs':>8} {'failed':>6} {'hits':>5} {'total':>8} {'p95':>8} "
+        f"{'build':>8} {'p95':>8}  site/system/variant"
+    ]
+    for key, rs in sorted(by_variant.items()):
+        totals = [r.get("total", 0) for r in rs if r.get("ok")]
+        builds = [r["timings"]["build"] for r in rs if is_build(r)]
+        lines.append(" ".join([
+            f"{len(rs):>8}", f"{sum(not r.get('ok') for r in rs):>6}",
+            f"{sum(bool(r.get('cache_hit')) for r in rs):>5}",
+            seconds(totals), seconds(builds), f" {key}"
+        ]))
+    lines.append("(total and build: p50 and p95 of the successful installs)")
+
+    # Failures by phase, relative to the installs that reached the phase
+    reached = defaultdict(int)
+    failed = defaultdict(int)
+    for r in records:
+        for phase in r.get("timings", {}):
+            reached[phase] += 1
+        if not r.get("ok"):
+            failed[r.get("phase")] += 1
+    if failed:
+        lines += ["", f"{'failures':>8} {'rate':>6}  phase"]
+        for phase, n in sorted(failed.items(), key=lambda x: -x[1]):
+            rate = n/max(reached.get(phase, n), 1)
+            lines.append(f"{n:>8} {rate:>6.0%}  {phase}")
+
+    # Build time trend: one line per MPI library (in order of first use)
+    trends = defaultdict(list)
+    for r in records:
+        if is_build(r):
+            key = f"{r.get('system')}/{r.get('variant')}: {r.get('libmpi')}"
+            trends[key].append(r["timings"]["build"])
+    if trends:
+        lines += ["", " ".join([
+            f"{'builds':>8}", f"{'build':>8}", f"{'p95':>8} ",
+            "system/variant: libmpi"
+        ])]
+        for key, times in trends.items():
+            lines.append(f"{len(times):>8} {seconds(times)}  {key}")
+
+    return "\n".join(lines)
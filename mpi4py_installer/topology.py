@@ -0,0 +1,199 @@
+from .                      import logger
+from .validated_dataclasses import ValidatedDataClass
+
+import os
+import re
+
+from dataclasses import dataclass
+from pathlib     import Path
+
+
+# PCI vendor ids of accelerators, and the PCI device classes that count as an
+# accelerator (3D and display controllers -- not VGA, which is usually the
+# BMC's or an integrated GPU)
+GPU_VENDORS = {"0x10de": "nvidia", "0x1002": "amd", "0x8086": "intel"}
+GPU_CLASSES = ("0x0302", "0x0380")
+
+# Device files of accelerator drivers
+GPU_DEVICES = (("nvidia", "nvidia[0-9]*"), ("amd", "kfd"))
+
+# Variant selection policies (c.f. `variant_policy`)
+POLICIES = ("static", "topology")
+
+
+def sysfs_root() -> Path:
+    """
+    sysfs_root() -> Path
+
+
+    Root of the `/proc`, `/sys` and `/dev` trees that the topology is read
+    from: MPI4PY_INSTALLER_SYSFS_ROOT (eg. a fake tree for testing), or `/`.
+    """
+
+    return Path(os.environ.get("MPI4PY_INSTALLER_SYSFS_ROOT", "/"))
+
+
+def variant_policy() -> str:
+    """
+    variant_policy() -> str
+
+
+    How `auto_variant` picks a variant: "static" (the default) always picks
+    the site's default variant, "topology" matches the variants' capability
+    tags against this node's `Topology`. Set by
+    MPI4PY_INSTALLER_VARIANT_POLICY (or `--variant-policy`).
+    """
+
+    policy = os.environ.get("MPI4PY_INSTALLER_VARIANT_POLICY", "static")
+    if policy not in POLICIES:
+        raise RuntimeError(f"Unknown variant policy '{policy}' (not {POLICIES})")
+    return policy
+
+
+@dataclass(frozen=True)
+class Topology(metaclass=ValidatedDataClass):
+    """
+    Hardware of this node, as far as choosing a build variant is concerned:
+    the CPU flags (eg. avx512f), the number of NUMA nodes, and the vendors of
+    the accelerators.
+    """
+    cpu_flags: list[str]
+    numa_nodes: int
+    gpus: list[str]
+
+
+    @property
+    def tags(self) -> set[str]:
+        """
+        tags -> set[str]
+
+
+        Capability tags of this node: the CPU flags, `numa:<N>` (and
+        `multi-numa` with more than one NUMA node), and `gpu` and
+        `gpu:<vendor>` -- or `cpu-only` without accelerators.
+        """
+
+        tags = set(self.cpu_flags)
+        tags.add(f"numa:{self.numa_nodes}")
+        if self.numa_nodes > 1:
+            tags.add("multi-numa")
+        if self.gpus:
+            tags.add("gpu")
+            tags |= {f"gpu:{vendor}" for vendor in self.gpus}
+        else:
+            tags.add("cpu-only")
+        return tags
+
+
+def cpu_flags(root: Path) -> list[str]:
+    """
+    cpu_flags(root: Path) -> list[str]
+
+
+    Flags of the first CPU in `root/proc/cpuinfo` ("flags" on x86, "Features"
+    on ARM).
+    """
+
+    try:
+        with open(root / "proc" / "cpuinfo", "r") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key.strip() in ("flags", "Features"):
+                    return sorted(set(value.split()))
+    except OSError as e:
+        logger.warning(f"Could not read the CPU flags: {e}")
+    return list()
+
+
+def numa_nodes(root: Path) -> int:
+    """
+    numa_nodes(root: Path) -> int
+
+
+    Number of NUMA nodes in `root/sys/devices/system/node` (1 if there is no
+    NUMA information).
+    """
+
+    node_dir = root / "sys" / "devices" / "system" / "node"
+    nodes = [
+        d for d in node_dir.glob("node*") if re.fullmatch(r"node\d+", d.name)
+    ]
+    return max(len(nodes), 1)
+
+
+def gpus(root: Path) -> list[str]:
+    """
+    gpus(root: Path) -> list[str]
+
+
+    Vendors of the accelerators: found as PCI devices in
+    `root/sys/bus/pci/devices`, or as driver devices in `root/dev`.
+    """
+
+    vendors = set()
+    for device in (root / "sys" / "bus" / "pci" / "devices").glob("*"):
+        try:
+            vendor = (device / "vendor").read_text().strip()
+            device_class = (device / "class").read_text().strip()
+        except OSError:
+            continue
+        if vendor in GPU_VENDORS and device_class.startswith(GPU_CLASSES):
+            vendors.add(GPU_VENDORS[vendor])
+
+    for vendor, pattern in GPU_DEVICES:
+        if any((root / "dev").glob(pattern)):
+            vendors.add(vendor)
+
+    return sorted(vendors)
+
+
+def detect(root: Path|None = None) -> Topology:
+    """
+    detect(root: Path|None = None) -> Topology
+
+
+    The topology of this node, read from `root` (default: `sysfs_root()`).
+    """
+
+    root = sysfs_root() if root is None else root
+    topology = Topology(
+        cpu_flags=cpu_flags(root), numa_nodes=numa_nodes(root),
+        gpus=gpus(root)
+    )
+    logger.debug(f"Detected {topology=}")
+    return topology
+
+
+def select_variant(
+            capabilities: dict[str, list[str]], topology: Topology,
+            default: str|None = None
+        ) -> str|None:
+    """
+    select_variant(
+            capabilities: dict[str, list[str]], topology: Topology,
+            default: str|None = None
+        ) -> str|None
+
+
+    The best variant for `topology`: of the variants whose required
+    `capabilities` (tags, c.f. `Topology.tags`) are all present, the one that
+    requires the most -- i.e. the most specific build. Ties go to `default`,
+    then to the first variant. Returns None if no variant fits.
+    """
+
+    tags = topology.tags
+    fitting = [
+        variant for variant, required in capabilities.items()
+        if set(required) <= tags
+    ]
+    if not fitting:
+        logger.warning(f"No variant fits this node: {sorted(tags)}")
+        return None
+
+    best = max(len(capabilities[variant]) for variant in fitting)
+    candidates = [v for v in fitting if len(capabilities[v]) == best]
+    variant = default if default in candidates else candidates[0]
+    logger.info(
+        f"Selected {variant=} (requires {capabilities[variant]}) for this node"
+    )
+    return variant
@@ -0,0 +1,185 @@
+import json
+import os
+import threading
+import time
+
+from contextvars import ContextVar
+from pathlib     import Path
+from typing      import Any
+
+
+class _NullSpan:
+    """
+    Stand-in for Span that is returned while tracing is disabled. It is falsy,
+    so expensive attributes can be guarded by `if span: span.set(...)`.
+    """
+
+    def set(self, **attrs):
+        pass
+
+
+    def __bool__(self):
+        return False
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    A timed, named region of the installer. Spans nest: a span started while
+    another span is active (in the same thread or asyncio task) becomes its
+    child. Attributes are set at construction, or later using `set`.
+    """
+
+    __slots__ = (
+        "tracer", "name", "attrs", "id", "parent", "depth", "thread",
+        "start", "end", "_token"
+    )
+
+    def __init__(self, tracer, name: str, attrs: dict[str, Any]):
+        self.tracer = tracer
+        self.name   = name
+        self.attrs  = attrs
+        self.id     = -1
+        self.parent = None
+        self.depth  = 0
+        self.thread = 0
+        self.start  = 0
+        self.end    = 0
+
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+    def __enter__(self):
+        parent = self.tracer._current.get()
+        if parent is not None:
+            self.parent = parent.id
+            self.depth  = parent.depth + 1
+        self.thread = threading.get_ident()
+        self.id     = self.tracer._register(self)
+        self._token = self.tracer._current.set(self)
+        self.start  = time.perf_counter_ns()
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end = time.perf_counter_ns()
+        self.tracer._current.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        return False
+
+
+class Tracer:
+    """
+    Collects Spans once it is enabled. While disabled, `span` returns the
+    shared NULL_SPAN -- so instrumented code pays for one attribute lookup
+    and a function call only.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.spans: list[Span] = list()
+
+        self._lock    = threading.Lock()
+        self._current: ContextVar[Span|None] = ContextVar(
+            "mpi4py_installer_span", default=None
+        )
+        self._origin  = time.perf_counter_ns()
+
+
+    def enable(self):
+        self._origin = time.perf_counter_ns()
+        self.enabled = True
+
+
+    def span(self, name: str, **attrs) -> Span|_NullSpan:
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, attrs)
+
+
+    def _register(self, span: Span) -> int:
+        with self._lock:
+            self.spans.append(span)
+            return len(self.spans) - 1
+
+
+    def chrome_trace(self) -> dict[str, Any]:
+        """
+        chrome_trace(self) -> dict[str, Any]
+
+
+        All spans as Chrome trace event format ("complete" events) -- this can
+        be loaded into `chrome://tracing` or https://ui.perfetto.dev
+        """
+
+        pid = os.getpid()
+        events = [
+            {
+                "name": s.name, "cat": "mpi4py_installer", "ph": "X",
+                "ts": (s.start - self._origin) / 1e3,
+                "dur": (s.end - s.start) / 1e3,
+                "pid": pid, "tid": s.thread, "args": s.attrs
+            }
+            for s in self.spans
+        ]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+    def timeline(self) -> dict[str, Any]:
+        """
+        timeline(self) -> dict[str, Any]
+
+
+        All spans as a flat list ordered by start time (times in seconds).
+        """
+
+        spans = [
+            {
+                "id": s.id, "parent": s.parent, "depth": s.depth,
+                "name": s.name, "thread": s.thread,
+                "start": (s.start - self._origin) / 1e9,
+                "duration": (s.end - s.start) / 1e9,
+                "attrs": s.attrs
+            }
+            for s in sorted(self.spans, key=lambda s: s.start)
+        ]
+        return {"spans": spans}
+
+
+    def write(self, path: Path, format: str = "chrome"):
+        if format == "chrome":
+            data = self.chrome_trace()
+        elif format == "json":
+            data = self.timeline()
+        else:
+            raise RuntimeError(f"Unknown trace {format=}")
+
+        with open(path, "w") as f:
+            json.dump(data, f, default=str)
+
+
+# Global tracer used by all of the installer's instrumentation
+TRACER = Tracer()
+
+
+def span(name: str, **attrs) -> Span|_NullSpan:
+    """
+    span(name: str, **attrs) -> Span|_NullSpan
+
+
+    Context manager timing the enclosed code as a span of the global tracer.
+    """
+    return TRACER.span(name, **attrs)
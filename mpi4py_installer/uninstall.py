@@ -0,0 +1,137 @@
+from .                      import logger
+from .tracing               import span
+from .validated_dataclasses import ValidatedDataClass
+
+import importlib
+import importlib.metadata
+import os
+import site
+import sys
+import time
+
+from dataclasses import dataclass
+from pathlib     import Path
+
+
+@dataclass(frozen=True)
+class UninstallReport(metaclass=ValidatedDataClass):
+    name: str
+    location: str
+    files: int
+    dirs: int
+    wall: float
+
+    def __str__(self):
+        return (
+            f"{self.name}: removed {self.files} files and {self.dirs} dirs "
+            f"from {self.location} in {self.wall:.3f}s"
+        )
+
+
+def _allowed_roots(location: Path) -> list[Path]:
+    # RECORD entries may point outside of site-packages (e.g. scripts in
+    # `bin`) -- but never outside of the environment or the user base
+    roots = [location, Path(sys.prefix).resolve()]
+    if site.USER_BASE is not None:
+        roots.append(Path(site.USER_BASE).resolve())
+    return roots
+
+
+def record_files(
+            dist: importlib.metadata.Distribution
+        ) -> tuple[Path, set[Path]]|None:
+    """
+    record_files(
+            dist: importlib.metadata.Distribution
+        ) -> tuple[Path, set[Path]]|None
+
+
+    The directory `dist` is installed in, and the (resolved) files listed in
+    its RECORD, together with their cached bytecode. Returns None if `dist`
+    has no RECORD.
+    """
+
+    if dist.files is None:
+        return None
+
+    location = Path(dist.locate_file("")).resolve()
+    roots = _allowed_roots(location)
+
+    files = set()
+    for entry in dist.files:
+        path = Path(dist.locate_file(entry)).resolve()
+        if not any(path.is_relative_to(root) for root in roots):
+            logger.warning(f"Not removing {path}: outside of {roots}")
+            continue
+        files.add(path)
+        if path.suffix == ".py":
+            files.update((path.parent / "__pycache__").glob(f"{path.stem}.*.pyc"))
+
+    return location, files
+
+
+def uninstall_distribution(name: str) -> UninstallReport|None:
+    """
+    uninstall_distribution(name: str) -> UninstallReport|None
+
+
+    Uninstall the distribution `name` (from wherever this interpreter imports
+    it -- i.e. the user site or site-packages) by deleting the files listed in
+    its RECORD, their `__pycache__`, and any directories that are left empty.
+    Returns None if `name` is not installed, or has no RECORD. Raises
+    PermissionError (before deleting anything) if the files can't be removed.
+    """
+
+    start = time.perf_counter()
+    try:
+        dist = importlib.metadata.distribution(name)
+    except importlib.metadata.PackageNotFoundError:
+        logger.info(f"{name} is not installed")
+        return None
+
+    record = record_files(dist)
+    if record is None:
+        logger.info(f"{name} has no RECORD")
+        return None
+    location, files = record
+
+    parents = {path.parent for path in files}
+    for parent in parents:
+        if parent.exists() and not os.access(parent, os.W_OK):
+            raise PermissionError(f"Can't remove {name} from {parent}")
+
+    n_files = 0
+    for path in files:
+        try:
+            path.unlink()
+            n_files += 1
+        except FileNotFoundError:
+            pass
+
+    # Remove the directories that are now empty -- deepest first, and never
+    # anything above the install location
+    dirs = set()
+    for parent in parents:
+        while parent != location and parent.is_relative_to(location):
+            dirs.add(parent)
+            parent = parent.parent
+
+    n_dirs = 0
+    for path in sorted(dirs, key=lambda p: len(p.parts), reverse=True):
+        pycache = path / "__pycache__"
+        try:
+            if pycache.is_dir() and not any(pycache.iterdir()):
+                pycache.rmdir()
+                n_dirs += 1
+            path.rmdir()
+            n_dirs += 1
+        except (FileNotFoundError, OSError):
+            # not empty (or already gone)
+            pass
+
+    importlib.invalidate_caches()
+
+    return UninstallReport(
+        name=name, location=str(location), files=n_files, dirs=n_dirs,
+        wall=time.perf_counter() - start
+    )
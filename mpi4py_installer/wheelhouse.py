@@ -0,0 +1,163 @@
+from . import logger
+
+import json
+import os
+import shutil
+import threading
+import time
+
+from pathlib import Path
+from typing  import Any
+
+
+def cache_path() -> Path:
+    """
+    cache_path() -> Path
+
+
+    Location of the per-user wheel cache: `MPI4PY_INSTALLER_CACHE` if set, or
+    `mpi4py_installer` in the user's cache directory. Point
+    `MPI4PY_INSTALLER_CACHE` at a group-writable directory to share builds
+    between users.
+    """
+
+    if "MPI4PY_INSTALLER_CACHE" in os.environ:
+        return Path(os.environ["MPI4PY_INSTALLER_CACHE"])
+
+    cache_home = os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")
+    return Path(cache_home) / "mpi4py_installer"
+
+
+class Wheelhouse:
+    """
+    Shared directory of prebuilt mpi4py wheels, indexed by build fingerprint:
+
+    <root>/
+        index/<fingerprint>.json        entry pointing to the wheel
+        wheels/<fingerprint>/<wheel>    the wheel itself
+        locks/<fingerprint>.lock        held while the wheel is being built
+
+    Wheels and index entries are published by writing to a temporary file and
+    renaming it -- and an index entry is only published after its wheel. So
+    readers never see partial wheels. A lookup reads a single (small) index
+    entry, and never lists directories -- which is important on slow, shared
+    file systems. An entry whose wheel has been removed (eg. by cleaning up
+    the cache) is treated as missing => the wheel is rebuilt.
+    """
+
+    def __init__(self, root: str|Path):
+        self.root = Path(root)
+
+
+    def _entry_path(self, fingerprint: str) -> Path:
+        return self.root / "index" / f"{fingerprint}.json"
+
+
+    def lock_path(self, fingerprint: str) -> Path:
+        return self.root / "locks" / f"{fingerprint}.lock"
+
+
+    def entry(self, fingerprint: str) -> dict[str, Any]|None:
+        """
+        entry(self, fingerprint: str) -> dict[str, Any]|None
+
+
+        Index entry for `fingerprint`, or None if there isn't one.
+        """
+
+        try:
+            with open(self._entry_path(fingerprint), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable wheelhouse entry: {e}")
+            return None
+
+
+    def lookup(self, fingerprint: str) -> Path|None:
+        """
+        lookup(self, fingerprint: str) -> Path|None
+
+
+        Path to the prebuilt wheel for `fingerprint`, or None if there isn't
+        one in this wheelhouse (or if its wheel file is gone).
+        """
+
+        entry = self.entry(fingerprint)
+        if entry is None:
+            logger.info(f"No prebuilt wheel for {fingerprint=} in {self.root}")
+            return None
+
+        wheel = self.root / entry["wheel"]
+        if not wheel.is_file():
+            logger.warning(f"Ignoring wheelhouse entry without wheel: {wheel}")
+            return None
+        logger.info(f"Found prebuilt wheel: {wheel}")
+        return wheel
+
+
+    @staticmethod
+    def _tmp_path(dest: Path) -> Path:
+        # unique per process and thread => concurrent publishes don't clash
+        return dest.with_name(
+            f".{dest.name}.{os.getpid()}-{threading.get_ident()}.tmp"
+        )
+
+
+    @staticmethod
+    def _atomic_copy(src: Path, dest: Path):
+        tmp = Wheelhouse._tmp_path(dest)
+        try:
+            shutil.copyfile(src, tmp)
+            with open(tmp, "rb") as f:
+                os.fsync(f.fileno())
+            # make the wheel readable by everyone using the wheelhouse
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, dest)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+
+
+    def publish(
+                self, fingerprint: str, wheel: Path,
+                meta: dict[str, Any]|None = None
+            ) -> Path:
+        """
+        publish(
+                self, fingerprint: str, wheel: Path,
+                meta: dict[str, Any]|None = None
+            ) -> Path
+
+
+        Atomically add `wheel` to the wheelhouse under `fingerprint` (replacing
+        any previous wheel with the same fingerprint), together with optional
+        metadata. Returns the path of the published wheel.
+        """
+
+        wheel = Path(wheel)
+        wheel_dir = self.root / "wheels" / fingerprint
+        wheel_dir.mkdir(parents=True, exist_ok=True)
+        self._entry_path(fingerprint).parent.mkdir(parents=True, exist_ok=True)
+
+        dest = wheel_dir / wheel.name
+        self._atomic_copy(wheel, dest)
+
+        entry = {
+            "fingerprint": fingerprint,
+            "wheel": str(dest.relative_to(self.root)),
+            "published": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "meta": meta or dict()
+        }
+        entry_path = self._entry_path(fingerprint)
+        tmp = Wheelhouse._tmp_path(entry_path)
+        with open(tmp, "w") as f:
+            json.dump(entry, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, entry_path)
+
+        logger.info(f"Published {dest} to wheelhouse {self.root}")
+        return dest
@@ -17,7 +17,7 @@ setuptools.setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://github.com/JBlaschke/mpi4py-installer",
-    packages=setuptools.find_packages(),
+    packages=setuptools.find_packages(exclude=["benchmarks", "benchmarks.*"]),
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
@@ -0,0 +1,57 @@
+from mpi4py_installer import MPIConfig, fingerprint
+
+
+LIBRARIES = {
+    "mpich/mpicc":  "/opt/mpich/lib/libmpi.so.12.4.1",
+    "impi/mpicc":   "/opt/intel/mpi/lib/libmpi.so.12.0.0",
+    "ompi/mpicc":   "/opt/openmpi/lib/libmpi.so.40.30.4",
+    "cray/mpicc":   "/opt/cray/pe/mpich/lib/libmpi_gnu_123.so.12.0.0",
+    "custom/mpicc": "/opt/custom/lib/libmpi_custom.so.3"
+}
+
+
+def fake_libmpi(config, env=None):
+    return LIBRARIES[config.MPICC]
+
+
+def test_abi_families(monkeypatch):
+    monkeypatch.setattr(fingerprint, "libmpi", fake_libmpi)
+
+    configs = {
+        name: MPIConfig(MPICC=f"{name}/mpicc", CC=cc, mpicc_show="-show")
+        for name, cc in [
+            ("mpich", "gcc"), ("impi", "icx"), ("ompi", "gcc"),
+            ("cray", "gcc"), ("custom", "gcc")
+        ]
+    }
+    assert [fingerprint.abi_family(c) for c in configs.values()] == [
+        "mpich", "mpich", "openmpi", "mpich", None
+    ]
+
+    def fp(name, abi_portable):
+        return fingerprint.build_fingerprint(
+            configs[name], abi_portable=abi_portable
+        )
+
+    # MPICH and Intel MPI share a portable build, Open MPI doesn't
+    assert fp("mpich", False) != fp("impi", False)
+    assert fp("mpich", True) == fp("impi", True)
+    assert fp("mpich", True) != fp("ompi", True)
+    # ... and so does Cray MPICH
+    assert fp("mpich", True) == fp("cray", True)
+    # libraries of unknown families are built for themselves
+    assert fp("custom", True) == fp("custom", False)
+
+
+def test_select_libmpi(monkeypatch):
+    monkeypatch.setattr(fingerprint, "libmpi", fake_libmpi)
+    config = MPIConfig(MPICC="impi/mpicc", LDFLAGS="-s").portable()
+
+    assert config.LDFLAGS == f"-s {MPIConfig.PORTABLE_LDFLAGS}"
+    assert config.portable() == config
+
+    env = fingerprint.select_libmpi(config, {"LD_LIBRARY_PATH": "/usr/lib"})
+    assert env == {
+        "LD_LIBRARY_PATH": "/opt/intel/mpi/lib:/usr/lib",
+        "MPI4PY_LIBMPI": "/opt/intel/mpi/lib/libmpi.so.12.0.0"
+    }
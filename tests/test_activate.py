@@ -0,0 +1,34 @@
+import subprocess
+
+from mpi4py_installer import MPIConfig
+from mpi4py_installer.activate import env_delta, activation_script, \
+    write_activation_script
+
+
+def test_env_delta():
+    base = {"PATH": "/usr/bin", "GONE": "1", "SAME": "x", "SHLVL": "1"}
+    env = {"PATH": "/opt/mpi/bin:/usr/bin", "NEW": "a b", "SAME": "x",
+           "SHLVL": "2"}
+
+    assert env_delta(env, base) == {
+        "PATH": "/opt/mpi/bin:/usr/bin", "NEW": "a b", "GONE": None
+    }
+
+
+def test_activation_script(tmp_path):
+    config = MPIConfig(runtime_env={"MPI4PY_RC_THREAD_LEVEL": "funneled"})
+    env = {"PATH": "/opt/mpi/bin:/usr/bin", "QUOTED": "it's $HOME"}
+    script = write_activation_script(
+        tmp_path / "etc" / "activate.sh", env, config
+    )
+
+    out = subprocess.run(
+        ["bash", "-c", f"source {script}; echo $QUOTED; "
+                       "echo $MPI4PY_RC_THREAD_LEVEL"],
+        capture_output=True, text=True, check=True
+    )
+    assert out.stdout == "it's $HOME\nfunneled\n"
+    assert "module" not in activation_script({"A": "1"})
+
+    # runtime settings don't change the build
+    assert config.fingerprint == MPIConfig().fingerprint
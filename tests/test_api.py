@@ -0,0 +1,134 @@
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from mpi4py_installer           import api, install, load_site, load_user_site
+from mpi4py_installer.singleton import Singleton
+
+
+def test_singleton_is_thread_safe():
+    constructed = list()
+
+    class Slow(metaclass=Singleton):
+        def __init__(self, name):
+            time.sleep(0.05)
+            constructed.append(name)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        instances = list(pool.map(lambda _: Slow("a"), range(8)))
+
+    assert constructed == ["a"]
+    assert all(i is instances[0] for i in instances)
+
+
+def test_user_sites_are_distinct_modules(tmp_path):
+    for name in ("one", "two"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "mysite.py").write_text(f"NAME = '{name}'\n")
+
+    one = load_user_site("mysite", tmp_path / "one")
+    two = load_user_site("mysite", tmp_path / "two")
+
+    assert (one.NAME, two.NAME) == ("one", "two")
+    assert load_user_site("mysite", tmp_path / "one") is one
+
+
+def test_install_reports_failures(tmp_path, monkeypatch):
+    monkeypatch.setenv("MPI4PY_INSTALLER_CACHE", str(tmp_path / "cache"))
+    monkeypatch.delenv("MPI4PY_INSTALLER_WHEELHOUSE", raising=False)
+
+    # publishing needs a wheelhouse => fails before anything is built
+    result = install(
+        site="local", system="default", variant="gcc", publish=True
+    )
+
+    assert not result.ok
+    assert result.phase == "inspect"
+    assert "wheelhouse" in result.error
+    assert result.config.MPICC == "mpicc"
+    assert set(result.timings) == {"inspect"}
+
+
+def test_resolve_site_module():
+    site = load_site("local")
+    resolved, system, variant, config = api.resolve(site, "default", "gcc")
+    assert resolved is site
+    assert config.CC == "gcc"
+
+
+def test_source_installs_are_serialized(tmp_path, monkeypatch):
+    events = list()
+
+    def step(name):
+        def run(*args, **kwargs):
+            events.append(name)
+            time.sleep(0.02)
+            events.append(name)
+            return True
+        return run
+
+    monkeypatch.setattr(api, "init_env", lambda init: dict())
+    monkeypatch.setattr(api, "libmpi", lambda config, env: None)
+    monkeypatch.setattr(api, "build_fingerprint", lambda *a, **kw: "fp")
+    monkeypatch.setattr(api, "pip_find_mpi4py", lambda: True)
+    monkeypatch.setattr(api, "pip_uninstall_mpi4py", step("uninstall"))
+    monkeypatch.setattr(api, "pip_install_mpi4py", step("install"))
+    monkeypatch.setattr(api, "run_sanity", lambda *a, **kw: True)
+    monkeypatch.setattr(api, "interpreter_paths", lambda python: {
+        "prefix": str(tmp_path / "prefix"),
+        "platlib": str(tmp_path / "site-packages"), "usersite": ""
+    })
+
+    def run(i):
+        return install(
+            site="local", system="default", variant="gcc",
+            use_wheelhouse=False, activate_script=str(tmp_path / f"{i}.sh")
+        )
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        results = list(pool.map(run, range(2)))
+
+    assert all(r.ok for r in results)
+    # the uninstall and install of one caller are never interleaved
+    assert events == ["uninstall"] * 2 + ["install"] * 2 \
+        + ["uninstall"] * 2 + ["install"] * 2
+
+
+def test_failed_microbench_removes_staging(tmp_path, monkeypatch):
+    location = tmp_path / "site-packages"
+    envs = list()
+
+    def run_microbench(python, path=(), env=None):
+        envs.append(env)
+        raise RuntimeError("libmpi.so.12: cannot open shared object file")
+
+    monkeypatch.setenv("MPI4PY_INSTALLER_CACHE", str(tmp_path / "cache"))
+    monkeypatch.delenv("MPI4PY_INSTALLER_WHEELHOUSE", raising=False)
+    monkeypatch.setattr(api, "init_env", lambda init: {"FROM_INIT": "1"})
+    monkeypatch.setattr(api, "libmpi", lambda config, env: None)
+    monkeypatch.setattr(api, "build_fingerprint", lambda *a, **kw: "fp")
+    monkeypatch.setattr(api, "interpreter_paths", lambda python: {
+        "prefix": str(tmp_path / "prefix"), "platlib": str(location),
+        "usersite": ""
+    })
+    monkeypatch.setattr(
+        api, "pip_wheel_mpi4py", lambda *a, **kw: tmp_path / "mpi4py.whl"
+    )
+    monkeypatch.setattr(
+        api, "stage_wheel",
+        lambda wheel, location, python: location / ".mpi4py-staging-1"
+    )
+    location.mkdir()
+    (location / ".mpi4py-staging-1").mkdir()
+    monkeypatch.setattr(api, "run_sanity", lambda *a, **kw: True)
+    monkeypatch.setattr(api.microbench, "run_microbench", run_microbench)
+
+    result = install(
+        site="local", system="default", variant="gcc", run_microbench=True,
+        activate_script=str(tmp_path / "activate.sh")
+    )
+
+    assert (result.ok, result.phase) == (False, "microbench")
+    # the benchmark ran in the `init` environment, and nothing was left behind
+    assert envs == [{"FROM_INIT": "1"}]
+    assert [p.name for p in location.iterdir()] == [".mpi4py-installer.lock"]
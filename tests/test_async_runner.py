@@ -0,0 +1,87 @@
+import asyncio
+import os
+import time
+
+from mpi4py_installer.runners import AsyncShellRunner
+
+
+def test_persistent_env():
+    async def main():
+        async with AsyncShellRunner() as runner:
+            out = await runner.run("export FOO=bar")
+            assert out.returncode == 0
+            out = await runner.run("echo $FOO", capture_output=True)
+            assert out.stdout.decode().strip() == "bar"
+            assert runner.env["FOO"] == "bar"
+
+            # large environments must not block the env snapshot
+            out = await runner.run(
+                "for i in 1 2 3 4; do "
+                "export BIG$i=$(head -c 50000 /dev/zero | tr '\\0' x); done"
+            )
+            assert len(runner.env["BIG4"]) == 50000
+
+            # early exit => environment is unchanged
+            out = await runner.run("export BAZ=1; exit 3")
+            assert out.returncode == 3
+            assert "BAZ" not in runner.env
+
+    asyncio.run(main())
+
+
+def test_stream():
+    async def main():
+        async with AsyncShellRunner() as runner:
+            lines = list()
+            async with runner.stream("echo a; echo b >&2; echo c; export X=1") as stream:
+                async for name, line in stream:
+                    lines.append((name, line.decode().strip()))
+            assert stream.returncode == 0
+            assert ("stdout", "a") in lines
+            assert ("stderr", "b") in lines
+            assert runner.env["X"] == "1"
+
+    asyncio.run(main())
+
+
+def test_concurrent_runners():
+    async def main():
+        runners = [AsyncShellRunner() for _ in range(16)]
+        start = time.perf_counter()
+        results = await asyncio.gather(*[
+            r.run(f"sleep 0.5; export N={i}") for i, r in enumerate(runners)
+        ])
+        assert time.perf_counter() - start < 4
+        assert all(r.returncode == 0 for r in results)
+        assert [r.env["N"] for r in runners] == [str(i) for i in range(16)]
+
+    asyncio.run(main())
+
+
+def test_cancel_kills_process_group(tmp_path):
+    pid_file = tmp_path / "pid"
+
+    async def main():
+        async with AsyncShellRunner() as runner:
+            task = asyncio.create_task(
+                runner.run(f"sleep 60 & echo $! > {pid_file}; wait")
+            )
+            while not pid_file.exists() or not pid_file.read_text():
+                await asyncio.sleep(0.05)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    asyncio.run(main())
+
+    pid = int(pid_file.read_text())
+    try:
+        # reap nothing (not our child) -- just check that it's gone
+        for _ in range(50):
+            os.kill(pid, 0)
+            time.sleep(0.05)
+        assert False, "background process survived cancellation"
+    except ProcessLookupError:
+        pass
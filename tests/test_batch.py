@@ -0,0 +1,116 @@
+from mpi4py_installer import batch, MPIConfig
+
+import os
+import sys
+
+import pytest
+
+
+def env(root, name):
+    (root / name / "bin").mkdir(parents=True)
+    os.symlink(sys.executable, root / name / "bin" / "python")
+    return str(root / name)
+
+
+def test_load_manifest(tmp_path):
+    manifest = tmp_path / "manifest.csv"
+    manifest.write_text("\n".join([
+        "prefix,site,system,variant",
+        "# comment",
+        "/envs/a,local,default,gcc",
+        "",
+        "/envs/b, , ,",
+        "/envs/a,local,default,gcc",
+    ]))
+
+    rows = batch.load_manifest(manifest)
+    assert rows == [
+        batch.BatchRow(prefix="/envs/a", site="local", system="default",
+                       variant="gcc"),
+        batch.BatchRow(prefix="/envs/b"),
+    ]
+    assert rows[1].python == "/envs/b/bin/python"
+
+    manifest.write_text("prefix,site,flavour\n/envs/a,local,x\n")
+    with pytest.raises(RuntimeError, match="Unknown columns"):
+        batch.load_manifest(manifest)
+    manifest.write_text("prefix,site\n,local\n")
+    with pytest.raises(RuntimeError, match="without a prefix"):
+        batch.load_manifest(manifest)
+
+
+def test_checkpoint_resume(tmp_path):
+    row = batch.BatchRow(prefix="/envs/a")
+    checkpoint = batch.Checkpoint(tmp_path / "checkpoint.json")
+    assert not checkpoint.done(row)
+
+    wheel = tmp_path / "mpi4py-4.0-cp311-cp311-linux_x86_64.whl"
+    wheel.write_text("")
+    checkpoint.set_wheel("build", wheel)
+    checkpoint.update_row(row, status="done", phase=None)
+
+    # a resumed run skips the completed rows and reuses the built wheels
+    resumed = batch.Checkpoint(tmp_path / "checkpoint.json")
+    assert resumed.done(row)
+    assert resumed.wheel("build") == wheel
+    assert resumed.wheel("other") is None
+
+    # ... unless the wheel is gone
+    wheel.unlink()
+    assert resumed.wheel("build") is None
+
+
+def test_plan_deduplicates(tmp_path):
+    rows = [
+        batch.BatchRow(prefix=env(tmp_path, name), site="local",
+                       system="default", variant=variant)
+        for name, variant in [("a", "gcc"), ("b", "gcc"), ("c", "clang"),
+                              ("d", "gcc")]
+    ]
+    checkpoint = batch.Checkpoint(tmp_path / "checkpoint.json")
+    checkpoint.update_row(rows[3], status="done")
+
+    scheduler = batch.BatchScheduler(rows, checkpoint, tmp_path / "wheels")
+    builds = scheduler.plan()
+
+    # same ABI and config => one build, completed rows are skipped
+    assert sorted(
+        [row.prefix for row, *_ in b.rows] for b in builds
+    ) == [[rows[0].prefix, rows[1].prefix], [rows[2].prefix]]
+    assert set(scheduler.configs) == {row.key for row in rows[:3]}
+
+
+def test_install_keeps_current_on_failure(tmp_path, monkeypatch):
+    row = batch.BatchRow(prefix=env(tmp_path, "a"), site="local",
+                         system="default", variant="gcc")
+    checkpoint = batch.Checkpoint(tmp_path / "checkpoint.json")
+    scheduler = batch.BatchScheduler([row], checkpoint, tmp_path / "wheels")
+    scheduler.plan()
+
+    location = tmp_path / "site-packages"
+    swapped = list()
+    monkeypatch.setattr(batch, "interpreter_paths", lambda python: {
+        "prefix": row.prefix, "platlib": str(location)
+    })
+
+    def stage(wheel, location, python):
+        (location / ".staging").mkdir(parents=True)
+        return location / ".staging"
+
+    monkeypatch.setattr(batch, "stage_wheel", stage)
+    monkeypatch.setattr(
+        batch, "swap_in", lambda staging, location: swapped.append(staging)
+    )
+
+    # the staged install fails its check => never swapped in
+    monkeypatch.setattr(batch, "row_sanity", lambda *a, **kw: False)
+    scheduler._install(row, "local", "default", "gcc", "x.whl", 0., False)
+    assert swapped == []
+    assert not (location / ".staging").exists()
+    assert checkpoint.rows[row.key]["phase"] == "sanity"
+
+    # environments in the system prefix are left alone
+    scheduler.configs[row.key] = MPIConfig(sys_prefix=row.prefix)
+    scheduler._install(row, "local", "default", "gcc", "x.whl", 0., False)
+    assert checkpoint.rows[row.key]["phase"] == "inspect"
+    assert "system prefix" in checkpoint.rows[row.key]["error"]
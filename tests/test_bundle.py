@@ -0,0 +1,55 @@
+import json
+import tarfile
+
+from concurrent.futures import ThreadPoolExecutor
+
+from mpi4py_installer.bundle import export_bundle, stage_bundle, BUNDLE_META
+
+
+def _fake_install(root):
+    (root / "mpi4py").mkdir(parents=True)
+    (root / "mpi4py" / "__init__.py").write_text("version = '1.0'\n")
+    info = root / "mpi4py-1.0.dist-info"
+    info.mkdir()
+    (info / "METADATA").write_text("Name: mpi4py\nVersion: 1.0\n")
+    (info / "RECORD").write_text("\n".join([
+        "mpi4py/__init__.py,,",
+        "mpi4py-1.0.dist-info/METADATA,,",
+        "mpi4py-1.0.dist-info/RECORD,,",
+    ]))
+    (root / "other.py").write_text("")
+
+
+def test_export_bundle(tmp_path):
+    location = tmp_path / "site-packages"
+    _fake_install(location)
+
+    archive = export_bundle(
+        location, tmp_path / "mpi4py.tar", "abc123", meta={"system": "test"}
+    )
+    with tarfile.open(archive) as tar:
+        names = tar.getnames()
+        meta = json.load(
+            tar.extractfile(f"mpi4py-bundle-abc123/{BUNDLE_META}")
+        )
+
+    # a single top-level directory, with bytecode and without other packages
+    assert all(n.startswith("mpi4py-bundle-abc123/") for n in names)
+    assert any(n.endswith(".pyc") for n in names)
+    assert not any("other" in n for n in names)
+    assert meta["fingerprint"] == "abc123" and meta["system"] == "test"
+
+
+def test_stage_once_per_node(tmp_path):
+    location = tmp_path / "site-packages"
+    _fake_install(location)
+    archive = export_bundle(location, tmp_path / "mpi4py.tar", "abc123")
+    node = tmp_path / "node-local"
+
+    # all "ranks" on the node stage the bundle at once
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        staged = set(pool.map(lambda _: stage_bundle(archive, node), range(8)))
+
+    assert staged == {node / "mpi4py-bundle-abc123"}
+    assert sorted(p.name for p in node.iterdir()) == ["mpi4py-bundle-abc123"]
+    assert (node / "mpi4py-bundle-abc123" / "mpi4py" / "__init__.py").is_file()
@@ -0,0 +1,26 @@
+import os
+import py_compile
+
+from mpi4py_installer.bytecode import precompile, import_accesses
+
+
+def test_unchecked_hash_pycs(tmp_path):
+    package = tmp_path / "fakepkg"
+    package.mkdir()
+    (package / "__init__.py").write_text("from . import core\n")
+    (package / "core.py").write_text("x = 1\n")
+
+    # timestamp pycs go stale when the sources are copied (new mtimes) =>
+    # every import reads the sources, and tries to rewrite the pycs
+    for f in package.glob("*.py"):
+        py_compile.compile(f)
+        os.utime(f, (0, 1))
+    stale = import_accesses(module="fakepkg", path=(str(tmp_path),))
+    assert stale == {"source_stats": 2, "source_reads": 2, "pyc_writes": 2}
+
+    assert precompile([package], optimize=(0, 1))
+    assert len(list((package / "__pycache__").glob("*.opt-1.pyc"))) == 2
+    for f in package.glob("*.py"):
+        os.utime(f, (0, 2))
+    after = import_accesses(module="fakepkg", path=(str(tmp_path),))
+    assert after == {"source_stats": 2, "source_reads": 0, "pyc_writes": 0}
@@ -0,0 +1,92 @@
+from mpi4py_installer import daemon, init_env, cache_init_envs
+
+import mpi4py_installer
+
+import os
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setenv("MPI4PY_INSTALLER_SOCKET", str(tmp_path / "d.sock"))
+    d = daemon.Daemon(daemon.socket_path())
+    thread = threading.Thread(target=d.serve_forever)
+    thread.start()
+    yield d
+    d.shutdown()
+    thread.join()
+    d.server_close()
+    cache_init_envs(False)
+
+
+def test_ping_and_detect(server):
+    # pytest changes PYTEST_CURRENT_TEST between the fixture and the test
+    server.env = daemon.env_hash()
+    assert daemon.ping()["pid"] == os.getpid()
+    assert oct(daemon.socket_path().stat().st_mode & 0o777) == "0o600"
+
+    response = daemon.request("detect", {"site": "local"})
+    assert response["ok"]
+    assert response["result"] == daemon.detect(site="local")
+
+    response = daemon.request("frobnicate")
+    assert not response["ok"]
+    assert "Unknown request" in response["error"]
+
+
+def test_env_mismatch(server, monkeypatch):
+    # the daemon only serves clients with its own environment
+    server.env = daemon.env_hash()
+    monkeypatch.setenv("MPI4PY_DAEMON_TEST", "1")
+    assert daemon.ping() is not None
+    assert not daemon.request("detect", {"site": "local"})["ok"]
+    assert daemon.remote_install(site="local") is None
+
+
+def test_daemon_errors_are_raised(server):
+    # only a mismatched environment falls back to installing in-process
+    server.env = daemon.env_hash()
+    with pytest.raises(RuntimeError, match="The daemon failed to install"):
+        daemon.remote_install(site="nosuchsite")
+
+
+def test_terminal_differs(server, monkeypatch):
+    # variables that don't affect builds (eg. of another login shell) are fine
+    server.env = daemon.env_hash()
+    monkeypatch.setenv("TERM", "xterm-kitty-test")
+    monkeypatch.setenv("SSH_CONNECTION", "10.0.0.1 22 10.0.0.2 22")
+    assert daemon.request("detect", {"site": "local"})["ok"]
+
+    monkeypatch.setenv("MPI4PY_INSTALLER_DAEMON_ENV", "SITE_HOST")
+    monkeypatch.setenv("SITE_HOST", "cluster")
+    assert not daemon.request("detect", {"site": "local"})["ok"]
+
+
+def test_no_daemon(tmp_path, monkeypatch):
+    monkeypatch.setenv("MPI4PY_INSTALLER_SOCKET", str(tmp_path / "d.sock"))
+    assert daemon.ping() is None
+    assert daemon.remote_install(site="local") is None
+
+
+def test_invalidation(tmp_path, monkeypatch):
+    monkeypatch.setenv("MODULEPATH", str(tmp_path))
+    (tmp_path / "openmpi").mkdir()
+
+    cache_init_envs(True)
+    try:
+        caches = daemon.Caches()
+        assert not caches.check()
+        env = init_env("export MPI4PY_DAEMON_TEST=1")
+        assert init_env("export MPI4PY_DAEMON_TEST=1") == env
+        assert not caches.check()
+
+        # a new module version => the caches are dropped
+        (tmp_path / "openmpi" / "5.0.lua").write_text("")
+        os.utime(tmp_path / "openmpi", ns=(0, 0))
+        assert caches.check()
+        assert mpi4py_installer._INIT_ENV_CACHE == dict()
+        assert not caches.check()
+    finally:
+        cache_init_envs(False)
@@ -0,0 +1,54 @@
+import pytest
+
+from mpi4py_installer import discovery
+
+
+FAKE_MPICC = """#!/bin/sh
+case "$1" in
+    -show) echo "{cc} -I/fake/include -L/fake/lib -lmpi" ;;
+    -v)    echo "mpicc for MPICH version {version}" ;;
+    *)     exit 1 ;;
+esac
+"""
+
+
+def fake_mpicc(bin_dir, cc, version):
+    bin_dir.mkdir(parents=True)
+    mpicc = bin_dir / "mpicc"
+    mpicc.write_text(FAKE_MPICC.format(cc=cc, version=version))
+    mpicc.chmod(0o755)
+
+
+def test_discover(tmp_path, monkeypatch):
+    monkeypatch.setattr(discovery, "PREFIX_GLOBS", ())
+    fake_mpicc(tmp_path / "path", "gcc", "4.1.2")
+    fake_mpicc(tmp_path / "module", "clang", "4.2.0")
+    (tmp_path / "modulefiles" / "mpich").mkdir(parents=True)
+    (tmp_path / "modulefiles" / "mpich" / "4.2.0.lua").write_text(
+        f'prepend_path("PATH", "{tmp_path / "module"}")\n'
+    )
+
+    env = {
+        "PATH": str(tmp_path / "path"),
+        "MODULEPATH": str(tmp_path / "modulefiles")
+    }
+    cache = tmp_path / "discovery.json"
+    toolchains = discovery.discover(env, cache=cache)
+
+    config = discovery.site_config(toolchains)
+    assert config["systems"]["default"] == {
+        "mpich-4.1.2-gcc": {
+            "MPICC": str(tmp_path / "path" / "mpicc"), "CC": "gcc",
+            "mpicc_show": "-show"
+        },
+        "mpich-4.2.0-clang": {
+            "MPICC": str(tmp_path / "module" / "mpicc"), "CC": "clang",
+            "mpicc_show": "-show", "init": ["module load mpich/4.2.0"]
+        }
+    }
+
+    # repeat runs use the cache => no wrappers are run
+    def introspect(*args):
+        pytest.fail("introspected a cached wrapper")
+    monkeypatch.setattr(discovery, "introspect", introspect)
+    assert discovery.discover(env, cache=cache) == toolchains
@@ -0,0 +1,106 @@
+import json
+import multiprocessing
+import os
+import socket
+import time
+
+from mpi4py_installer.locking import BuildLock, single_flight, location_lock
+
+
+def _install(root, results):
+    root = os.path.abspath(root)
+    artifact = os.path.join(root, "artifact")
+
+    def build():
+        with open(os.path.join(root, "builds"), "a") as f:
+            f.write(f"{os.getpid()}\n")
+        time.sleep(1)
+        with open(artifact, "w") as f:
+            f.write("wheel")
+        return artifact
+
+    def lookup():
+        return artifact if os.path.exists(artifact) else None
+
+    result, waited = single_flight(
+        os.path.join(root, "build.lock"), build, lookup, poll=0.05
+    )
+    results.put((result, waited))
+
+
+def test_single_flight_builds_once(tmp_path):
+    results = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(target=_install, args=(tmp_path, results))
+        for _ in range(8)
+    ]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(30)
+        assert p.exitcode == 0
+
+    out = [results.get() for _ in procs]
+    assert all(r == str(tmp_path / "artifact") for r, _ in out)
+    assert len((tmp_path / "builds").read_text().split()) == 1
+    # everyone but the builder waited for the build
+    assert sum(w > 0 for _, w in out) >= 1
+    assert not (tmp_path / "build.lock").exists()
+
+
+def test_stale_lock_is_broken(tmp_path):
+    # lock held by a process that no longer exists
+    proc = multiprocessing.Process(target=time.sleep, args=(0,))
+    proc.start()
+    proc.join()
+    lock_path = tmp_path / "build.lock"
+    lock_path.write_text(json.dumps({
+        "pid": proc.pid, "host": socket.gethostname(), "time": time.time()
+    }))
+
+    result, _ = single_flight(
+        lock_path, lambda: "built", lambda: None, poll=0.05, timeout=5
+    )
+    assert result == "built"
+    assert not lock_path.exists()
+
+
+def test_lock_timeout(tmp_path):
+    holder = BuildLock(tmp_path / "build.lock")
+    assert holder.try_acquire()
+    try:
+        waiter = BuildLock(tmp_path / "build.lock")
+        assert not waiter.try_acquire()
+        try:
+            waiter.wait(0.2, poll=0.05)
+        except RuntimeError as e:
+            assert "Timed out" in str(e)
+        else:
+            assert False, "expected a timeout"
+    finally:
+        holder.release()
+
+
+def _swap(location, log):
+    with location_lock(location):
+        with open(log, "a") as f:
+            f.write("start\n")
+        time.sleep(0.2)
+        with open(log, "a") as f:
+            f.write("end\n")
+
+
+def test_location_lock_across_processes(tmp_path):
+    location, log = tmp_path / "site-packages", tmp_path / "log"
+    procs = [
+        multiprocessing.Process(target=_swap, args=(location, log))
+        for _ in range(4)
+    ]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(30)
+        assert p.exitcode == 0
+
+    # the installs into the same location never overlap
+    assert log.read_text().split() == ["start", "end"] * 4
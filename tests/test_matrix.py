@@ -0,0 +1,101 @@
+from mpi4py_installer import matrix, MPIConfig
+
+import threading
+import time
+
+
+def fake_matrix(tmp_path, monkeypatch, locations, fail=(), broken=()):
+    """
+    A build matrix whose interpreters `locations` (python -> site-packages)
+    build and check instantly: builds for the pythons in `fail` fail, and
+    swapped-in installs of the pythons in `broken` fail their sanity check.
+    """
+
+    events = {"swapped": [], "rolled_back": [], "busy": set(), "overlap": 0}
+    lock = threading.Lock()
+
+    monkeypatch.setattr(matrix, "python_abi", lambda python: "cp311")
+    monkeypatch.setattr(matrix, "interpreter_paths", lambda python: {
+        "prefix": str(tmp_path / "prefix"), "platlib": locations[python],
+        "usersite": ""
+    })
+
+    def build(pip_cmd, init, config, python, **kwargs):
+        if python in fail:
+            raise RuntimeError("compiler exploded")
+        return tmp_path / f"mpi4py-{python}.whl"
+
+    def stage(wheel, location, python):
+        with lock:
+            if location in events["busy"]:
+                events["overlap"] += 1
+            events["busy"].add(location)
+        time.sleep(0.02)
+        staging = location / f".staging-{python}"
+        staging.mkdir(parents=True)
+        return staging
+
+    def swap(staging, location):
+        events["swapped"].append(staging.name)
+        with lock:
+            events["busy"].discard(location)
+
+    def sanity(python, site, system, variant, path=(), env=None):
+        return path != () or python not in broken
+
+    monkeypatch.setattr(matrix, "pip_wheel_mpi4py", build)
+    monkeypatch.setattr(matrix, "stage_wheel", stage)
+    monkeypatch.setattr(matrix, "swap_in", swap)
+    monkeypatch.setattr(
+        matrix, "rollback",
+        lambda location: events["rolled_back"].append(str(location))
+    )
+    monkeypatch.setattr(matrix, "run_sanity", sanity)
+    monkeypatch.setattr(
+        matrix, "write_activation_script", lambda *args, **kwargs: None
+    )
+
+    build_matrix = matrix.BuildMatrix(
+        list(locations), "local", "default", "gcc", MPIConfig(), None,
+        cache=None
+    )
+    build_matrix.env = dict()
+    return build_matrix, events
+
+
+def test_failures_are_isolated(tmp_path, monkeypatch):
+    locations = {
+        p: str(tmp_path / p) for p in ("py1", "py2", "py3")
+    }
+    build_matrix, events = fake_matrix(
+        tmp_path, monkeypatch, locations, fail=["py2"], broken=["py3"]
+    )
+    results = [
+        build_matrix._install(p) for p in build_matrix.pythons
+    ]
+
+    assert [r.ok for r in results] == [True, False, False]
+    assert (results[1].phase, results[1].error) \
+        == ("build", "compiler exploded")
+    # the broken install was swapped in, and rolled back
+    assert events["swapped"] == [".staging-py1", ".staging-py3"]
+    assert events["rolled_back"] == [locations["py3"]]
+    assert "rolled back" in results[2].error
+
+    table = matrix.report(results)
+    assert "2 failures:" in table
+    assert "py2: build -- compiler exploded" in table
+
+
+def test_shared_location_is_serialized(tmp_path, monkeypatch):
+    # eg. the same interpreter listed twice
+    shared = str(tmp_path / "site-packages")
+    build_matrix, events = fake_matrix(
+        tmp_path, monkeypatch, {"py1": shared, "py2": shared}
+    )
+    with matrix.ThreadPoolExecutor(max_workers=2) as pool:
+        results = list(pool.map(build_matrix._install, build_matrix.pythons))
+
+    assert all(r.ok for r in results)
+    assert events["overlap"] == 0
+    assert sorted(events["swapped"]) == [".staging-py1", ".staging-py2"]
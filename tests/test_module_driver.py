@@ -0,0 +1,114 @@
+import os
+import sys
+
+from mpi4py_installer.runners import ShellRunner, ModuleDriver
+
+
+# Stub of Lmod's python backend: `$LMOD_CMD python load|unload <modules>`
+LMOD_STUB = f"""#!{sys.executable}
+import os, sys
+subcmd, modules = sys.argv[2], sys.argv[3:]
+if "bad" in modules:
+    print("Lmod has detected the following error: bad", file=sys.stderr)
+    sys.exit(1)
+loaded = [m for m in os.environ.get("LOADEDMODULES", "").split(":") if m]
+print("import os")
+for m in modules:
+    if subcmd == "load":
+        loaded.append(m)
+        print(f"os.environ['MOD_{{m.upper()}}'] = 'loaded';")
+    else:
+        loaded = [l for l in loaded if l != m]
+        print(f"del os.environ['MOD_{{m.upper()}}']")
+print(f"os.environ['LOADEDMODULES'] = {{':'.join(loaded)!r}};")
+print(f"os.environ['SEEN_A'] = {{os.environ.get('A', '')!r}};")
+"""
+
+
+def _runner(tmp_path, monkeypatch):
+    stub = tmp_path / "lmod"
+    stub.write_text(LMOD_STUB)
+    stub.chmod(0o755)
+
+    runner = ShellRunner()
+    runner.env["LMOD_CMD"] = str(stub)
+
+    # count the (bash) runs of the ShellRunner
+    runs = list()
+    run = runner.run
+    def counting_run(cmd, **opts):
+        runs.append(cmd)
+        return run(cmd, **opts)
+    monkeypatch.setattr(runner, "run", counting_run)
+
+    return runner, runs
+
+
+def test_module_lines_run_natively(tmp_path, monkeypatch):
+    runner, runs = _runner(tmp_path, monkeypatch)
+    with runner:
+        out = ModuleDriver(runner).run(
+            "module load gcc cuda\nmodule unload cuda\nmodule unload nothere"
+        )
+
+    # unloading a module whose variable is not set is not an error
+    assert out.returncode == 0
+    assert runner.env["MOD_GCC"] == "loaded"
+    assert "MOD_CUDA" not in runner.env
+    assert runs == []
+
+
+def test_mixed_script_keeps_order(tmp_path, monkeypatch):
+    runner, runs = _runner(tmp_path, monkeypatch)
+    with runner:
+        out = ModuleDriver(runner).run(
+            "export A=42\necho hello\nmodule load gcc\nexport B=$MOD_GCC"
+        )
+
+    assert out.returncode == 0
+    assert out.stdout == b"hello\n"
+    assert runner.env["SEEN_A"] == "42"
+    assert runner.env["B"] == "loaded"
+    assert runner.env["LOADEDMODULES"] == "gcc"
+    assert runs == ["export A=42\necho hello", "export B=$MOD_GCC"]
+
+
+def test_failing_line_continues_like_bash(tmp_path, monkeypatch, caplog):
+    runner, runs = _runner(tmp_path, monkeypatch)
+    with runner:
+        out = ModuleDriver(runner).run(
+            "module load bad\nexport B=1\nfalse\nmodule load gcc"
+        )
+        last = ModuleDriver(runner).run("export C=1\nmodule load bad")
+
+    # the failures don't stop the script, and the last line's status counts
+    assert out.returncode == 0
+    assert b"Lmod has detected" in out.stderr
+    assert "Module command failed" in caplog.text
+    assert runner.env["B"] == "1"
+    assert runner.env["MOD_GCC"] == "loaded"
+    assert runs == ["export B=1\nfalse", "export C=1"]
+    assert last.returncode == 1
+    assert runner.env["C"] == "1"
+
+
+def test_compound_script_uses_bash(tmp_path, monkeypatch):
+    runner, runs = _runner(tmp_path, monkeypatch)
+    script = "if false; then\n  module load gcc\nfi\nexport C=1"
+    with runner:
+        out = ModuleDriver(runner).run(script)
+
+    assert out.returncode == 0
+    assert "MOD_GCC" not in runner.env
+    assert runner.env["C"] == "1"
+    assert runs == [script]
+
+
+def test_no_module_system_uses_bash(monkeypatch):
+    with ShellRunner() as runner:
+        runner.env.pop("LMOD_CMD", None)
+        runner.env.pop("MODULES_CMD", None)
+        out = ModuleDriver(runner).run("export D=1")
+
+    assert out.returncode == 0
+    assert runner.env["D"] == "1"
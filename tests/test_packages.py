@@ -0,0 +1,113 @@
+from mpi4py_installer            import MPIConfig, PackageRecipe, packages
+from mpi4py_installer.sites      import ConfigStore
+from mpi4py_installer.wheelhouse import Wheelhouse
+
+import json
+import threading
+import time
+
+import pytest
+
+
+RECIPES = {
+    "h5py":       PackageRecipe(env={"CC": "{MPICC}", "HDF5_MPI": "ON"}),
+    "petsc4py":   PackageRecipe(),
+    "mpi4py-fft": PackageRecipe(depends=["mpi4py", "h5py"]),
+    "slepc4py":   PackageRecipe(depends=["petsc4py"]),
+}
+
+
+def test_build_order():
+    assert packages.build_order(RECIPES) == [
+        ["h5py", "petsc4py"], ["mpi4py-fft", "slepc4py"]
+    ]
+
+    with pytest.raises(RuntimeError, match="not part of the package set"):
+        packages.build_order({"a": PackageRecipe(depends=["b"])})
+    with pytest.raises(RuntimeError, match="cycle"):
+        packages.build_order({
+            "a": PackageRecipe(depends=["b"]), "b": PackageRecipe(depends=["a"])
+        })
+
+
+def test_fingerprints():
+    fps = packages.package_fingerprints(RECIPES, "base")
+    assert packages.package_fingerprints(RECIPES, "other")["h5py"] \
+        != fps["h5py"]
+
+    # changing a package changes the packages that depend on it
+    changed = dict(RECIPES, h5py=PackageRecipe(env={"HDF5_MPI": "OFF"}))
+    new = packages.package_fingerprints(changed, "base")
+    assert new["h5py"] != fps["h5py"]
+    assert new["mpi4py-fft"] != fps["mpi4py-fft"]
+    assert new["petsc4py"] == fps["petsc4py"]
+
+    assert packages.set_fingerprint("base", dict()) == "base"
+    assert packages.set_fingerprint("base", fps) \
+        != packages.set_fingerprint("base", new)
+
+
+def test_build_env():
+    config = MPIConfig(MPICC="cc -shared", CFLAGS="-O2")
+    recipe = PackageRecipe(env={"CC": "{MPICC}", "FLAGS": "{CFLAGS} -g"})
+    assert recipe.build_env(config) == {"CC": "cc -shared", "FLAGS": "-O2 -g"}
+
+    # the package set is not part of mpi4py's fingerprint
+    assert MPIConfig(packages=["h5py"]).fingerprint == MPIConfig().fingerprint
+
+
+def test_build_packages(tmp_path, monkeypatch):
+    built, staged = list(), list()
+    # the independent packages of a generation are built at the same time
+    barrier = threading.Barrier(2, timeout=10)
+
+    def build(name, recipe, config, wheel_dir, env, python, path):
+        if name in ("h5py", "petsc4py"):
+            barrier.wait()
+        assert all(d in staged for d in (recipe.depends or []) if d != "mpi4py")
+        time.sleep(0.01)
+        built.append(name)
+        wheel = tmp_path / f"{name}-1.0-py3-none-any.whl"
+        wheel.write_text(name)
+        return wheel
+
+    monkeypatch.setattr(packages, "pip_build_package", build)
+    monkeypatch.setattr(
+        packages, "install_target",
+        lambda wheel, target, python: staged.append(wheel.read_text())
+    )
+
+    cache = Wheelhouse(tmp_path / "cache")
+    fps = packages.package_fingerprints(RECIPES, "base")
+    wheels = packages.build_packages(
+        RECIPES, MPIConfig(), fps, dict(), tmp_path / "staging", cache,
+        workers=2
+    )
+    assert sorted(built) == sorted(RECIPES)
+    assert set(staged) == set(RECIPES)
+    assert wheels["h5py"] == cache.lookup(fps["h5py"])
+
+    # the second time, everything comes from the cache
+    built.clear()
+    staged.clear()
+    barrier.abort()
+    packages.build_packages(
+        RECIPES, MPIConfig(), fps, dict(), tmp_path / "staging", cache,
+        workers=2
+    )
+    assert built == []
+    assert set(staged) == set(RECIPES)
+
+
+def test_site_recipes(tmp_path):
+    (tmp_path / "mysite.py").write_text("")
+    (tmp_path / "mysite.json").write_text(json.dumps({
+        "environment": {"host": "MYSITE", "blacklist": []},
+        "systems": {"default": {"gcc": {"packages": ["h5py"]}}},
+        "packages": {"default": {"h5py": {"env": {"HDF5_MPI": "ON"}}}}
+    }))
+
+    config = ConfigStore(str(tmp_path / "mysite.py"))
+    assert config.packages("default") == ["h5py"]
+    assert config.pkgs["default"]["h5py"].env == {"HDF5_MPI": "ON"}
+    assert config.sys["default"]["gcc"].packages == ["h5py"]
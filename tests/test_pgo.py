@@ -0,0 +1,59 @@
+import logging
+
+from pathlib import Path
+
+from mpi4py_installer import MPIConfig, pgo
+from mpi4py_installer.pgo import pgo_profile
+
+
+def test_pgo_flags():
+    profile_dir = Path("/tmp/profile")
+
+    generate = pgo_profile("gcc", profile_dir, "generate")
+    assert generate.cflags == [
+        "-fprofile-generate=/tmp/profile -fprofile-update=atomic"
+    ]
+    assert generate.ldflags == ["-fprofile-generate=/tmp/profile"]
+
+    use = pgo_profile("clang", profile_dir, "use")
+    assert use.cflags == ["-fprofile-use=/tmp/profile/default.profdata"]
+
+
+def test_launcher_not_in_fingerprint():
+    config = MPIConfig(MPICC="mpicc")
+    srun = MPIConfig(MPICC="mpicc", launcher="srun -n {nprocs}")
+
+    # the launcher doesn't change the build
+    assert config.fingerprint == srun.fingerprint
+    pgo = config.with_profile("default+pgo-use", pgo_profile(
+        "gcc", Path("/tmp/profile"), "use"
+    ))
+    assert pgo.fingerprint != config.fingerprint
+
+
+def test_compare_builds(tmp_path, monkeypatch, caplog):
+    timings = {"pgo": {"Barrier": 80., "Send": 100.}}
+    envs = list()
+    monkeypatch.setattr(
+        pgo, "install_target", lambda wheel, target, python: Path(wheel)
+    )
+
+    def run_microbench(python, path, env):
+        envs.append(env)
+        return dict(timings[path[0]])
+    monkeypatch.setattr(pgo, "run_microbench", run_microbench)
+
+    timings["base"] = {"Barrier": 100., "Send": 100.}
+    with caplog.at_level(logging.WARNING, logger="mpi4py_installer"):
+        results = pgo.compare_builds("pgo", "base", env={"A": "1"})
+    assert results == {"pgo": timings["pgo"], "baseline": timings["base"]}
+    # both builds are measured in the given environment
+    assert envs == [{"A": "1"}] * 2
+    assert "slower" not in caplog.text
+
+    # the PGO build is slower => warn (but don't fail)
+    timings["base"] = {"Barrier": 60., "Send": 100.}
+    with caplog.at_level(logging.WARNING, logger="mpi4py_installer"):
+        results = pgo.compare_builds("pgo", "base")
+    assert results["baseline"] == timings["base"]
+    assert "slower than the non-PGO build" in caplog.text
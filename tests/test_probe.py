@@ -0,0 +1,113 @@
+import os
+import shutil
+
+from pathlib import Path
+
+import pytest
+
+from importlib.util import MAGIC_NUMBER
+
+from mpi4py_installer       import MPIConfig
+from mpi4py_installer.probe import ProbeResult, sweep, report, layouts, \
+    startup_report, steps
+
+
+def _result(host, rank, libmpi="/lib/libmpi.so", import_time=0.1,
+            init_time=0.2):
+    return ProbeResult(
+        host=host, rank=rank, libmpi=libmpi, version="MPI 1.0",
+        import_time=import_time, init_time=init_time
+    )
+
+
+def test_report_flags_mismatches_and_outliers():
+    results = [
+        _result("nid001", 0), _result("nid001", 1),
+        _result("nid002", 2, libmpi="/other/libmpi.so"),
+        _result("nid003", 3, import_time=2.0),
+    ]
+
+    summary, ok = report(results, expected="/lib/libmpi.so")
+
+    assert not ok
+    assert "nid002 rank 2: /other/libmpi.so" in summary
+    assert "nid003 rank 3: import_time=2.000s" in summary
+    assert len([l for l in summary.splitlines() if l.startswith("nid")]) == 3
+
+    # without an expected library, the majority wins
+    assert report(results[:2] + results[3:])[1]
+
+
+def test_startup_report():
+    results = {
+        layout: [
+            ProbeResult(
+                host="nid001", rank=i, libmpi="/lib/libmpi.so", version="",
+                import_time=0.1*scale, init_time=0.2, import_package=0.01,
+                startup=0.05 + 0.01*i
+            )
+            for i in range(10)
+        ]
+        for layout, scale in [("installed", 1), ("node-local-hash", 0.5)]
+    }
+
+    assert steps(results["installed"][0]) == pytest.approx({
+        "startup": 0.05, "import mpi4py": 0.01,
+        "from mpi4py import MPI": 0.09, "MPI_Init": 0.2, "total": 0.35
+    })
+
+    summary = startup_report(results)
+    assert "installed (10 ranks)" in summary
+    assert "  startup                    0.050s   0.095s   0.140s   0.140s" \
+        in summary
+    assert "  total:" in summary and "#" in summary
+    assert "  node-local-hash            0.87x" in summary
+
+
+def test_layouts(tmp_path, monkeypatch):
+    location = tmp_path / "site-packages"
+    (location / "mpi4py").mkdir(parents=True)
+    (location / "mpi4py" / "__init__.py").write_text("")
+    info = location / "mpi4py-1.0.dist-info"
+    info.mkdir()
+    (info / "METADATA").write_text("Name: mpi4py\nVersion: 1.0\n")
+    (info / "RECORD").write_text("mpi4py/__init__.py,,\n")
+    monkeypatch.setenv("MPI4PY_BUNDLE_ROOT", str(tmp_path / "local"))
+    (tmp_path / "local").mkdir()
+
+    with layouts(location) as paths:
+        assert paths["installed"] == ()
+        assert paths["node-local-hash"][0].startswith(str(tmp_path / "local"))
+
+        # pyc flags: 0 => timestamp, 1 => unchecked hash
+        for layout, flags in [("shared-timestamp", 0), ("shared-hash", 1)]:
+            pyc, = (Path(paths[layout][0]) / "mpi4py").glob("__pycache__/*")
+            header = MAGIC_NUMBER + bytes([flags, 0, 0, 0])
+            assert pyc.read_bytes()[:8] == header
+
+    # the copies are removed
+    assert sorted(p.name for p in location.iterdir()) == [
+        "mpi4py", "mpi4py-1.0.dist-info"
+    ]
+    assert not any((tmp_path / "local").iterdir())
+
+
+def test_launch_command():
+    srun = MPIConfig(launcher="srun -N {nodes} -n {nprocs}")
+    assert srun.launch_command(8, nodes=2) == ["srun", "-N", "2", "-n", "8"]
+    assert MPIConfig().launch_command(2) == ["mpiexec", "-n", "2"]
+
+
+@pytest.mark.skipif(shutil.which("mpiexec") is None, reason="needs mpiexec")
+def test_local_sweep():
+    pytest.importorskip("mpi4py")
+
+    env = dict(os.environ)
+    env.update({
+        "OMPI_ALLOW_RUN_AS_ROOT": "1", "OMPI_ALLOW_RUN_AS_ROOT_CONFIRM": "1",
+        "OMPI_MCA_rmaps_base_oversubscribe": "1"
+    })
+    results = sweep(MPIConfig(), nodes=2, env=env)
+
+    assert sorted(r.rank for r in results) == [0, 1]
+    assert report(results)[1]
@@ -0,0 +1,41 @@
+from mpi4py_installer import MPIConfig, BuildProfile
+
+import pytest
+
+
+def test_profile_flags():
+    profile = BuildProfile(
+        opt="3", march="znver3", lto=True, no_semantic_interposition=True,
+        as_needed=True
+    )
+
+    assert profile.cflags == [
+        "-O3", "-march=znver3", "-flto", "-fno-semantic-interposition"
+    ]
+    # LTO generates code at link time => the optimization flags are needed
+    assert profile.ldflags == profile.cflags + ["-Wl,--as-needed"]
+    assert BuildProfile().cflags == BuildProfile().ldflags == []
+
+
+def test_with_profile():
+    config = MPIConfig(MPICC="mpicc", CFLAGS="-DFOO")
+
+    fast = config.with_profile("fast", BuildProfile(opt="3", LDFLAGS="-s"))
+    assert fast.CFLAGS == "-DFOO -O3"
+    assert fast.LDFLAGS == "-s"
+    assert fast.profile == "fast"
+
+    default = config.with_profile("default", BuildProfile())
+    assert default.CFLAGS == "-DFOO"
+    assert default.LDFLAGS is None
+
+    # profiles are part of the build fingerprint
+    fingerprints = {config.fingerprint, fast.fingerprint, default.fingerprint}
+    assert len(fingerprints) == 3
+
+
+def test_native_march():
+    # a -march=native wheel would be reused on other CPUs
+    with pytest.raises(RuntimeError, match="native"):
+        BuildProfile(march="native")
+    assert BuildProfile(mtune="native").cflags == ["-mtune=native"]
@@ -0,0 +1,59 @@
+from mpi4py_installer.runners import run_with_rusage, ShellRunner
+
+import subprocess
+import sys
+import threading
+
+import pytest
+
+
+# Burns CPU, and holds on to ~64MiB
+CPU_BOUND = """
+data = bytearray(64 << 20)
+total = 0
+for i in range(3_000_000):
+    total += i * i
+print(total)
+"""
+
+
+def test_rusage_of_cpu_bound_child():
+    result = run_with_rusage(
+        [sys.executable, "-c", CPU_BOUND], capture_output=True, check=True
+    )
+
+    assert result.stdout.strip()
+    assert result.rusage is not None
+    assert result.rusage.utime > 0
+    assert result.rusage.maxrss > 64 << 10  # KiB
+
+
+def test_returncode_input_and_timeout():
+    result = run_with_rusage(
+        [sys.executable, "-c", "import sys; sys.exit(len(sys.stdin.read()))"],
+        input=b"four"
+    )
+    assert result.returncode == 4
+    with pytest.raises(subprocess.CalledProcessError):
+        run_with_rusage(["false"], check=True)
+    with pytest.raises(subprocess.TimeoutExpired):
+        run_with_rusage(["sleep", "10"], timeout=0.2)
+
+
+def test_shell_runner_usage():
+    with ShellRunner() as runner:
+        runner.run(f"{sys.executable} -c 'sum(range(10**6))'")
+        runner.run("true")
+    assert runner.usage.runs == 2
+    assert runner.usage.cpu > 0
+
+
+def test_shell_runner_timeout():
+    with ShellRunner() as runner:
+        threads = threading.active_count()
+        with pytest.raises(subprocess.TimeoutExpired):
+            runner.run("sleep 5", timeout=0.2)
+        # the env snapshot reader has stopped, and the runner still works
+        assert threading.active_count() == threads
+        runner.run("export A=1")
+    assert runner.env["A"] == "1"
@@ -0,0 +1,89 @@
+from mpi4py_installer.swap import swap_in, rollback, installed_entries, \
+    ROLLBACK_DIR
+
+
+def _fake_install(root, version, name="mpi4py"):
+    (root / name).mkdir(parents=True)
+    (root / name / "__init__.py").write_text(f"version = '{version}'\n")
+    info = root / f"{name}-{version}.dist-info"
+    info.mkdir()
+    (info / "METADATA").write_text(f"Name: {name}\nVersion: {version}\n")
+    (info / "RECORD").write_text("\n".join([
+        f"{name}/__init__.py,,",
+        f"{name}-{version}.dist-info/METADATA,,",
+        f"{name}-{version}.dist-info/RECORD,,",
+    ]))
+
+
+def test_swap_and_rollback(tmp_path):
+    location = tmp_path / "site-packages"
+    staging = location / ".mpi4py-staging"
+    _fake_install(location, "1.0")
+    _fake_install(staging, "2.0")
+    (location / "other.py").write_text("")
+
+    backup = swap_in(staging, location)
+
+    assert backup == location / ROLLBACK_DIR
+    assert not staging.exists()
+    assert installed_entries(location) == ["mpi4py", "mpi4py-2.0.dist-info"]
+    assert "2.0" in (location / "mpi4py" / "__init__.py").read_text()
+    assert (backup / "mpi4py-1.0.dist-info").is_dir()
+    assert (location / "other.py").exists()
+
+    assert rollback(location)
+    assert installed_entries(location) == ["mpi4py", "mpi4py-1.0.dist-info"]
+    assert "1.0" in (location / "mpi4py" / "__init__.py").read_text()
+
+    # rolling back twice restores the new install
+    assert rollback(location)
+    assert installed_entries(location) == ["mpi4py", "mpi4py-2.0.dist-info"]
+
+
+def test_swap_into_empty_location(tmp_path):
+    location = tmp_path / "site-packages"
+    location.mkdir()
+    staging = location / ".mpi4py-staging"
+    _fake_install(staging, "2.0")
+
+    swap_in(staging, location)
+
+    assert installed_entries(location) == ["mpi4py", "mpi4py-2.0.dist-info"]
+    assert rollback(location)
+    assert installed_entries(location) == []
+
+
+def test_swap_package_set(tmp_path):
+    location = tmp_path / "site-packages"
+    staging = location / ".mpi4py-staging"
+    _fake_install(location, "1.0")
+    _fake_install(location, "3.0", name="h5py")
+    _fake_install(staging, "2.0")
+    _fake_install(staging, "3.1", name="h5py")
+
+    swap_in(staging, location, names=("mpi4py", "h5py"))
+    assert installed_entries(location, "h5py") == ["h5py", "h5py-3.1.dist-info"]
+
+    # the swapped packages are rolled back too
+    assert rollback(location)
+    assert installed_entries(location) == ["mpi4py", "mpi4py-1.0.dist-info"]
+    assert installed_entries(location, "h5py") == ["h5py", "h5py-3.0.dist-info"]
+    assert rollback(location)
+    assert installed_entries(location, "h5py") == ["h5py", "h5py-3.1.dist-info"]
+
+
+def test_rollback_removes_new_packages(tmp_path):
+    location = tmp_path / "site-packages"
+    staging = location / ".mpi4py-staging"
+    _fake_install(location, "1.0")
+    _fake_install(staging, "2.0")
+    _fake_install(staging, "3.1", name="h5py")
+
+    swap_in(staging, location, names=("mpi4py", "h5py"))
+    assert rollback(location)
+    assert installed_entries(location, "h5py") == []
+    assert not (location / ".names.json").exists()
+
+
+def test_rollback_without_backup(tmp_path):
+    assert not rollback(tmp_path)
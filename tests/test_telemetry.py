@@ -0,0 +1,45 @@
+from mpi4py_installer import telemetry
+
+
+def _record(ok=True, phase="sanity", build=None, libmpi="/pe/1/libmpi.so",
+            variant="gcc"):
+    timings = {"init": 1.0}
+    if build is not None:
+        timings["build"] = build
+    timings[phase] = 1.0
+    return {
+        "site": "local", "system": "default", "variant": variant,
+        "profile": None, "ok": ok, "phase": phase, "libmpi": libmpi,
+        "cache_hit": build is None, "timings": timings,
+        "total": sum(timings.values())
+    }
+
+
+def test_rotation(tmp_path):
+    log = tmp_path / "telemetry.jsonl"
+    for i in range(20):
+        telemetry.append({"i": i}, path=log, max_bytes=50, keep=2)
+
+    # the oldest records were rotated out
+    records = [r["i"] for r in telemetry.read(log, keep=2)]
+    assert records == list(range(records[0], 20))
+    assert 0 < records[0]
+    assert not (tmp_path / "telemetry.jsonl.3").exists()
+
+
+def test_stats_and_eta(tmp_path):
+    log = tmp_path / "telemetry.jsonl"
+    for build in (100, 120, 110):
+        telemetry.append(_record(build=build), path=log)
+    telemetry.append(_record(build=300, libmpi="/pe/2/libmpi.so"), path=log)
+    telemetry.append(_record(), path=log)
+    telemetry.append(_record(ok=False, phase="build"), path=log)
+
+    assert telemetry.eta("local", "default", "gcc", None, path=log) == (110, 4)
+    assert telemetry.eta("local", "default", "clang", None, path=log) is None
+
+    summary = telemetry.stats(log)
+    assert "       6      1     2" in summary
+    assert "       1    20%  build" in summary
+    assert "       3   110.0s   120.0s  default/gcc: /pe/1/libmpi.so" in summary
+    assert "       1   300.0s   300.0s  default/gcc: /pe/2/libmpi.so" in summary
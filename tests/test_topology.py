@@ -0,0 +1,97 @@
+from mpi4py_installer       import topology
+from mpi4py_installer.sites import ConfigStore, default_auto_variant
+
+import json
+
+import pytest
+
+
+def fake_node(root, flags=("sse2", "avx2"), numa=1, pci=(), dev=()):
+    (root / "proc").mkdir(parents=True)
+    (root / "proc" / "cpuinfo").write_text(
+        "processor\t: 0\nvendor_id\t: AuthenticAMD\n"
+        f"flags\t\t: fpu {' '.join(flags)}\n\n"
+    )
+    node_dir = root / "sys" / "devices" / "system" / "node"
+    for n in range(numa):
+        (node_dir / f"node{n}").mkdir(parents=True)
+    (node_dir / "possible").write_text(f"0-{numa - 1}\n")
+    for i, (vendor, device_class) in enumerate(pci):
+        device = root / "sys" / "bus" / "pci" / "devices" / f"0000:{i:02x}:00.0"
+        device.mkdir(parents=True)
+        (device / "vendor").write_text(vendor + "\n")
+        (device / "class").write_text(device_class + "\n")
+    (root / "dev").mkdir()
+    for name in dev:
+        (root / "dev" / name).write_text("")
+    return root
+
+
+def test_detect(tmp_path):
+    # the BMC's VGA controller is not an accelerator
+    root = fake_node(
+        tmp_path, flags=("avx512f",), numa=4,
+        pci=[("0x1a03", "0x030000"), ("0x10de", "0x030200")]
+    )
+    node = topology.detect(root)
+    assert node == topology.Topology(
+        cpu_flags=["avx512f", "fpu"], numa_nodes=4, gpus=["nvidia"]
+    )
+    assert {"avx512f", "numa:4", "multi-numa", "gpu", "gpu:nvidia"} \
+        <= node.tags
+    assert "cpu-only" not in node.tags
+
+    cpu_node = topology.detect(fake_node(tmp_path / "cpu", dev=["kfd0"]))
+    assert cpu_node.gpus == []
+    assert {"cpu-only", "numa:1"} <= cpu_node.tags
+    assert topology.detect(fake_node(tmp_path / "amd", dev=["kfd"])).gpus \
+        == ["amd"]
+
+
+def test_select_variant(tmp_path):
+    capabilities = {
+        "cpu": [], "gpu": ["gpu"], "gpu:nvidia": ["gpu:nvidia"],
+        "avx512": ["avx512f", "multi-numa"]
+    }
+    gpu_node = topology.detect(fake_node(tmp_path / "gpu", dev=["nvidia0"]))
+    cpu_node = topology.detect(
+        fake_node(tmp_path / "cpu", flags=("avx512f",), numa=2)
+    )
+
+    # the most specific variant wins, ties go to the default
+    assert topology.select_variant(capabilities, gpu_node) == "gpu"
+    assert topology.select_variant(capabilities, gpu_node, "gpu:nvidia") \
+        == "gpu:nvidia"
+    assert topology.select_variant(capabilities, cpu_node) == "avx512"
+    assert topology.select_variant({"gpu": ["gpu"]}, cpu_node) is None
+
+
+def test_auto_variant(tmp_path, monkeypatch):
+    (tmp_path / "mysite.py").write_text("")
+    (tmp_path / "mysite.json").write_text(json.dumps({
+        "environment": {"host": "MYSITE", "blacklist": []},
+        "systems": {"default": {"cpu": {}, "gpu": {}, "tiny": {}}},
+        "capabilities": {"default": {"gpu": ["gpu"], "tiny": ["numa:64"]}}
+    }))
+    config = ConfigStore(str(tmp_path / "mysite.py"))
+    assert config.capabilities("default") == {
+        "gpu": ["gpu"], "tiny": ["numa:64"]
+    }
+
+    monkeypatch.setenv(
+        "MPI4PY_INSTALLER_SYSFS_ROOT",
+        str(fake_node(tmp_path / "node", dev=["nvidia0"]))
+    )
+    # topology detection is opt-in
+    monkeypatch.delenv("MPI4PY_INSTALLER_VARIANT_POLICY", raising=False)
+    assert default_auto_variant(config, "default") == "cpu"
+
+    monkeypatch.setenv("MPI4PY_INSTALLER_VARIANT_POLICY", "topology")
+    assert default_auto_variant(config, "default") == "gpu"
+
+    monkeypatch.setenv("MPI4PY_INSTALLER_VARIANT_POLICY", "static")
+    assert default_auto_variant(config, "default") == "cpu"
+
+    monkeypatch.setenv("MPI4PY_INSTALLER_VARIANT_POLICY", "fastest")
+    with pytest.raises(RuntimeError, match="Unknown variant policy"):
+        default_auto_variant(config, "default")
@@ -0,0 +1,102 @@
+from mpi4py_installer.tracing import Tracer, NULL_SPAN
+
+import asyncio
+import contextvars
+import json
+import threading
+
+
+def by_name(tracer):
+    return {s.name: s for s in tracer.spans}
+
+
+def test_disabled():
+    tracer = Tracer()
+    with tracer.span("install") as span:
+        span.set(ignored=True)
+    assert span is NULL_SPAN
+    assert tracer.spans == []
+
+
+def test_parents_across_threads_and_tasks():
+    tracer = Tracer()
+    tracer.enable()
+    barrier = threading.Barrier(2)
+
+    def worker(name):
+        with tracer.span(name):
+            barrier.wait()  # both threads are inside their span
+            with tracer.span(f"{name}.child"):
+                pass
+
+    async def task(name):
+        with tracer.span(name):
+            await asyncio.sleep(0.01)  # interleave the tasks
+            with tracer.span(f"{name}.child"):
+                await asyncio.sleep(0)
+
+    async def tasks():
+        with tracer.span("async"):
+            await asyncio.gather(task("task1"), task("task2"))
+
+    with tracer.span("install"):
+        # threads start with an empty context, unless it is copied
+        plain = threading.Thread(target=worker, args=("thread1",))
+        context = contextvars.copy_context()
+        copied = threading.Thread(
+            target=context.run, args=(worker, "thread2")
+        )
+        for thread in (plain, copied):
+            thread.start()
+        for thread in (plain, copied):
+            thread.join()
+        asyncio.run(tasks())
+
+    spans = by_name(tracer)
+    parent = {name: s.parent for name, s in spans.items()}
+    ids = {name: s.id for name, s in spans.items()}
+
+    assert parent["install"] is None
+    assert parent["thread1"] is None
+    assert parent["thread2"] == ids["install"]
+    # each thread's and task's children stay with their own parent
+    for name in ("thread1", "thread2", "task1", "task2"):
+        assert parent[f"{name}.child"] == ids[name]
+        assert spans[f"{name}.child"].depth == spans[name].depth + 1
+    assert parent["task1"] == parent["task2"] == ids["async"]
+    assert parent["async"] == ids["install"]
+    assert spans["thread1"].thread != spans["thread2"].thread
+
+
+def test_chrome_trace_round_trip(tmp_path):
+    tracer = Tracer()
+    tracer.enable()
+    with tracer.span("install", site="local") as outer:
+        with tracer.span("build", path=tmp_path):
+            pass
+        outer.set(ok=True)
+    try:
+        with tracer.span("swap"):
+            raise OSError("busy")
+    except OSError:
+        pass
+
+    tracer.write(tmp_path / "trace.json")
+    trace = json.loads((tmp_path / "trace.json").read_text())
+
+    events = {e["name"]: e for e in trace["traceEvents"]}
+    assert set(events) == {"install", "build", "swap"}
+    assert all(e["ph"] == "X" and e["dur"] >= 0 for e in events.values())
+    assert events["install"]["args"] == {"site": "local", "ok": True}
+    # non-json attributes are written as strings
+    assert events["build"]["args"] == {"path": str(tmp_path)}
+    assert events["swap"]["args"] == {"error": "OSError"}
+    # the child lies within its parent
+    install, build = events["install"], events["build"]
+    assert install["ts"] <= build["ts"]
+    assert build["ts"] + build["dur"] <= install["ts"] + install["dur"]
+
+    tracer.write(tmp_path / "timeline.json", format="json")
+    spans = json.loads((tmp_path / "timeline.json").read_text())["spans"]
+    assert [s["name"] for s in spans] == ["install", "build", "swap"]
+    assert spans[1]["parent"] == spans[0]["id"]
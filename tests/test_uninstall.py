@@ -0,0 +1,43 @@
+import sys
+
+from mpi4py_installer.uninstall import uninstall_distribution
+
+
+def _fake_dist(root, record=True):
+    pkg = root / "fakepkg"
+    (pkg / "sub" / "__pycache__").mkdir(parents=True)
+    (pkg / "__init__.py").write_text("")
+    (pkg / "sub" / "mod.py").write_text("")
+    (pkg / "sub" / "__pycache__" / "mod.cpython-311.pyc").write_bytes(b"")
+    info = root / "fakepkg-1.0.dist-info"
+    info.mkdir()
+    (info / "METADATA").write_text("Name: fakepkg\nVersion: 1.0\n")
+    if record:
+        (info / "RECORD").write_text("\n".join([
+            "fakepkg/__init__.py,,",
+            "fakepkg/sub/mod.py,,",
+            "fakepkg-1.0.dist-info/METADATA,,",
+            "fakepkg-1.0.dist-info/RECORD,,",
+            # must not be touched: outside of the environment
+            "../../../../../../../../etc/passwd,,",
+        ]))
+
+
+def test_uninstall_from_record(tmp_path, monkeypatch):
+    _fake_dist(tmp_path)
+    (tmp_path / "other.py").write_text("")
+    monkeypatch.setattr(sys, "path", [str(tmp_path)] + sys.path)
+
+    report = uninstall_distribution("fakepkg")
+
+    assert report.files == 5
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["other.py"]
+    assert uninstall_distribution("fakepkg") is None
+
+
+def test_uninstall_without_record(tmp_path, monkeypatch):
+    _fake_dist(tmp_path, record=False)
+    monkeypatch.setattr(sys, "path", [str(tmp_path)] + sys.path)
+
+    assert uninstall_distribution("fakepkg") is None
+    assert (tmp_path / "fakepkg" / "__init__.py").exists()
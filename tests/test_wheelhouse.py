@@ -0,0 +1,68 @@
+from mpi4py_installer.wheelhouse import Wheelhouse
+
+import threading
+
+
+def make_wheel(root, content):
+    root.mkdir(parents=True, exist_ok=True)
+    wheel = root / "mpi4py-4.0-cp311-cp311-linux_x86_64.whl"
+    wheel.write_text(content)
+    return wheel
+
+
+def test_publish_and_lookup(tmp_path):
+    house = Wheelhouse(tmp_path / "house")
+    assert house.lookup("fp") is None
+
+    wheel = make_wheel(tmp_path / "build", "v1")
+    published = house.publish("fp", wheel, meta={"python": "python3"})
+
+    assert house.lookup("fp") == published
+    assert published.read_text() == "v1"
+    assert house.entry("fp")["meta"] == {"python": "python3"}
+    assert oct(published.stat().st_mode & 0o777) == "0o644"
+    # no temporary files are left behind
+    assert [p.name for p in published.parent.iterdir()] == [published.name]
+
+    # publishing again replaces the wheel
+    house.publish("fp", make_wheel(tmp_path / "build", "v2"))
+    assert house.lookup("fp").read_text() == "v2"
+
+
+def test_concurrent_publish(tmp_path):
+    house = Wheelhouse(tmp_path / "house")
+    wheels = [
+        make_wheel(tmp_path / f"build{i}", "x" * 100_000) for i in range(8)
+    ]
+    barrier = threading.Barrier(len(wheels))
+    errors = list()
+
+    def publish(wheel):
+        barrier.wait()
+        try:
+            house.publish("fp", wheel)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=publish, args=(w,)) for w in wheels]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert house.lookup("fp").read_text() == "x" * 100_000
+    assert not list((tmp_path / "house").rglob("*.tmp"))
+
+
+def test_stale_entry(tmp_path):
+    house = Wheelhouse(tmp_path / "house")
+    published = house.publish("fp", make_wheel(tmp_path / "build", "v1"))
+
+    # a partially cleaned cache => the wheel is rebuilt
+    published.unlink()
+    assert house.entry("fp") is not None
+    assert house.lookup("fp") is None
+
+    (tmp_path / "house" / "index" / "bad.json").write_text("{")
+    assert house.lookup("bad") is None